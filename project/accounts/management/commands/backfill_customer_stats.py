@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import UserProfile
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает статистику заказов в профилях (число заказов, сумма завершенных, '
+        'дата последнего). Нужен после загрузки заказов в обход сигналов'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Профилей в одном UPDATE')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        user_ids = UserProfile.objects.order_by('user_id').values_list('user_id', flat=True)
+        batch = []
+        updated = 0
+        for user_id in user_ids.iterator(chunk_size=options['batch_size']):
+            batch.append(user_id)
+            if len(batch) >= options['batch_size']:
+                UserProfile.recount_order_stats(batch)
+                updated += len(batch)
+                batch = []
+        if batch:
+            UserProfile.recount_order_stats(batch)
+            updated += len(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено профилей: {updated} за {time.perf_counter() - started:.1f} с'
+        ))
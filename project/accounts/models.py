@@ -1,5 +1,9 @@
+from decimal import Decimal
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import Case, Count, F, Max, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.contrib.auth.models import BaseUserManager
@@ -67,6 +71,13 @@ class UserProfile(models.Model):
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True, verbose_name='Аватар')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Денормализованная статистика заказов, обновляется сигналами Order (см. ниже)
+    orders_count = models.PositiveIntegerField(default=0, editable=False, verbose_name='Заказов')
+    total_spent = models.DecimalField(max_digits=12, decimal_places=2, default=0, editable=False,
+                                      verbose_name='Сумма завершенных заказов')
+    last_order_at = models.DateTimeField(null=True, blank=True, editable=False, verbose_name='Последний заказ')
+
+    ORDER_STATS_FIELDS = ('orders_count', 'total_spent', 'last_order_at')
 
     class Meta:
         verbose_name = 'Профиль пользователя'
@@ -75,14 +86,35 @@ class UserProfile(models.Model):
     def __str__(self):
         return f'Профиль {self.user.email}'
 
+    def save(self, *args, **kwargs):
+        # Статистику меняют только сигналы заказов через F(): обычное сохранение
+        # профиля (форма, сохранение пользователя) не перезаписывает ее устаревшими значениями
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.ORDER_STATS_FIELDS
+            ]
+        super().save(*args, **kwargs)
+
     def get_total_orders(self):
-        return self.user.orders.count()
+        return self.orders_count
 
     def get_total_spent(self):
-        from django.db.models import Sum
-        return self.user.orders.filter(status='completed').aggregate(
-            total=Sum('total_amount')
-        )['total'] or 0
+        return self.total_spent
+
+    @classmethod
+    def recount_order_stats(cls, user_ids):
+        """Пересчитывает статистику заказов пользователей одним UPDATE с подзапросами"""
+        orders = Order.objects.filter(user=OuterRef('user_id')).order_by().values('user')
+        cls.objects.filter(user_id__in=user_ids).update(
+            orders_count=Coalesce(Subquery(orders.annotate(total=Count('pk')).values('total')), Value(0)),
+            total_spent=Coalesce(
+                Subquery(orders.filter(status='completed').annotate(total=Sum('total_amount')).values('total')),
+                Value(Decimal(0)),
+                output_field=models.DecimalField(max_digits=12, decimal_places=2),
+            ),
+            last_order_at=Subquery(orders.annotate(last=Max('created_at')).values('last')),
+        )
 
 
 class Order(models.Model):
@@ -106,10 +138,29 @@ class Order(models.Model):
         verbose_name = 'Заказ'
         verbose_name_plural = 'Заказы'
         ordering = ['-created_at']
+        indexes = [
+            # Страница заказов в профиле
+            models.Index(fields=['user', '-created_at']),
+        ]
 
     def __str__(self):
         return f'Заказ #{self.id} - {self.user.email}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы менять статистику профиля только на разницу
+        instance._loaded_state = {
+            name: value for name, value in zip(field_names, values)
+            if name in ('status', 'total_amount')
+        }
+        return instance
+
+    @property
+    def spent_amount(self):
+        """Вклад заказа в сумму покупок пользователя"""
+        return self.total_amount if self.status == 'completed' else 0
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey('Order', on_delete=models.CASCADE, related_name='items')
@@ -129,7 +180,7 @@ class OrderItem(models.Model):
 
 
 # Сигналы для автоматического создания профиля
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 
 
@@ -142,4 +193,38 @@ def create_user_profile(sender, instance, created, **kwargs):
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def save_user_profile(sender, instance, **kwargs):
     if hasattr(instance, 'profile'):
-        instance.profile.save()
\ No newline at end of file
+        instance.profile.save()
+
+
+@receiver(post_save, sender=Order)
+def update_profile_stats_on_order_save(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_state', {})
+    instance._loaded_state = {'status': instance.status, 'total_amount': instance.total_amount}
+    if not created and len(loaded) < 2:
+        # Прежние значения неизвестны (объект не загружался из базы целиком) - пересчитываем
+        UserProfile.recount_order_stats([instance.user_id])
+        return
+
+    spent_before = 0
+    if not created and loaded['status'] == 'completed':
+        spent_before = loaded['total_amount']
+    spent_delta = instance.spent_amount - spent_before
+
+    changes = {}
+    if created:
+        changes['orders_count'] = F('orders_count') + 1
+        changes['last_order_at'] = Case(
+            When(Q(last_order_at__isnull=True) | Q(last_order_at__lt=instance.created_at),
+                 then=Value(instance.created_at)),
+            default=F('last_order_at'),
+        )
+    if spent_delta:
+        changes['total_spent'] = F('total_spent') + spent_delta
+    if changes:
+        # Приращения через F() в транзакции сохранения заказа: параллельные заказы не теряют обновления
+        UserProfile.objects.filter(user_id=instance.user_id).update(**changes)
+
+
+@receiver(post_delete, sender=Order)
+def update_profile_stats_on_order_delete(sender, instance, **kwargs):
+    UserProfile.recount_order_stats([instance.user_id])
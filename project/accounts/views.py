@@ -1,8 +1,8 @@
 from django.views.generic import TemplateView
-from django.db.models import Sum
 from .models import UserProfile, Order
 from .forms import UserProfileForm
 from shop.models import Cart
+from shop.cart import get_cart_summary
 from django.shortcuts import render, redirect
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
@@ -11,6 +11,7 @@ from django.urls import reverse_lazy
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.core.paginator import Paginator
 from .forms import CustomUserCreationForm, CustomAuthenticationForm
 
 
@@ -92,21 +93,33 @@ def logout_view(request):
 @method_decorator(login_required, name='dispatch')
 class ProfileView(TemplateView):
     template_name = 'accounts/profile.html'
+    orders_per_page = 10
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.request.user
 
-        context['profile'] = user.profile
-        context['orders'] = Order.objects.filter(user=user).order_by('-created_at')[:10]
-        context['cart_items'] = Cart.objects.filter(author=user)
-        context['cart_total'] = Cart.objects.filter(author=user).aggregate(
-            total=Sum('product__price')
-        )['total'] or 0
-        context['active_tab'] = self.request.GET.get('tab', 'profile')
+        # Статистика заказов хранится в строке профиля, отдельные COUNT/SUM не нужны
+        profile = user.profile
+        active_tab = self.request.GET.get('tab', 'profile')
+        context['profile'] = profile
+        context['active_tab'] = active_tab
+
+        if active_tab == 'orders':
+            context['orders'] = self.get_orders_page(user, profile)
+        elif active_tab == 'cart':
+            context['cart_items'] = Cart.objects.filter(author=user).select_related('product')
+            context['cart_total'] = get_cart_summary(user)['total']
 
         return context
 
+    def get_orders_page(self, user, profile):
+        orders = Order.objects.filter(user=user).order_by('-created_at', '-pk').prefetch_related('items__product')
+        paginator = Paginator(orders, self.orders_per_page)
+        # Число заказов уже известно из профиля: COUNT(*) для пагинатора не выполняется
+        paginator.count = profile.orders_count
+        return paginator.get_page(self.request.GET.get('page'))
+
 
 @login_required
 def update_profile(request):
@@ -20,6 +20,74 @@ BASE_DIR = Path(__file__).resolve().parent.parent
 
 CART_SESSION_ID = 'cart'
 
+# Как часто (в секундах) буфер просмотров товаров сбрасывается в базу фоновым потоком процесса
+# (views согласован в конечном счете: при аварийном завершении теряется не больше интервала)
+PRODUCT_VIEWS_FLUSH_INTERVAL = 60
+
+# Время жизни кэша категорий бокового меню (инвалидируется явно при изменениях)
+SIDEBAR_CACHE_TIMEOUT = 60 * 5
+
+# Начиная с этой страницы каталог листается курсорами вместо OFFSET
+KEYSET_PAGINATION_THRESHOLD = 5
+# Время жизни закэшированного COUNT(*) для пагинации
+PAGINATION_COUNT_CACHE_TIMEOUT = 60
+
+# Фасеты каталога: время жизни кэша и границы ценовых диапазонов
+FACETS_CACHE_TIMEOUT = 60 * 5
+PRICE_FACET_BUCKETS = (0, 1000, 5000, 20000, 50000, 100000)
+
+# Время жизни кэша сводки корзины (сбрасывается при каждом изменении корзины)
+CART_SUMMARY_CACHE_TIMEOUT = 60 * 15
+# Сколько секунд позиция корзины держит резерв остатка (снимает команда expire_stock_holds)
+STOCK_HOLD_TTL = 60 * 15
+
+# Повторы транзакции при конфликте блокировок базы (shop/db_retry.py) и начальная задержка, с
+DB_LOCK_RETRIES = 10
+DB_LOCK_RETRY_DELAY = 0.01
+
+# Уменьшенные копии изображений товаров: имя размера -> (ширина, высота, обрезать)
+PRODUCT_THUMBNAIL_SIZES = {
+    'gallery': (160, 160, True),
+    'card': (400, 300, True),
+    'detail': (800, 800, False),
+}
+THUMBNAIL_QUALITY = 80
+# Число фоновых потоков, создающих копии
+THUMBNAIL_WORKERS = 2
+
+# Кэш страниц каталога для гостей: мягкий срок годности и сколько еще
+# можно отдавать устаревшую копию, пока ее пересчитывает один запрос
+PAGE_CACHE_TIMEOUT = 60
+PAGE_CACHE_STALE_TIMEOUT = 60 * 5
+# Кэш фрагментов карточек товаров (ключ включает свободный остаток, сбрасывается сменой поколения каталога)
+PRODUCT_CARD_CACHE_TIMEOUT = 60 * 10
+
+# Сколько связанных товаров показывать на странице товара
+RELATED_PRODUCTS_LIMIT = 4
+# Сколько похожих по описанию товаров хранить для каждого (команда rebuild_similar_products)
+SIMILAR_PRODUCTS_LIMIT = 10
+
+# Популярность сейчас (команда update_trending): период полураспада и веса событий
+TRENDING_HALF_LIFE_HOURS = 72
+TRENDING_VIEW_WEIGHT = 1.0
+TRENDING_ORDER_WEIGHT = 20.0
+
+# Профилирование SQL (shop.middleware): доля запросов от 0 до 1 и сколько
+# повторов одного запроса допустимо до предупреждения о N+1
+SQL_PROFILING_SAMPLE_RATE = float(os.getenv('SQL_PROFILING_SAMPLE_RATE', 0))
+SQL_PROFILING_DUPLICATE_THRESHOLD = 5
+
+# JSON API каталога (shop/api.py): размер страницы по умолчанию, максимальный
+# и время жизни закэшированного списка категорий (ключ меняется с поколением каталога)
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 500
+API_CACHE_TIMEOUT = 60 * 60
+
+# Подсказки поиска (shop/suggest.py): как часто индекс в памяти может перестраиваться
+# после изменений каталога и сколько секунд браузер хранит ответ
+SUGGEST_REFRESH_INTERVAL = 30
+SUGGEST_CACHE_MAX_AGE = 60
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/4.2/howto/deployment/checklist/
 
@@ -56,11 +124,15 @@ INSTALLED_APPS = [
 SITE_ID = 1
 
 MIDDLEWARE = [
+    # Сжатие ответов: первым, чтобы сжимать окончательное тело
+    'django.middleware.gzip.GZipMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.SQLProfilingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'shop.middleware.ReplicaPinningMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'django.contrib.flatpages.middleware.FlatpageFallbackMiddleware',
@@ -80,6 +152,8 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'shop.context_processors.cart',
+                'shop.context_processors.catalog',
             ],
         },
     },
@@ -93,6 +167,28 @@ AUTHENTICATION_BACKENDS = [
 ]
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.2/topics/cache/
+
+# Redis, если задан REDIS_URL (нужен пакет redis), иначе локальный кэш процесса
+REDIS_URL = os.getenv('REDIS_URL')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+            'KEY_PREFIX': 'onlinemarket',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'onlinemarket',
+        }
+    }
+
+
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
@@ -103,6 +199,22 @@ DATABASES = {
     }
 }
 
+# Реплики только для чтения: пути к файлам SQLite через запятую в DATABASE_REPLICAS.
+# Чтения каталога уходят на них (shop.db_router), записи - в default.
+# В тестах реплики - зеркала default
+DATABASE_REPLICAS = []
+for index, replica_path in enumerate(filter(None, os.getenv('DATABASE_REPLICAS', '').split(',')), start=1):
+    DATABASES[f'replica{index}'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': replica_path.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{index}')
+
+DATABASE_ROUTERS = ['shop.db_router.CatalogReplicaRouter']
+# Сколько секунд после записи сессия читает каталог из основной базы (отставание реплик)
+REPLICA_STICKY_SECONDS = 5
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'project.settings')
 
 application = get_wsgi_application()
+
+# Индекс подсказок поиска загружается при старте воркера, а не первым запросом
+from shop.suggest import suggest_index
+
+suggest_index.warm_up()
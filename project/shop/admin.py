@@ -1,8 +1,34 @@
 from django.contrib import admin
+from django.db import transaction
 from .models import Category, Product, ProductImages
+from .cache import bump_catalog_version, invalidate_sidebar
+
+
+@admin.register(Product)
+class ProductAdmin(admin.ModelAdmin):
+    list_display = ('product_name', 'category', 'price', 'quantity', 'reserved_quantity', 'is_active')
+    list_filter = ('is_active', 'category')
+    actions = ['activate_products', 'deactivate_products']
+
+    def _set_active(self, queryset, is_active):
+        category_ids = set(queryset.values_list('category_id', flat=True))
+        updated = queryset.update(is_active=is_active)
+        # update() не вызывает сигналы, поэтому счетчики категорий и кэши каталога обновляем явно
+        Category.recount_active_products(category_ids)
+        invalidate_sidebar()
+        transaction.on_commit(bump_catalog_version)
+        return updated
+
+    @admin.action(description='Активировать выбранные товары')
+    def activate_products(self, request, queryset):
+        updated = self._set_active(queryset, True)
+        self.message_user(request, f'Активировано товаров: {updated}')
+
+    @admin.action(description='Деактивировать выбранные товары')
+    def deactivate_products(self, request, queryset):
+        updated = self._set_active(queryset, False)
+        self.message_user(request, f'Деактивировано товаров: {updated}')
 
 
 admin.site.register(Category)
-admin.site.register(Product)
 admin.site.register(ProductImages)
-
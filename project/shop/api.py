@@ -0,0 +1,219 @@
+# shop/api.py
+"""
+JSON API каталога только для чтения, версия 1 (префикс api/v1/).
+
+Товары сериализуются прямо из строк .values(): объекты моделей не создаются,
+а в SELECT попадают только колонки запрошенных полей (?fields=id,name,price).
+Списки листаются курсорами (?cursor=...) с теми же фильтрами и сортировками
+(sort_by), что у страниц каталога. Список категорий со статистикой
+считается один раз на поколение каталога и хранится в кэше уже в виде JSON.
+"""
+import json
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Max, Min
+from django.http import HttpResponse, JsonResponse
+from django.urls import reverse
+from django.views.decorators.http import require_GET
+
+from .cache import get_catalog_version
+from .filters import ProductFilterSet
+from .models import Category, Product
+from .pagination import KEYSET_ORDERINGS, InvalidCursor, KeysetPaginator
+
+SLUG_PLACEHOLDER = '__slug__'
+
+
+def _media_url(name):
+    return default_storage.url(name) if name else None
+
+
+def _old_price(row):
+    discount = row['discount_percent']
+    return round(row['price'] * 100 / (100 - discount)) if discount else None
+
+
+@lru_cache(maxsize=None)
+def _url_template(view_name, kwarg):
+    return reverse(view_name, kwargs={kwarg: SLUG_PLACEHOLDER})
+
+
+def slug_url(view_name, kwarg, slug):
+    """URL по slug без reverse() на каждую строку: шаблон адреса строится один раз на процесс"""
+    return _url_template(view_name, kwarg).replace(SLUG_PLACEHOLDER, slug)
+
+
+def _available(row):
+    return max(row['quantity'] - row['reserved_quantity'], 0)
+
+
+def _product_url(row):
+    return slug_url('shop:product_detail', 'product_slug', row['slug'])
+
+
+# Поле API -> (колонки для values(), функция строки или None, если значение берется как есть)
+PRODUCT_FIELDS = {
+    'id': (('id',), None),
+    'slug': (('slug',), None),
+    'name': (('product_name',), None),
+    'description': (('description',), None),
+    'price': (('price',), None),
+    'old_price': (('price', 'discount_percent'), _old_price),
+    'discount_percent': (('discount_percent',), None),
+    'quantity': (('quantity',), None),
+    'available': (('quantity', 'reserved_quantity'), _available),
+    'views': (('views',), None),
+    'category': (('category__slug',), None),
+    'image': (('image',), lambda row: _media_url(row['image'])),
+    'url': (('slug',), _product_url),
+    'created_at': (('time_create',), None),
+    'updated_at': (('time_update',), None),
+}
+DEFAULT_PRODUCT_FIELDS = ('id', 'slug', 'name', 'price', 'old_price', 'quantity', 'category', 'image', 'url')
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def parse_fields(value):
+    if not value:
+        return list(DEFAULT_PRODUCT_FIELDS)
+    fields = list(dict.fromkeys(name.strip() for name in value.split(',') if name.strip()))
+    unknown = [name for name in fields if name not in PRODUCT_FIELDS]
+    if unknown:
+        raise ApiError(f'Неизвестные поля: {", ".join(unknown)}. Доступны: {", ".join(PRODUCT_FIELDS)}')
+    return fields
+
+
+def parse_limit(value):
+    default = getattr(settings, 'API_PAGE_SIZE', 50)
+    maximum = getattr(settings, 'API_MAX_PAGE_SIZE', 500)
+    try:
+        limit = int(value) if value else default
+    except ValueError:
+        raise ApiError('limit должен быть целым числом')
+    return min(max(limit, 1), maximum)
+
+
+def product_serializer(fields):
+    """Возвращает (колонки для values(), функция строка -> словарь ответа)"""
+    columns = list(dict.fromkeys(column for name in fields for column in PRODUCT_FIELDS[name][0]))
+    getters = [(name, PRODUCT_FIELDS[name][0][0], PRODUCT_FIELDS[name][1]) for name in fields]
+
+    def serialize(row):
+        return {name: row[column] if getter is None else getter(row) for name, column, getter in getters}
+    return columns, serialize
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def _error(message, status=400):
+    return _json({'error': message}, status)
+
+
+def _page_link(request, cursor):
+    if cursor is None:
+        return None
+    params = request.GET.copy()
+    params['cursor'] = cursor
+    return f'{request.path}?{params.urlencode()}'
+
+
+@require_GET
+def product_list(request):
+    """Товары: ?fields, ?limit, ?cursor, ?category=<slug>, фильтры и sort_by как у каталога"""
+    try:
+        fields = parse_fields(request.GET.get('fields'))
+        limit = parse_limit(request.GET.get('limit'))
+    except ApiError as e:
+        return _error(e.message, e.status)
+
+    queryset = Product.objects.filter(is_active=True)
+    category_slug = request.GET.get('category')
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    filterset = ProductFilterSet(request.GET, queryset=queryset)
+    if not filterset.is_valid():
+        return _error(filterset.errors.get_json_data())
+    ordering = KEYSET_ORDERINGS.get(filterset.sort_by)
+    if ordering is None:
+        return _error(f'Сортировка {filterset.sort_by} не поддерживается API')
+
+    columns, serialize = product_serializer(fields)
+    # Ключи сортировки нужны курсору, даже если их нет среди запрошенных полей
+    columns += [name.lstrip('-') for name in ordering if name.lstrip('-') not in columns]
+    paginator = KeysetPaginator(filterset.qs.values(*columns), limit, ordering)
+    cursor = request.GET.get('cursor')
+    try:
+        page = paginator.page(cursor) if cursor else paginator.first_page()
+    except InvalidCursor:
+        return _error('Некорректный курсор')
+
+    return _json({
+        'results': [serialize(row) for row in page],
+        'next': _page_link(request, page.next_cursor),
+        'previous': _page_link(request, page.previous_cursor),
+    })
+
+
+@require_GET
+def product_detail(request, product_slug):
+    try:
+        fields = parse_fields(request.GET.get('fields') or ','.join([*DEFAULT_PRODUCT_FIELDS, 'description']))
+    except ApiError as e:
+        return _error(e.message, e.status)
+    columns, serialize = product_serializer(fields)
+    row = Product.objects.filter(slug=product_slug, is_active=True).values(*columns).first()
+    if row is None:
+        return _error('Товар не найден', 404)
+    return _json(serialize(row))
+
+
+def build_category_tree():
+    """
+    Категории с числом активных товаров и диапазоном цен: два запроса на поколение каталога.
+    Категории одноуровневые, поэтому дерево - список корней с пустыми children.
+    """
+    prices = {
+        row['category_id']: row for row in Product.objects.filter(is_active=True).order_by()
+        .values('category_id').annotate(min_price=Min('price'), max_price=Max('price'))
+    }
+    api_url = reverse('shop:api_products')
+    return [
+        {
+            'id': category['id'],
+            'slug': category['slug'],
+            'name': category['name'],
+            'description': category['description'],
+            'image': _media_url(category['image']),
+            'url': slug_url('shop:category_products', 'category_slug', category['slug']),
+            'products_url': f'{api_url}?category={category["slug"]}',
+            'products_count': category['active_products_count'],
+            'min_price': prices.get(category['id'], {}).get('min_price'),
+            'max_price': prices.get(category['id'], {}).get('max_price'),
+            'children': [],
+        }
+        for category in Category.objects.values(
+            'id', 'slug', 'name', 'description', 'image', 'active_products_count'
+        )
+    ]
+
+
+@require_GET
+def category_list(request):
+    key = f'shop:api:categories:{get_catalog_version()}'
+    content = cache.get(key)
+    if content is None:
+        content = json.dumps({'results': build_category_tree()}, cls=DjangoJSONEncoder, ensure_ascii=False)
+        cache.set(key, content, getattr(settings, 'API_CACHE_TIMEOUT', 60 * 60))
+    return HttpResponse(content, content_type='application/json')
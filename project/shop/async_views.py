@@ -0,0 +1,258 @@
+# shop/async_views.py
+"""
+Асинхронные JSON-версии горячих эндпоинтов каталога и корзины (префикс async/).
+
+Под ASGI запрос не занимает поток воркера, пока ждет базу: списки и карточка
+товара читаются асинхронным API ORM (aget, async for). Код, которому нужны
+транзакции, сессия или несколько зависимых запросов (изменение корзины,
+поиск, связанные товары), вызывается целиком через sync_to_async.
+Под WSGI эти представления тоже работают - Django выполняет их через async_to_sync.
+"""
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import Http404, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404
+
+from . import cart
+from .cart import SessionCart, get_cart_summary
+from .filters import ProductFilterSet
+from .models import Cart, Category, Product
+from .search import highlight_snippet, search_queryset
+from .view_counter import view_counter
+
+HOME_PER_PAGE = 8
+CATEGORY_PER_PAGE = 12
+SEARCH_PER_PAGE = 12
+
+
+def async_require_http_methods(methods):
+    """require_http_methods для async-представлений: в Django 4.2 декоратор оборачивает их синхронной функцией"""
+    def decorator(view):
+        @wraps(view)
+        async def inner(request, *args, **kwargs):
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            return await view(request, *args, **kwargs)
+        return inner
+    return decorator
+
+
+require_GET = async_require_http_methods(['GET'])
+require_POST = async_require_http_methods(['POST'])
+
+
+def serialize_product(product):
+    return {
+        'id': product.pk,
+        'name': product.product_name,
+        'slug': product.slug,
+        'url': product.get_absolute_url(),
+        'price': product.price,
+        'old_price': product.old_price if product.has_discount else None,
+        'discount_percent': product.discount_percent,
+        'quantity': product.quantity,
+        'available': product.available,
+        'image': product.image.url if product.image else None,
+        'category': {'slug': product.category.slug, 'name': product.category.name},
+    }
+
+
+@sync_to_async
+def _get_user(request):
+    """request.user загружается из сессии синхронно: в асинхронном коде обращаемся к нему так"""
+    user = request.user
+    return user if user.is_authenticated else None
+
+
+def _page_number(request):
+    try:
+        return max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return 1
+
+
+async def _product_page(request, queryset, per_page):
+    """Страница товаров без COUNT(*): наличие следующей страницы - по лишней строке"""
+    page = _page_number(request)
+    offset = (page - 1) * per_page
+    products = [product async for product in queryset[offset:offset + per_page + 1]]
+    return products[:per_page], {'page': page, 'has_next': len(products) > per_page}
+
+
+def _filtered(request, queryset, **kwargs):
+    return ProductFilterSet(request.GET, queryset=queryset, **kwargs).qs
+
+
+@require_GET
+async def home_products(request):
+    queryset = Product.objects.filter(is_active=True).select_related('category')
+    products, page = await _product_page(request, _filtered(request, queryset), HOME_PER_PAGE)
+    return JsonResponse({'products': [serialize_product(product) for product in products], **page})
+
+
+@require_GET
+async def category_products(request, category_slug):
+    try:
+        category = await Category.objects.aget(slug=category_slug)
+    except Category.DoesNotExist:
+        raise Http404('Категория не найдена')
+    queryset = Product.objects.filter(category=category, is_active=True).select_related('category')
+    products, page = await _product_page(request, _filtered(request, queryset), CATEGORY_PER_PAGE)
+    return JsonResponse({
+        'category': {'slug': category.slug, 'name': category.name,
+                     'products_count': category.active_products_count},
+        'products': [serialize_product(product) for product in products],
+        **page,
+    })
+
+
+@require_GET
+async def search_products(request):
+    query = request.GET.get('q', '')
+    queryset = Product.objects.filter(is_active=True).select_related('category')
+    category_slug = request.GET.get('category')
+    if category_slug:
+        queryset = queryset.filter(category__slug=category_slug)
+    if query:
+        # Проверка поискового индекса при первом обращении обращается к базе синхронно
+        queryset = await sync_to_async(search_queryset)(queryset, query)
+    default_sort = 'search_rank' if query and 'search_rank' in queryset.query.extra_select else '-time_create'
+    products, page = await _product_page(
+        request, _filtered(request, queryset, default_sort=default_sort), SEARCH_PER_PAGE
+    )
+    results = []
+    for product in products:
+        data = serialize_product(product)
+        if query:
+            data['snippet'] = highlight_snippet(product.description, query)
+        results.append(data)
+    return JsonResponse({'query': query, 'products': results, **page})
+
+
+@require_GET
+async def product_detail(request, product_slug):
+    try:
+        product = await Product.objects.select_related('category').aget(slug=product_slug)
+    except Product.DoesNotExist:
+        raise Http404('Товар не найден')
+    # Буфер просмотров может сброситься в базу - выполняем синхронно
+    await sync_to_async(view_counter.record)(product.pk)
+    related = await sync_to_async(product.get_related_products)(getattr(settings, 'RELATED_PRODUCTS_LIMIT', 4))
+    return JsonResponse({
+        **serialize_product(product),
+        'description': product.description,
+        'views': product.views + view_counter.pending(product.pk),
+        'related': [serialize_product(item) for item in related],
+    })
+
+
+# --- Корзина (ответы как у XHR-версий синхронных представлений) ---
+
+def _quantity(request, default=1):
+    try:
+        return int(request.POST.get('quantity', default))
+    except ValueError:
+        return default
+
+
+@sync_to_async
+def _add_to_cart(request, user, product, quantity):
+    if quantity > product.available:
+        quantity = product.available
+        message = f'Добавлено максимальное доступное количество: {product.available}'
+    else:
+        message = 'Товар добавлен в корзину'
+
+    if user is not None:
+        item_quantity = cart.add_to_cart(user, product, quantity)
+        if item_quantity < quantity or quantity < product.available <= item_quantity:
+            message = f'Установлено максимальное доступное количество: {item_quantity}'
+        # Резерв изменил свободный остаток: в ответ идет значение после него
+        product.refresh_from_db(fields=['quantity', 'reserved_quantity'])
+        cart_count = get_cart_summary(user)['count']
+    else:
+        session_cart = SessionCart(request)
+        if session_cart.get_quantity(product.pk) + quantity > product.available:
+            message = f'Установлено максимальное доступное количество: {product.available}'
+        item_quantity = session_cart.add(product, quantity)
+        cart_count = len(session_cart)
+    return {
+        'success': True,
+        'message': message,
+        'cart_count': cart_count,
+        'item_quantity': item_quantity,
+        'product_quantity': product.available,
+    }
+
+
+@require_POST
+async def add_to_cart(request, product_id):
+    try:
+        product = await Product.objects.aget(pk=product_id)
+    except Product.DoesNotExist:
+        raise Http404('Товар не найден')
+    user = await _get_user(request)
+    return JsonResponse(await _add_to_cart(request, user, product, max(_quantity(request), 1)))
+
+
+@sync_to_async
+def _update_cart_quantity(request, user, cart_item_id, quantity):
+    if user is None:
+        session_cart = SessionCart(request)
+        if cart_item_id not in session_cart:
+            raise Http404
+        product = get_object_or_404(Product, id=cart_item_id)
+        new_quantity = session_cart.set(product, quantity)
+        summary = session_cart.summary()
+        price = product.price
+    else:
+        new_quantity = cart.set_cart_line_quantity(user, cart_item_id, quantity)
+        if new_quantity is None:
+            raise Http404
+        summary = get_cart_summary(user)
+        price = Product.objects.filter(cart__pk=cart_item_id).values_list('price', flat=True).first()
+
+    if new_quantity > 0:
+        return {
+            'success': True,
+            'new_quantity': new_quantity,
+            'item_total': price * new_quantity,
+            'cart_total': summary['total'],
+        }
+    return {'success': True, 'removed': True, 'cart_count': summary['count'], 'cart_total': summary['total']}
+
+
+@require_POST
+async def update_cart_quantity(request, cart_item_id):
+    """Для гостя cart_item_id - это id товара, как и в синхронной версии"""
+    user = await _get_user(request)
+    return JsonResponse(await _update_cart_quantity(request, user, cart_item_id, _quantity(request)))
+
+
+async def _get_cart_line(user, cart_item_id):
+    try:
+        return await Cart.objects.aget(pk=cart_item_id, author=user)
+    except Cart.DoesNotExist:
+        raise Http404
+
+
+def _remove_from_session_cart(request, product_id):
+    session_cart = SessionCart(request)
+    if product_id not in session_cart:
+        raise Http404
+    session_cart.remove(product_id)
+    return len(session_cart)
+
+
+@require_POST
+async def remove_from_cart(request, cart_item_id):
+    user = await _get_user(request)
+    if user is not None:
+        line = await _get_cart_line(user, cart_item_id)
+        await line.adelete()
+        cart_count = (await sync_to_async(get_cart_summary)(user))['count']
+    else:
+        cart_count = await sync_to_async(_remove_from_session_cart)(request, cart_item_id)
+    return JsonResponse({'success': True, 'message': 'Товар удален из корзины', 'cart_count': cart_count})
@@ -0,0 +1,85 @@
+# shop/cache.py
+"""Кэширование данных каталога и их явная инвалидация."""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+SIDEBAR_CACHE_KEY = 'shop:sidebar'
+CATALOG_VERSION_KEY = 'shop:catalog_version'
+CATALOG_MODIFIED_KEY = 'shop:catalog_modified'
+STOCK_VERSION_KEY = 'shop:stock_version'
+
+
+def get_sidebar_categories():
+    """
+    Категории для бокового меню и топ-5 по числу активных товаров.
+    На прогретом кэше не выполняет ни одного запроса к базе.
+    """
+    sidebar = cache.get(SIDEBAR_CACHE_KEY)
+    if sidebar is None:
+        from .models import Category
+
+        categories = list(Category.objects.filter(active_products_count__gt=0))
+        top_categories = sorted(categories, key=lambda c: c.active_products_count, reverse=True)[:5]
+        sidebar = {
+            'all_categories': categories,
+            'top_categories': top_categories,
+        }
+        cache.set(SIDEBAR_CACHE_KEY, sidebar, getattr(settings, 'SIDEBAR_CACHE_TIMEOUT', 300))
+    return sidebar
+
+
+def invalidate_sidebar():
+    cache.delete(SIDEBAR_CACHE_KEY)
+
+
+def get_catalog_version():
+    """Поколение каталога: входит в ключи кэшей, зависящих от товаров"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        version = cache.get(CATALOG_VERSION_KEY, 1)
+    return version
+
+
+def get_catalog_modified():
+    """Время смены поколения каталога (unix time), для заголовка Last-Modified"""
+    modified = cache.get(CATALOG_MODIFIED_KEY)
+    if modified is None:
+        # Кэш очищен: время неизвестно, считаем каталог измененным сейчас
+        cache.add(CATALOG_MODIFIED_KEY, int(time.time()), None)
+        modified = cache.get(CATALOG_MODIFIED_KEY, int(time.time()))
+    return modified
+
+
+def get_stock_version():
+    """Поколение свободных остатков: меняется при каждом изменении резервов"""
+    version = cache.get(STOCK_VERSION_KEY)
+    if version is None:
+        cache.add(STOCK_VERSION_KEY, 1, None)
+        version = cache.get(STOCK_VERSION_KEY, 1)
+    return version
+
+
+def bump_stock_version():
+    """
+    Делает недействительными кэши страниц с остатками (страницы гостей, ETag списков),
+    не трогая остальные кэши каталога: фасеты, подсказки, сводки корзин
+    """
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+    try:
+        return cache.incr(STOCK_VERSION_KEY)
+    except ValueError:
+        cache.add(STOCK_VERSION_KEY, 1, None)
+        return cache.incr(STOCK_VERSION_KEY)
+
+
+def bump_catalog_version():
+    """Делает недействительными все ключи с предыдущим поколением каталога"""
+    cache.set(CATALOG_MODIFIED_KEY, int(time.time()), None)
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        cache.add(CATALOG_VERSION_KEY, 1, None)
+        return cache.incr(CATALOG_VERSION_KEY)
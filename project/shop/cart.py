@@ -0,0 +1,321 @@
+# shop/cart.py
+"""
+Корзина: атомарные изменения позиций, корзина гостя в сессии
+и сводка (число позиций и сумма) с кэшированием на пользователя.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Least
+from django.utils import timezone
+
+from . import reservations
+from .cache import get_catalog_version
+
+EMPTY_CART_SUMMARY = {'count': 0, 'quantity': 0, 'total': 0}
+
+
+def _summary_key(user_id):
+    # Поколение каталога в ключе: смена цены товара сбрасывает закэшированные суммы
+    return f'shop:cart_summary:{get_catalog_version()}:{user_id}'
+
+
+def get_cart_summary(user):
+    """Число позиций, товаров и общая сумма корзины одним агрегирующим запросом"""
+    if not user.is_authenticated:
+        return dict(EMPTY_CART_SUMMARY)
+
+    key = _summary_key(user.pk)
+    summary = cache.get(key)
+    if summary is None:
+        from .models import Cart
+
+        totals = Cart.objects.filter(author=user).aggregate(
+            lines=Count('id'),
+            items=Sum('quantity'),
+            amount=Sum(F('quantity') * F('product__price')),
+        )
+        summary = {
+            'count': totals['lines'] or 0,
+            'quantity': totals['items'] or 0,
+            'total': totals['amount'] or 0,
+        }
+        cache.set(key, summary, getattr(settings, 'CART_SUMMARY_CACHE_TIMEOUT', 60 * 15))
+    return summary
+
+
+def invalidate_cart_summary(user_id):
+    cache.delete(_summary_key(user_id))
+
+
+class SessionCartItem:
+    """Позиция корзины гостя; повторяет интерфейс модели Cart, нужный шаблонам"""
+
+    def __init__(self, product, quantity):
+        self.id = product.pk
+        self.product = product
+        self.quantity = quantity
+
+    def get_total_price(self):
+        return self.product.price * self.quantity
+
+
+class SessionCart:
+    """
+    Корзина анонимного пользователя в сессии: {id товара: количество}.
+    Не создает строк в shop_cart; при входе переносится в Cart (merge_session_cart).
+    """
+
+    def __init__(self, request):
+        self.session = request.session
+        self.cart = self.session.get(settings.CART_SESSION_ID, {})
+
+    def __len__(self):
+        return len(self.cart)
+
+    def __contains__(self, product_id):
+        return str(product_id) in self.cart
+
+    def get_quantity(self, product_id):
+        return self.cart.get(str(product_id), 0)
+
+    def add(self, product, quantity):
+        """Увеличивает количество с ограничением по свободному остатку, возвращает новое количество"""
+        return self.set(product, self.get_quantity(product.pk) + quantity)
+
+    def set(self, product, quantity):
+        quantity = min(quantity, product.available)
+        if quantity > 0:
+            self.cart[str(product.pk)] = quantity
+        else:
+            self.cart.pop(str(product.pk), None)
+        self.save()
+        return quantity
+
+    def remove(self, product_id):
+        if self.cart.pop(str(product_id), None) is not None:
+            self.save()
+
+    def clear(self):
+        self.session.pop(settings.CART_SESSION_ID, None)
+        self.cart = {}
+
+    def save(self):
+        self.session[settings.CART_SESSION_ID] = self.cart
+        self.session.modified = True
+
+    def apply_batch(self, changes):
+        """Применяет пачку {id товара: количество} с одним запросом остатков"""
+        from .models import Product
+
+        # Свободный остаток: резервы пользователей в корзину гостя не попадают
+        stock = {
+            pk: quantity - reserved for pk, quantity, reserved in Product.objects.filter(
+                pk__in=changes, is_active=True
+            ).values_list('pk', 'quantity', 'reserved_quantity')
+        }
+        result = {}
+        for product_id, quantity in changes.items():
+            quantity = min(quantity, stock.get(product_id, 0))
+            if quantity > 0:
+                self.cart[str(product_id)] = quantity
+            else:
+                self.cart.pop(str(product_id), None)
+            result[product_id] = max(quantity, 0)
+        self.save()
+        return result
+
+    def items(self):
+        """Позиции корзины с товарами, загруженными одним запросом"""
+        from .models import Product
+
+        products = Product.objects.filter(pk__in=self.cart.keys()).select_related('category')
+        return [SessionCartItem(product, self.cart[str(product.pk)]) for product in products]
+
+    def summary(self):
+        if not self.cart:
+            return dict(EMPTY_CART_SUMMARY)
+        from .models import Product
+
+        prices = Product.objects.filter(pk__in=self.cart.keys()).values_list('pk', 'price')
+        return {
+            'count': len(self.cart),
+            'quantity': sum(self.cart.values()),
+            'total': sum(price * self.cart[str(pk)] for pk, price in prices),
+        }
+
+
+def get_request_cart_summary(request):
+    """Сводка корзины текущего посетителя: из базы для пользователя, из сессии для гостя"""
+    if request.user.is_authenticated:
+        return get_cart_summary(request.user)
+    return SessionCart(request).summary()
+
+
+def merge_session_cart(request, user):
+    """
+    Переносит корзину гостя в Cart при входе: одно чтение существующих позиций
+    и одна пакетная вставка с обновлением при конфликте (author, product).
+    """
+    session_cart = SessionCart(request)
+    if not session_cart.cart:
+        return
+
+    from .models import Cart, Product
+
+    product_ids = [int(pk) for pk in session_cart.cart]
+    stock = dict(Product.objects.filter(pk__in=product_ids, is_active=True).values_list('pk', 'quantity'))
+    existing = dict(
+        Cart.objects.filter(author=user, product_id__in=product_ids).values_list('product_id', 'quantity')
+    )
+
+    merged = []
+    for product_id in product_ids:
+        available = stock.get(product_id, 0)
+        quantity = min(existing.get(product_id, 0) + session_cart.get_quantity(product_id), available)
+        if quantity > 0:
+            merged.append(Cart(author=user, product_id=product_id, quantity=quantity))
+
+    if merged:
+        Cart.objects.bulk_create(
+            merged,
+            update_conflicts=True,
+            unique_fields=['author', 'product'],
+            update_fields=['quantity', 'updated_at'],
+        )
+        # Резервы создаются только теперь: позиции, на которые не хватило свободного остатка, урезаются
+        reservations.sync_cart_holds(user, [line.product_id for line in merged])
+        invalidate_cart_summary(user.pk)
+    session_cart.clear()
+
+
+# --- Атомарные изменения корзины пользователя ---
+
+def _stock_subquery():
+    """Текущий остаток товара позиции корзины, читается в момент UPDATE"""
+    from .models import Product
+
+    return Subquery(Product.objects.filter(pk=OuterRef('product_id')).values('quantity')[:1])
+
+
+def _drop_empty_lines(user, product_ids):
+    # Позиции, урезанные до нуля нулевым остатком, удаляем
+    from .models import Cart
+
+    Cart.objects.filter(author=user, product_id__in=product_ids, quantity__lte=0).delete()
+
+
+def add_to_cart(user, product, quantity):
+    """
+    Увеличивает количество товара в корзине одним условным UPDATE
+    quantity = MIN(quantity + n, остаток); если позиции нет - создает ее.
+    Затем обновляет резерв позиции (reservations.sync_cart_holds).
+    Возвращает итоговое количество в корзине.
+    """
+    from .models import Cart
+
+    lines = Cart.objects.filter(author=user, product=product)
+    with transaction.atomic():
+        updated = lines.update(
+            quantity=Least(F('quantity') + quantity, _stock_subquery()),
+            updated_at=timezone.now(),
+        )
+        if not updated and product.quantity > 0:
+            try:
+                with transaction.atomic():
+                    Cart.objects.create(author=user, product=product, quantity=min(quantity, product.quantity))
+            except IntegrityError:
+                # Позицию параллельно создал другой запрос - повторяем условное обновление
+                lines.update(
+                    quantity=Least(F('quantity') + quantity, _stock_subquery()),
+                    updated_at=timezone.now(),
+                )
+        _drop_empty_lines(user, [product.pk])
+        reservations.sync_cart_holds(user, [product.pk])
+        new_quantity = lines.values_list('quantity', flat=True).first() or 0
+
+    invalidate_cart_summary(user.pk)
+    return new_quantity
+
+
+def set_cart_line_quantity(user, cart_item_id, quantity):
+    """
+    Устанавливает количество позиции с ограничением по остатку (0 - удаление).
+    Возвращает итоговое количество или None, если позиции нет.
+    """
+    from .models import Cart
+
+    lines = Cart.objects.filter(pk=cart_item_id, author=user)
+    with transaction.atomic():
+        if quantity <= 0:
+            deleted, _ = lines.delete()
+            result = 0 if deleted else None
+        else:
+            updated = lines.update(
+                quantity=Least(Value(quantity), _stock_subquery()),
+                updated_at=timezone.now(),
+            )
+            if not updated:
+                result = None
+            else:
+                lines.filter(quantity__lte=0).delete()
+                product_id = lines.values_list('product_id', flat=True).first()
+                if product_id is not None:
+                    reservations.sync_cart_holds(user, [product_id])
+                result = lines.values_list('quantity', flat=True).first() or 0
+
+    invalidate_cart_summary(user.pk)
+    return result
+
+
+def apply_cart_batch(user, changes):
+    """
+    Применяет пачку изменений {id товара: количество} к корзине одной транзакцией:
+    удаление позиций с нулевым количеством, upsert остальных и одно
+    ограничивающее UPDATE по актуальным остаткам. Возвращает {id товара: количество}.
+    """
+    from .models import Cart, Product, StockHold
+
+    removed = [product_id for product_id, quantity in changes.items() if quantity <= 0]
+    wanted = {product_id: quantity for product_id, quantity in changes.items() if quantity > 0}
+
+    with transaction.atomic():
+        if removed:
+            Cart.objects.filter(author=user, product_id__in=removed).delete()
+        if wanted:
+            # Свободный остаток, как у Product.available, плюс собственный резерв пользователя:
+            # sync_cart_holds ниже не урежет позицию повторно
+            own = dict(
+                StockHold.objects.filter(user=user, product_id__in=wanted).values_list('product_id', 'quantity')
+            )
+            stock = {
+                pk: quantity - reserved + own.get(pk, 0)
+                for pk, quantity, reserved in Product.objects.filter(pk__in=wanted, is_active=True)
+                .values_list('pk', 'quantity', 'reserved_quantity')
+            }
+            lines = [
+                Cart(author=user, product_id=product_id, quantity=min(quantity, stock[product_id]))
+                for product_id, quantity in wanted.items()
+                if stock.get(product_id, 0) > 0
+            ]
+            Cart.objects.bulk_create(
+                lines,
+                update_conflicts=True,
+                unique_fields=['author', 'product'],
+                update_fields=['quantity', 'updated_at'],
+            )
+            # Остаток мог измениться после чтения - ограничиваем уже записанные значения
+            Cart.objects.filter(author=user, product_id__in=wanted).update(
+                quantity=Least(F('quantity'), _stock_subquery())
+            )
+            _drop_empty_lines(user, list(wanted))
+            reservations.sync_cart_holds(user, list(wanted))
+
+        result = dict.fromkeys(changes, 0)
+        result.update(
+            Cart.objects.filter(author=user, product_id__in=changes).values_list('product_id', 'quantity')
+        )
+
+    invalidate_cart_summary(user.pk)
+    return result
@@ -0,0 +1,87 @@
+# shop/catalog_io.py
+"""
+Потоковое чтение и запись каталога в CSV и JSONL для команд
+import_products и export_products.
+
+Строки читаются и пишутся по одной, поэтому память не зависит от размера
+файла. Формат обоих направлений одинаков (PRODUCT_COLUMNS), так что
+выгрузку можно загрузить обратно.
+"""
+import csv
+import json
+import re
+
+from django.template.defaultfilters import slugify
+
+PRODUCT_COLUMNS = [
+    'slug', 'product_name', 'description', 'category', 'price', 'quantity',
+    'discount_percent', 'is_active', 'image',
+]
+FORMATS = ('csv', 'jsonl')
+
+SLUG_MAX_LENGTH = 50
+
+_TRANSLIT = str.maketrans({
+    'а': 'a', 'б': 'b', 'в': 'v', 'г': 'g', 'д': 'd', 'е': 'e', 'ё': 'e', 'ж': 'zh', 'з': 'z',
+    'и': 'i', 'й': 'y', 'к': 'k', 'л': 'l', 'м': 'm', 'н': 'n', 'о': 'o', 'п': 'p', 'р': 'r',
+    'с': 's', 'т': 't', 'у': 'u', 'ф': 'f', 'х': 'h', 'ц': 'ts', 'ч': 'ch', 'ш': 'sh', 'щ': 'sch',
+    'ъ': '', 'ы': 'y', 'ь': '', 'э': 'e', 'ю': 'yu', 'я': 'ya',
+})
+_TRUE_VALUES = {'1', 'true', 'yes', 'y', 'да', 'on'}
+_FALSE_VALUES = {'0', 'false', 'no', 'n', 'нет', 'off', ''}
+
+
+def detect_format(path, fmt=None):
+    if fmt:
+        return fmt
+    return 'jsonl' if re.search(r'\.(jsonl|ndjson)$', path, re.IGNORECASE) else 'csv'
+
+
+def make_slug(text, suffix=''):
+    """Латинский slug из названия (кириллица транслитерируется) с учетом длины поля"""
+    base = slugify(str(text).lower().translate(_TRANSLIT)) or 'product'
+    if suffix:
+        suffix = f'-{suffix}'
+    return base[:SLUG_MAX_LENGTH - len(suffix)].rstrip('-') + suffix
+
+
+def parse_bool(value):
+    if isinstance(value, bool):
+        return value
+    value = str(value).strip().lower()
+    if value in _TRUE_VALUES:
+        return True
+    if value in _FALSE_VALUES:
+        return False
+    raise ValueError(f'ожидалось логическое значение, получено {value!r}')
+
+
+def read_rows(stream, fmt, delimiter=','):
+    """Выдает (номер строки, словарь) из открытого текстового потока"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream, delimiter=delimiter)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if line:
+                yield line_number, json.loads(line)
+
+
+class RowWriter:
+    """Пишет строки каталога в открытый текстовый поток"""
+
+    def __init__(self, stream, fmt, delimiter=','):
+        self.stream = stream
+        self.fmt = fmt
+        if fmt == 'csv':
+            self._csv = csv.DictWriter(stream, fieldnames=PRODUCT_COLUMNS, delimiter=delimiter)
+            self._csv.writeheader()
+
+    def write(self, row):
+        if self.fmt == 'csv':
+            self._csv.writerow(row)
+        else:
+            self.stream.write(json.dumps(row, ensure_ascii=False))
+            self.stream.write('\n')
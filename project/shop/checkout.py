@@ -0,0 +1,87 @@
+# shop/checkout.py
+"""
+Оформление заказа из корзины пользователя.
+
+Все шаги выполняются в одной транзакции: условное списание остатков
+(UPDATE ... WHERE quantity >= n на каждый товар, без блокировки строк
+через SELECT FOR UPDATE), одна вставка заказа, одна пакетная вставка
+позиций с зафиксированными ценами и удаление корзины. Резервы
+пользователя (shop/reservations.py) забираются в начале: списание проверяет
+остаток за вычетом чужих резервов и уменьшает reserved_quantity на свой.
+После фиксации сменяется поколение остатков: сбрасываются только кэши,
+зависящие от остатков. Конфликт блокировок базы вызывающий код повторяет
+через db_retry.retry_on_lock.
+"""
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import reservations
+from .cache import bump_stock_version
+from .cart import invalidate_cart_summary
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class OutOfStockError(CheckoutError):
+    """Остатка товара не хватает на количество из корзины"""
+
+    def __init__(self, product_id, product_name=''):
+        super().__init__(product_id)
+        self.product_id = product_id
+        self.product_name = product_name
+
+
+def checkout(user, shipping_address):
+    """
+    Создает заказ из корзины пользователя и возвращает его.
+    При нехватке остатка любого товара транзакция откатывается целиком
+    и выбрасывается OutOfStockError; корзина при этом не меняется.
+    """
+    from accounts.models import Order, OrderItem
+    from .models import Cart, Product
+
+    with transaction.atomic():
+        # Сортировка по id товара задает одинаковый порядок блокировок для параллельных заказов
+        lines = list(
+            Cart.objects.filter(author=user)
+            .order_by('product_id')
+            .values_list('product_id', 'quantity', 'product__price', 'product__product_name')
+        )
+        if not lines:
+            raise EmptyCartError
+
+        held = reservations.take_holds(user.pk)
+        for product_id, quantity, _, product_name in lines:
+            own = held.get(product_id, 0)
+            updated = Product.objects.filter(
+                pk=product_id, is_active=True, quantity__gte=F('reserved_quantity') - own + quantity
+            ).update(
+                quantity=F('quantity') - quantity,
+                reserved_quantity=Greatest(F('reserved_quantity') - own, 0),
+            )
+            if not updated:
+                raise OutOfStockError(product_id, product_name)
+
+        order = Order.objects.create(
+            user=user,
+            total_amount=sum(price * quantity for _, quantity, price, _ in lines),
+            shipping_address=shipping_address,
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=product_id, quantity=quantity, price=price)
+            for product_id, quantity, price, _ in lines
+        ])
+        # Остатки изменены UPDATE без сигналов: кэши остатков сбрасываются после фиксации
+        transaction.on_commit(bump_stock_version)
+        # Резервы уже забраны: сигналы удаления позиций снимать нечего
+        Cart.objects.filter(author=user).delete()
+
+    invalidate_cart_summary(user.pk)
+    return order
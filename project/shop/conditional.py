@@ -0,0 +1,104 @@
+# shop/conditional.py
+"""
+Условные GET-запросы для страниц каталога (ETag и Last-Modified).
+
+Валидаторы считаются до построения контекста шаблона: для карточки товара -
+из time_update и поколения каталога, для списков - из поколения каталога и
+нормализованной строки запроса. Страница содержит и данные посетителя
+(имя в шапке, сводку корзины, CSRF-токен), поэтому они тоже входят в ETag.
+Если браузер или поисковый робот прислал совпадающий валидатор, отдается
+304 Not Modified без выполнения представления.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.middleware.csrf import get_token
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+
+from .cache import get_catalog_modified, get_catalog_version, get_stock_version
+from .cart import get_cart_summary
+from .page_cache import normalize_query_string
+
+
+def visitor_state(request):
+    """Данные посетителя, попадающие в HTML любой страницы"""
+    # Секрет CSRF, с которым будет отрисована страница (при первом визите он только создается)
+    get_token(request)
+    csrf_secret = request.META.get('CSRF_COOKIE', '')
+    if request.user.is_authenticated:
+        summary = get_cart_summary(request.user)
+        return [request.user.pk, request.user.get_username(), summary['count'], str(summary['total']), csrf_secret]
+    return [None, request.session.get(settings.CART_SESSION_ID), csrf_secret]
+
+
+def make_etag(request, *parts):
+    source = json.dumps([*parts, visitor_state(request)], default=str, sort_keys=True)
+    return quote_etag(hashlib.md5(source.encode()).hexdigest())
+
+
+def is_conditional_request_allowed(request):
+    # Одноразовые сообщения показываются один раз: такую страницу нужно отрисовать заново
+    return request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
+
+
+def listing_validators(request, *parts):
+    """Валидаторы страницы списка: меняются вместе с поколением каталога и остатков"""
+    etag = make_etag(request, request.path, normalize_query_string(request.GET),
+                     get_catalog_version(), get_stock_version(), *parts)
+    return etag, get_catalog_modified()
+
+
+def set_validators(response, etag, last_modified):
+    if response.status_code != 200 or response.streaming:
+        return response
+    if not response.has_header('ETag'):
+        response['ETag'] = etag
+    if last_modified is not None and not response.has_header('Last-Modified'):
+        response['Last-Modified'] = http_date(last_modified)
+    # Страница зависит от посетителя: общие кэши не хранят ее, браузер каждый раз перепроверяет
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalGetMixin:
+    """Отвечает 304 Not Modified, не выполняя представление, если страница не менялась"""
+
+    def get_validators(self):
+        """(etag, last_modified в unix time) или None, если проверка невозможна"""
+        return listing_validators(self.request)
+
+    def not_modified(self, request):
+        """Вызывается, когда отдан ответ 304"""
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_conditional_request_allowed(request):
+            return super().dispatch(request, *args, **kwargs)
+        validators = self.get_validators()
+        if validators is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        etag, last_modified = validators
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            if response.status_code == 304:
+                self.not_modified(request)
+            return response
+        return set_validators(super().dispatch(request, *args, **kwargs), etag, last_modified)
+
+
+def conditional_listing(view):
+    """ConditionalGetMixin для функций-представлений списков"""
+    @wraps(view)
+    def inner(request, *args, **kwargs):
+        if not is_conditional_request_allowed(request):
+            return view(request, *args, **kwargs)
+        etag, last_modified = listing_validators(request)
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is not None:
+            return response
+        return set_validators(view(request, *args, **kwargs), etag, last_modified)
+    return inner
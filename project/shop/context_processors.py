@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from .cache import get_catalog_version
+from .cart import get_request_cart_summary
+
+
+def cart(request):
+    """Сводка корзины для шапки сайта; запрос выполняется только при обращении из шаблона"""
+    return {
+        'cart_summary': SimpleLazyObject(lambda: get_request_cart_summary(request)),
+    }
+
+
+def catalog(request):
+    """Поколение каталога и время жизни для кэширования фрагментов шаблонов"""
+    return {
+        'catalog_version': SimpleLazyObject(get_catalog_version),
+        'product_card_cache_timeout': getattr(settings, 'PRODUCT_CARD_CACHE_TIMEOUT', 60 * 10),
+    }
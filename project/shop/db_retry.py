@@ -0,0 +1,54 @@
+# shop/db_retry.py
+"""
+Повтор транзакций при конфликте блокировок базы.
+
+SQLite сериализует запись: транзакция, начавшая с чтения, при попытке
+записи получает «database is locked» сразу, без ожидания в busy timeout,
+если запись уже держит другое подключение. Такую транзакцию можно только
+откатить и повторить целиком. retry_on_lock повторяет функцию с
+экспоненциальной задержкой и случайным разбросом, чтобы конкуренты не
+сталкивались снова в один и тот же момент.
+"""
+import random
+import time
+
+from django.conf import settings
+from django.db import OperationalError
+
+LOCK_ERROR_MARKERS = ('database is locked', 'database table is locked', 'deadlock detected')
+
+
+class LockRetriesExceeded(Exception):
+    """Блокировку не удалось получить за DB_LOCK_RETRIES повторов"""
+
+    def __init__(self, attempts):
+        super().__init__(f'Конфликт блокировок базы после {attempts} попыток')
+        self.attempts = attempts
+
+
+def is_lock_error(error):
+    message = str(error).lower()
+    return any(marker in message for marker in LOCK_ERROR_MARKERS)
+
+
+def retry_on_lock(func, *args, retries=None, on_retry=None, **kwargs):
+    """
+    Вызывает func(*args, **kwargs); при конфликте блокировок повторяет до retries раз.
+    Функция должна сама открывать транзакцию (atomic), чтобы повтор начинался с чистого состояния.
+    on_retry(attempt) вызывается перед каждым повтором.
+    """
+    if retries is None:
+        retries = getattr(settings, 'DB_LOCK_RETRIES', 10)
+    delay = getattr(settings, 'DB_LOCK_RETRY_DELAY', 0.01)
+    for attempt in range(retries + 1):
+        try:
+            return func(*args, **kwargs)
+        except OperationalError as e:
+            if not is_lock_error(e):
+                raise
+        if attempt < retries:
+            if on_retry is not None:
+                on_retry(attempt + 1)
+            # Задержка растет вдвое (не больше секунды), разброс разводит конкурентов
+            time.sleep(min(delay * 2 ** attempt, 1) * random.uniform(0.5, 1.5))
+    raise LockRetriesExceeded(retries + 1)
@@ -0,0 +1,108 @@
+# shop/db_router.py
+"""
+Чтение каталога с реплик.
+
+CatalogReplicaRouter отправляет чтения товаров, категорий, изображений и
+связанных товаров (а с ними и поиск) на реплики из DATABASE_REPLICAS, все
+записи и остальные модели - в основную базу default. Основная база
+используется и для чтений:
+- вне HTTP-запроса (команды, фоновые потоки): там чтение часто идет сразу
+  за записью;
+- в небезопасных запросах (POST и т.п.) и после первой записи в запросе;
+- внутри транзакции основной базы (select_for_update, проверки остатков);
+- в течение REPLICA_STICKY_SECONDS после записи в той же сессии, пока
+  реплика может отставать (ReplicaPinningMiddleware).
+"""
+import random
+import sqlite3
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+CATALOG_MODELS = {
+    'shop.category', 'shop.product', 'shop.productimages', 'shop.relatedproduct', 'shop.similarproduct',
+}
+
+_state = ContextVar('db_routing_state', default=None)
+
+
+class RoutingState:
+    def __init__(self, pinned=False):
+        self.pinned = pinned
+        self.wrote = False
+
+
+@contextmanager
+def replica_routing(pinned=False):
+    """Включает чтение с реплик в пределах блока (middleware оборачивает им каждый запрос)"""
+    state = RoutingState(pinned)
+    token = _state.set(state)
+    try:
+        yield state
+    finally:
+        _state.reset(token)
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class CatalogReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.label_lower not in CATALOG_MODELS:
+            return None
+        state = _state.get()
+        replicas = get_replicas()
+        if state is None or state.pinned or not replicas or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Связанные объекты читаем оттуда же, откуда загружен исходный
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            # Дальше в этом запросе читаем свои же записи из основной базы
+            state.wrote = state.pinned = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема и данные попадают на реплики репликацией
+        if db in get_replicas():
+            return False
+        return None
+
+
+def sync_sqlite_replicas():
+    """
+    Копирует основную базу SQLite в файлы реплик (онлайн-бэкап).
+    Заменяет репликацию при локальной проверке, возвращает скопированные алиасы.
+    """
+    source = connections[DEFAULT_DB_ALIAS]
+    if source.vendor != 'sqlite':
+        raise ValueError('Копирование реплик поддерживается только для SQLite')
+    source.ensure_connection()
+    copied = []
+    for alias in get_replicas():
+        target = connections[alias]
+        # В тестах реплика - зеркало default (TEST.MIRROR), копировать нечего
+        if target is source or target.settings_dict['NAME'] == source.settings_dict['NAME']:
+            continue
+        target.close()
+        destination = sqlite3.connect(target.settings_dict['NAME'])
+        try:
+            source.connection.backup(destination)
+        finally:
+            destination.close()
+        copied.append(alias)
+    return copied
@@ -0,0 +1,144 @@
+# shop/filters.py
+import hashlib
+
+import django_filters
+from django.conf import settings
+from django.core.exceptions import EmptyResultSet
+from django.core.cache import cache
+from django.db.models import Count, F, Q
+
+from .cache import get_catalog_version, get_sidebar_categories, get_stock_version
+from .forms import ProductFilterForm
+from .models import Product
+from .pagination import get_ordering
+
+SEARCH_RANK_ORDERING = ('search_rank', '-time_create', '-id')
+
+# Границы ценовых диапазонов для гистограммы фасетов
+DEFAULT_PRICE_FACET_BUCKETS = (0, 1000, 5000, 20000, 50000, 100000)
+
+
+class ProductFilterSet(django_filters.FilterSet):
+    """
+    Единый фильтр каталога: проверяет параметры через ProductFilterForm,
+    собирает один queryset с фильтрами и сортировкой и считает фасеты.
+    """
+    in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    with_discount = django_filters.BooleanFilter(method='filter_with_discount')
+    min_price = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    max_price = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+
+    class Meta:
+        model = Product
+        fields = []
+        form = ProductFilterForm
+
+    def __init__(self, data=None, queryset=None, *, default_sort='-time_create', **kwargs):
+        # Форма всегда связана с данными, чтобы фильтрация и сортировка применялись и без параметров
+        super().__init__(data if data is not None else {}, queryset=queryset, **kwargs)
+        self.default_sort = default_sort
+
+    def get_form_class(self):
+        # Используем поля и виджеты ProductFilterForm как есть
+        return self._meta.form
+
+    def filter_in_stock(self, queryset, name, value):
+        # В наличии - есть свободный остаток, как у Product.available
+        return queryset.filter(quantity__gt=F('reserved_quantity')) if value else queryset
+
+    def filter_with_discount(self, queryset, name, value):
+        return queryset.filter(discount_percent__gt=0) if value else queryset
+
+    @property
+    def sort_by(self):
+        if self.form.is_valid() and self.form.cleaned_data.get('sort_by'):
+            return self.form.cleaned_data['sort_by']
+        return self.default_sort
+
+    @property
+    def ordering(self):
+        if self.sort_by == 'search_rank':
+            return SEARCH_RANK_ORDERING
+        return get_ordering(self.sort_by)
+
+    def filter_queryset(self, queryset):
+        # В форме есть sort_by, которому не соответствует фильтр: он задает только сортировку
+        for name, value in self.form.cleaned_data.items():
+            if name in self.filters:
+                queryset = self.filters[name].filter(queryset, value)
+        return queryset.order_by(*self.ordering)
+
+    def get_filter_key(self):
+        """Нормализованный ключ фильтров: не зависит от порядка и записи параметров; None для неверной формы"""
+        if not self.form.is_valid():
+            return None
+        values = sorted(
+            (name, value) for name, value in self.form.cleaned_data.items()
+            if name in self.filters and value not in (None, '', False)
+        )
+        return repr(values)
+
+    def get_facets(self):
+        """
+        Фасеты по текущей выборке одним агрегирующим запросом: GROUP BY категории
+        с условными счетчиками, итоги по всей выборке суммируются в Python.
+        Результат кэшируется по нормализованному ключу фильтров.
+        """
+        filter_key = self.get_filter_key()
+        if filter_key is None:
+            # Неверные параметры не кэшируем: иначе все такие запросы делили бы одну запись
+            return self._compute_facets()
+        try:
+            key_source = f'{self.queryset.query}|{filter_key}'
+        except EmptyResultSet:
+            # Пустая выборка (queryset.none()): считать нечего, запросов к базе не будет
+            return self._compute_facets()
+        # Счетчик «в наличии» зависит от резервов: в ключе и поколение остатков
+        cache_key = 'shop:facets:{}:{}:{}'.format(
+            get_catalog_version(), get_stock_version(), hashlib.md5(key_source.encode()).hexdigest()
+        )
+        facets = cache.get(cache_key)
+        if facets is None:
+            facets = self._compute_facets()
+            cache.set(cache_key, facets, getattr(settings, 'FACETS_CACHE_TIMEOUT', 300))
+        return facets
+
+    def _compute_facets(self):
+        edges = list(getattr(settings, 'PRICE_FACET_BUCKETS', DEFAULT_PRICE_FACET_BUCKETS))
+        buckets = list(zip(edges, edges[1:] + [None]))
+
+        aggregates = {
+            'total': Count('pk'),
+            'in_stock': Count('pk', filter=Q(quantity__gt=F('reserved_quantity'))),
+            'with_discount': Count('pk', filter=Q(discount_percent__gt=0)),
+        }
+        for i, (low, high) in enumerate(buckets):
+            condition = Q(price__gte=low)
+            if high is not None:
+                condition &= Q(price__lt=high)
+            aggregates[f'price_{i}'] = Count('pk', filter=condition)
+
+        rows = self.qs.order_by().values('category_id').annotate(**aggregates)
+
+        totals = dict.fromkeys(aggregates, 0)
+        category_counts = {}
+        for row in rows:
+            category_counts[row['category_id']] = row['total']
+            for name in aggregates:
+                totals[name] += row[name]
+
+        categories = {c.pk: c for c in get_sidebar_categories()['all_categories']}
+        return {
+            'total': totals['total'],
+            'in_stock': totals['in_stock'],
+            'with_discount': totals['with_discount'],
+            'price_buckets': [
+                {'min': low, 'max': high, 'count': totals[f'price_{i}']}
+                for i, (low, high) in enumerate(buckets)
+            ],
+            'categories': [
+                {'id': pk, 'name': categories[pk].name, 'slug': categories[pk].slug, 'count': count}
+                for pk, count in sorted(category_counts.items(), key=lambda item: -item[1])
+                if pk in categories
+            ],
+        }
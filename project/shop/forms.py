@@ -6,7 +6,8 @@ class ProductFilterForm(forms.Form):
         ('-time_create', 'Новинки'),
         ('price', 'Цена по возрастанию'),
         ('-price', 'Цена по убыванию'),
-        ('-views', 'По популярности'),
+        ('-trending', 'Популярные сейчас'),
+        ('-views', 'По просмотрам'),
         ('-discount_percent', 'По размеру скидки'),
     ]
 
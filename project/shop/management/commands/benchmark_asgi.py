@@ -0,0 +1,193 @@
+import asyncio
+import json
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from shop.models import Category, Product
+from shop.view_counter import view_counter
+
+from .run_benchmarks import percentile
+
+SCENARIOS = ['products', 'category', 'search', 'product_detail']
+MODES = ['wsgi', 'asgi']
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность асинхронных эндпоинтов (async/...) под ASGI и WSGI '
+        'при одинаковом числе воркеров: WSGI-воркер обрабатывает один запрос за раз, '
+        'ASGI-воркер (цикл событий) - сколько угодно, пока запросы ждут базу. '
+        'Серверы эмулируются в процессе тестовыми клиентами'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400, help='Запросов в каждом режиме')
+        parser.add_argument('--concurrency', type=int, default=32, help='Одновременных клиентов')
+        parser.add_argument('--workers', type=int, default=4, help='Воркеров сервера в обоих режимах')
+        parser.add_argument('--db-latency', type=float, default=0,
+                            help='Добавочная задержка каждого SQL-запроса, мс (эмуляция сетевой базы)')
+        parser.add_argument('--scenario', action='append', choices=SCENARIOS,
+                            help='Запускать только эти сценарии (по умолчанию вперемешку все)')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Только указанные режимы')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно выбора адресов')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1 or options['workers'] < 1 or options['concurrency'] < 1:
+            raise CommandError('Число запросов, воркеров и клиентов должно быть положительным')
+        self.options = options
+        paths = self._build_paths()
+        host = next((h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost')
+        self.host = host
+
+        latency = options['db_latency'] / 1000
+        if latency:
+            def delay(execute, sql, params, many, context):
+                time.sleep(latency)
+                return execute(sql, params, many, context)
+
+            def install_delay(sender, connection, **kwargs):
+                connection.execute_wrappers.append(delay)
+            # Обертка ставится на каждое новое подключение: запросы идут из разных потоков
+            connection_created.connect(install_delay, weak=False)
+            connection.close()
+
+        results = {}
+        # AsyncClient всегда присылает Host: testserver, его нужно разрешить на время замера
+        allowed_hosts = [*settings.ALLOWED_HOSTS, host, 'testserver']
+        try:
+            with override_settings(ALLOWED_HOSTS=allowed_hosts):
+                for mode in options['mode'] or MODES:
+                    run = self._run_wsgi if mode == 'wsgi' else self._run_asgi
+                    results[mode] = self._summarize(*run(paths))
+                    self._print(mode, results[mode])
+        finally:
+            if latency:
+                connection_created.disconnect(install_delay)
+            view_counter.flush()
+
+        if 'wsgi' in results and 'asgi' in results and results['wsgi']['rps']:
+            ratio = results['asgi']['rps'] / results['wsgi']['rps']
+            self.stdout.write(self.style.SUCCESS(f'ASGI / WSGI по пропускной способности: {ratio:.2f}x'))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({'options': {key: options[key] for key in (
+                    'requests', 'concurrency', 'workers', 'db_latency', 'scenario', 'seed',
+                )}, 'results': results}, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def _build_paths(self):
+        rng = random.Random(self.options['seed'])
+        products = Product.objects.filter(is_active=True)
+        categories = list(Category.objects.filter(active_products_count__gt=0).values_list('slug', flat=True))
+        slugs = list(products.order_by('pk').values_list('slug', flat=True)[:2000])
+        if not categories or not slugs:
+            raise CommandError('Каталог пуст: заполните его командой seed_catalog')
+        words = sorted({
+            word for name in products.values_list('product_name', flat=True)[:200]
+            for word in name.lower().split() if not word.isdigit()
+        })
+
+        def build(scenario):
+            if scenario == 'products':
+                return reverse('shop:async_home') + f'?page={rng.randint(1, 5)}'
+            if scenario == 'category':
+                return reverse('shop:async_category_products', args=[rng.choice(categories)])
+            if scenario == 'search':
+                return reverse('shop:async_search') + f'?q={rng.choice(words)}'
+            return reverse('shop:async_product_detail', args=[rng.choice(slugs)])
+
+        scenarios = self.options['scenario'] or SCENARIOS
+        return [build(scenarios[i % len(scenarios)]) for i in range(self.options['requests'])]
+
+    def _run_wsgi(self, paths):
+        """Клиенты ставят запросы в очередь пула из workers потоков-воркеров (как очередь accept у WSGI-сервера)"""
+        local = threading.local()
+        queue = iter(paths)
+        lock = threading.Lock()
+        timings, errors = [], []
+
+        def handle(path):
+            if not hasattr(local, 'client'):
+                local.client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+            return local.client.get(path).status_code
+
+        def client_loop(server):
+            while True:
+                with lock:
+                    path = next(queue, None)
+                if path is None:
+                    break
+                started = time.perf_counter()
+                status = server.submit(handle, path).result()
+                with lock:
+                    timings.append(time.perf_counter() - started)
+                    errors.append(status != 200)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.options['workers']) as server, \
+                ThreadPoolExecutor(max_workers=self.options['concurrency']) as clients:
+            for future in [clients.submit(client_loop, server) for _ in range(self.options['concurrency'])]:
+                future.result()
+        return timings, errors, time.perf_counter() - started
+
+    def _run_asgi(self, paths):
+        """workers циклов событий, клиенты распределены между ними поровну"""
+        queue = iter(paths)
+        lock = threading.Lock()
+        timings, errors = [], []
+
+        async def client_loop():
+            client = AsyncClient(raise_request_exception=False)
+            while True:
+                with lock:
+                    path = next(queue, None)
+                if path is None:
+                    break
+                started = time.perf_counter()
+                status = (await client.get(path)).status_code
+                with lock:
+                    timings.append(time.perf_counter() - started)
+                    errors.append(status != 200)
+
+        async def worker(clients):
+            await asyncio.gather(*(client_loop() for _ in range(clients)))
+
+        workers = min(self.options['workers'], self.options['concurrency'])
+        clients = [len(range(i, self.options['concurrency'], workers)) for i in range(workers)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for future in [executor.submit(asyncio.run, worker(count)) for count in clients]:
+                future.result()
+        return timings, errors, time.perf_counter() - started
+
+    def _summarize(self, timings, errors, elapsed):
+        timings_ms = [timing * 1000 for timing in timings]
+        return {
+            'requests': len(timings),
+            'errors': sum(errors),
+            'seconds': round(elapsed, 3),
+            'rps': round(len(timings) / elapsed, 1) if elapsed else None,
+            'mean_ms': round(statistics.fmean(timings_ms), 3) if timings_ms else None,
+            'p50_ms': round(percentile(timings_ms, 50), 3),
+            'p95_ms': round(percentile(timings_ms, 95), 3),
+            'p99_ms': round(percentile(timings_ms, 99), 3),
+        }
+
+    def _print(self, mode, result):
+        self.stdout.write(
+            f'{mode.upper():<5} {result["rps"]:8.1f} запр/с  p50 {result["p50_ms"]:8.2f} мс  '
+            f'p95 {result["p95_ms"]:8.2f} мс  p99 {result["p99_ms"]:8.2f} мс'
+            + (self.style.ERROR(f'  ошибок {result["errors"]}') if result['errors'] else '')
+        )
@@ -0,0 +1,112 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from accounts.models import Order
+from shop.checkout import OutOfStockError, checkout
+from shop.db_retry import LockRetriesExceeded, retry_on_lock
+from shop.models import Cart, Category, Product
+
+BENCHMARK_PREFIX = 'benchmark-checkout'
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест оформления заказов: параллельные покупатели '
+        'выкупают один «горячий» товар; проверяет отсутствие перепродажи'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--buyers', type=int, default=100, help='Число покупателей')
+        parser.add_argument('--threads', type=int, default=8, help='Число параллельных потоков')
+        parser.add_argument('--stock', type=int, default=50, help='Остаток горячего товара')
+        parser.add_argument('--quantity', type=int, default=1, help='Количество товара в каждом заказе')
+        parser.add_argument('--retries', type=int, default=20,
+                            help='Повторы при конфликте блокировок базы (database is locked)')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданные данные')
+
+    def handle(self, *args, **options):
+        if Product.objects.filter(slug=f'{BENCHMARK_PREFIX}-hot').exists():
+            raise CommandError('Остались данные прошлого запуска, удалите их или запустите без --keep')
+
+        users, product = self._prepare(options)
+        self.retries = options['retries']
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as executor:
+            outcomes = list(executor.map(self._buy, users))
+        elapsed = time.perf_counter() - started
+
+        results = [status for status, _ in outcomes]
+        conflicts = sum(retried for _, retried in outcomes)
+
+        product.refresh_from_db()
+        placed = results.count('ok')
+        rejected = results.count('out_of_stock')
+        failed = results.count('failed')
+        sold = Order.objects.filter(user__in=users).count() * options['quantity']
+
+        self.stdout.write(f'Покупателей: {len(users)}, потоков: {options["threads"]}')
+        self.stdout.write(f'Время: {elapsed:.3f} с, {len(users) / elapsed:.1f} оформлений/с')
+        self.stdout.write(f'Заказов: {placed}, отказов по остатку: {rejected}')
+        self.stdout.write(f'Конфликтов блокировок (повторено): {conflicts}')
+        if failed:
+            # Не результат оформления: SQLite не дал записать за все повторы (ограничение окружения)
+            self.stdout.write(self.style.WARNING(
+                f'Не оформлено из-за блокировок базы после {self.retries} повторов: {failed}. '
+                'Это ограничение SQLite при параллельной записи, увеличьте --retries или используйте PostgreSQL'
+            ))
+        self.stdout.write(f'Остаток: {options["stock"]} -> {product.quantity}, продано: {sold}')
+
+        if sold + product.quantity != options['stock'] or product.quantity < 0:
+            self.stdout.write(self.style.ERROR('Обнаружена перепродажа или потеря остатка'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Перепродаж нет'))
+
+        if not options['keep']:
+            self._cleanup(users, product)
+
+    def _prepare(self, options):
+        User = get_user_model()
+        # bulk_create не вызывает сигналы: профили покупателям для теста не нужны
+        User.objects.bulk_create([
+            User(email=f'{BENCHMARK_PREFIX}-{i}@example.com', username=f'{BENCHMARK_PREFIX}-{i}@example.com')
+            for i in range(options['buyers'])
+        ])
+        users = list(User.objects.filter(email__startswith=f'{BENCHMARK_PREFIX}-'))
+        if not users:
+            raise CommandError('Нужен хотя бы один покупатель')
+
+        category = Category.objects.create(name='Benchmark checkout', slug=BENCHMARK_PREFIX)
+        product = Product.objects.create(
+            product_name='Benchmark hot product', slug=f'{BENCHMARK_PREFIX}-hot', description='',
+            price=100, quantity=options['stock'], category=category, author=users[0],
+        )
+        Cart.objects.bulk_create([
+            Cart(author=user, product=product, quantity=options['quantity']) for user in users
+        ])
+        return users, product
+
+    def _buy(self, user):
+        """Оформляет заказ покупателя, возвращает (результат, число повторов)"""
+        retried = []
+        try:
+            # SQLite сериализует запись: при конфликте транзакция откатывается и повторяется с задержкой
+            retry_on_lock(checkout, user, 'benchmark', retries=self.retries, on_retry=retried.append)
+            return 'ok', len(retried)
+        except OutOfStockError:
+            return 'out_of_stock', len(retried)
+        except LockRetriesExceeded:
+            return 'failed', len(retried)
+        finally:
+            connection.close()
+
+    def _cleanup(self, users, product):
+        Order.objects.filter(user__in=users).delete()
+        category = product.category
+        product.delete()
+        category.delete()
+        get_user_model().objects.filter(pk__in=[user.pk for user in users]).delete()
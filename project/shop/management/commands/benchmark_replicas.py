@@ -0,0 +1,184 @@
+import json
+import logging
+import random
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from shop.db_router import get_replicas, sync_sqlite_replicas
+from shop.models import Cart, Category, Product
+from shop.view_counter import view_counter
+
+from .run_benchmarks import percentile
+from .seed_catalog import SEED_PREFIX
+
+XHR = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+MODES = ['primary', 'replicas']
+
+
+class Command(BaseCommand):
+    help = (
+        'Смешанная нагрузка чтение/запись: читатели листают каталог, писатели меняют корзины. '
+        'Сравнивает режим «все в основной базе» с чтением каталога с реплик (DATABASE_REPLICAS). '
+        'Нужны данные seed_catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--readers', type=int, default=8, help='Потоков, читающих каталог')
+        parser.add_argument('--writers', type=int, default=2, help='Потоков, изменяющих корзины')
+        parser.add_argument('--seconds', type=float, default=10, help='Длительность каждого режима')
+        parser.add_argument('--mode', action='append', choices=MODES, help='Только указанные режимы')
+        parser.add_argument('--no-sync', action='store_true',
+                            help='Не копировать основную базу в реплики перед запуском')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно выбора адресов')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+
+    def handle(self, *args, **options):
+        if not get_replicas():
+            raise CommandError('Реплики не настроены: задайте DATABASE_REPLICAS (пути к файлам SQLite)')
+        if options['readers'] < 0 or options['writers'] < 0 or options['readers'] + options['writers'] < 1:
+            raise CommandError('Нужен хотя бы один поток')
+        self.options = options
+        self.host = next(
+            (h for h in settings.ALLOWED_HOSTS if h not in ('*', '') and not h.startswith('.')), 'localhost'
+        )
+        self._prepare()
+
+        if not options['no_sync']:
+            copied = sync_sqlite_replicas()
+            self.stdout.write(f'Основная база скопирована в реплики: {", ".join(copied) or "-"}')
+
+        results = {}
+        # Трассировки ошибок запросов (например, database is locked) не смешиваются со сводкой: они считаются
+        request_logger = logging.getLogger('django.request')
+        request_logger_disabled, request_logger.disabled = request_logger.disabled, True
+        try:
+            for mode in options['mode'] or MODES:
+                replicas = get_replicas() if mode == 'replicas' else []
+                with override_settings(DATABASE_REPLICAS=replicas):
+                    results[mode] = self._run()
+                self._print(mode, results[mode])
+        finally:
+            request_logger.disabled = request_logger_disabled
+            view_counter.flush()
+            Cart.objects.filter(author__in=self.users).delete()
+
+        if 'primary' in results and 'replicas' in results and results['primary']['reads']['rps']:
+            errors = sum(result[kind]['errors'] for result in results.values() for kind in result)
+            if errors:
+                self.stdout.write(self.style.WARNING(
+                    f'Сравнение не выводится: в прогонах {errors} ошибочных ответов, '
+                    'пропускная способность не сопоставима'
+                ))
+            else:
+                ratio = results['replicas']['reads']['rps'] / results['primary']['reads']['rps']
+                self.stdout.write(self.style.SUCCESS(f'Чтения с репликами / без: {ratio:.2f}x'))
+
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump({'options': {key: options[key] for key in (
+                    'readers', 'writers', 'seconds', 'seed',
+                )}, 'replicas': get_replicas(), 'results': results}, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def _prepare(self):
+        count = self.options['readers'] + self.options['writers']
+        self.users = list(
+            get_user_model().objects.filter(email__startswith=f'{SEED_PREFIX}-user-').order_by('pk')[:count]
+        )
+        if len(self.users) < count:
+            raise CommandError(f'Нужно {count} пользователей seed_catalog, найдено {len(self.users)}')
+        products = Product.objects.filter(is_active=True)
+        self.product_ids = list(products.order_by('pk').values_list('pk', flat=True)[:2000])
+        self.slugs = list(products.order_by('pk').values_list('slug', flat=True)[:2000])
+        self.categories = list(
+            Category.objects.filter(active_products_count__gt=0).values_list('slug', flat=True)
+        )
+        if not self.product_ids or not self.categories:
+            raise CommandError('Каталог пуст: заполните его командой seed_catalog')
+        words = {
+            word for name in products.values_list('product_name', flat=True)[:200]
+            for word in name.lower().split() if not word.isdigit()
+        }
+        self.words = sorted(words)
+
+    def _read_path(self, rng):
+        scenario = rng.randrange(4)
+        if scenario == 0:
+            return reverse('shop:home') + f'?page={rng.randint(1, 4)}'
+        if scenario == 1:
+            return reverse('shop:category_products', args=[rng.choice(self.categories)])
+        if scenario == 2:
+            return reverse('shop:search') + f'?q={rng.choice(self.words)}'
+        return reverse('shop:product_detail', args=[rng.choice(self.slugs)])
+
+    def _run(self):
+        deadline = time.perf_counter() + self.options['seconds']
+        lock = threading.Lock()
+        timings = {'reads': [], 'writes': []}
+        errors = {'reads': 0, 'writes': 0}
+
+        def worker(index, user, writer):
+            rng = random.Random(self.options['seed'] * 1000 + index)
+            # Ошибки (например, database is locked) считаем, а не прерываем замер
+            client = Client(HTTP_HOST=self.host, raise_request_exception=False)
+            client.force_login(user)
+            kind = 'writes' if writer else 'reads'
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    if writer:
+                        # Итоговые количества 0..2: корзина не растет бесконечно
+                        items = [{'product_id': pk, 'quantity': rng.randint(0, 2)}
+                                 for pk in rng.sample(self.product_ids, min(3, len(self.product_ids)))]
+                        response = client.post(reverse('shop:update_cart_batch'), json.dumps({'items': items}),
+                                               content_type='application/json', **XHR)
+                    else:
+                        response = client.get(self._read_path(rng))
+                    elapsed = time.perf_counter() - started
+                    with lock:
+                        timings[kind].append(elapsed)
+                        errors[kind] += response.status_code >= 400
+            finally:
+                connections.close_all()
+
+        started = time.perf_counter()
+        readers = self.options['readers']
+        with ThreadPoolExecutor(max_workers=len(self.users)) as executor:
+            futures = [
+                executor.submit(worker, index, user, index >= readers) for index, user in enumerate(self.users)
+            ]
+            for future in futures:
+                future.result()
+        elapsed = time.perf_counter() - started
+        return {kind: self._summarize(timings[kind], errors[kind], elapsed) for kind in timings}
+
+    def _summarize(self, timings, errors, elapsed):
+        timings_ms = [timing * 1000 for timing in timings]
+        return {
+            'requests': len(timings),
+            'errors': errors,
+            'rps': round(len(timings) / elapsed, 1) if elapsed else None,
+            'mean_ms': round(statistics.fmean(timings_ms), 3) if timings_ms else None,
+            'p50_ms': round(percentile(timings_ms, 50), 3) if timings_ms else None,
+            'p95_ms': round(percentile(timings_ms, 95), 3) if timings_ms else None,
+        }
+
+    def _print(self, mode, result):
+        for kind, label in (('reads', 'чтение'), ('writes', 'запись')):
+            summary = result[kind]
+            if not summary['requests']:
+                continue
+            self.stdout.write(
+                f'{mode:<9} {label:<7} {summary["rps"]:8.1f} запр/с  p50 {summary["p50_ms"]:8.2f} мс  '
+                f'p95 {summary["p95_ms"]:8.2f} мс'
+                + (self.style.ERROR(f'  ошибок {summary["errors"]}') if summary['errors'] else '')
+            )
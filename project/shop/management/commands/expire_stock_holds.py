@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.models import Product
+from shop.reservations import expire_holds
+
+
+class Command(BaseCommand):
+    help = 'Снимает просроченные резервы остатка (StockHold) пачками; запускать периодически'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Резервов в одной транзакции')
+        parser.add_argument('--recount', action='store_true',
+                            help='Затем пересчитать reserved_quantity всех товаров по таблице резервов')
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть положительным')
+        expired = expire_holds(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Снято просроченных резервов: {expired}'))
+        if options['recount']:
+            self.stdout.write(f'Пересчитано товаров: {Product.recount_reserved()}')
@@ -0,0 +1,60 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from shop.catalog_io import FORMATS, RowWriter, detect_format
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        'Выгружает товары в CSV или JSONL потоково: строки читаются из базы порциями '
+        '(iterator) и сразу пишутся в файл. Формат совместим с import_products'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для выгрузки, "-" - стандартный вывод')
+        parser.add_argument('--format', choices=FORMATS, help='Формат (по умолчанию по расширению файла)')
+        parser.add_argument('--delimiter', default=',', help='Разделитель полей CSV')
+        parser.add_argument('--chunk-size', type=int, default=2000, help='Строк в одной порции чтения из базы')
+        parser.add_argument('--category', help='Выгрузить только категорию с этим slug')
+        parser.add_argument('--active-only', action='store_true', help='Только активные товары')
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        products = Product.objects.order_by('pk')
+        if options['category']:
+            products = products.filter(category__slug=options['category'])
+        if options['active_only']:
+            products = products.filter(is_active=True)
+        rows = products.values(
+            'slug', 'product_name', 'description', 'price', 'quantity',
+            'discount_percent', 'is_active', 'image', category_slug=F('category__slug'),
+        ).iterator(chunk_size=options['chunk_size'])
+
+        started = time.perf_counter()
+        to_stdout = options['path'] == '-'
+        try:
+            stream = sys.stdout if to_stdout else open(options['path'], 'w', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть {options["path"]}: {e}')
+
+        exported = 0
+        try:
+            writer = RowWriter(stream, fmt, options['delimiter'])
+            for row in rows:
+                row['category'] = row.pop('category_slug')
+                row['is_active'] = int(row['is_active'])
+                writer.write(row)
+                exported += 1
+        finally:
+            if not to_stdout:
+                stream.close()
+
+        if not to_stdout:
+            elapsed = time.perf_counter() - started
+            self.stdout.write(self.style.SUCCESS(
+                f'Выгружено товаров: {exported} за {elapsed:.1f} с ({exported / max(elapsed, 1e-9):.0f} строк/с)'
+            ))
@@ -0,0 +1,37 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from shop.models import Product, ProductImages
+from shop.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии (WebP/JPEG) изображений товаров'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать существующие копии')
+        parser.add_argument('--workers', type=int, default=4, help='Число параллельных потоков')
+
+    def handle(self, *args, **options):
+        image_names = set(Product.objects.values_list('image', flat=True))
+        image_names.update(ProductImages.objects.values_list('image', flat=True))
+        image_names.discard('')
+
+        def generate(image_name):
+            try:
+                return image_name, generate_thumbnails(image_name, force=options['force']), None
+            except Exception as e:
+                return image_name, 0, e
+
+        written = failed = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as executor:
+            for image_name, count, error in executor.map(generate, sorted(image_names)):
+                if error is not None:
+                    failed += 1
+                    self.stderr.write(f'{image_name}: {error}')
+                written += count
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Изображений: {len(image_names)}, создано копий: {written}, ошибок: {failed}'
+        ))
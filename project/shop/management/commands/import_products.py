@@ -0,0 +1,240 @@
+import os
+import sys
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.files import File
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from shop import search
+from shop.cache import bump_catalog_version, invalidate_sidebar
+from shop.catalog_io import FORMATS, SLUG_MAX_LENGTH, detect_format, make_slug, parse_bool, read_rows
+from shop.models import Category, Product
+
+REQUIRED_FOR_CREATE = ('product_name', 'price', 'category_id')
+SLUG_SUFFIX_CHARS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+
+class RowError(ValueError):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Загружает товары из CSV или JSONL потоково, пачками bulk_create/bulk_update. '
+        'Товары с существующим slug обновляются (только переданные поля), остальные создаются; '
+        'slug без запросов на каждую строку генерируется из названия'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл для загрузки, "-" - стандартный ввод')
+        parser.add_argument('--format', choices=FORMATS, help='Формат (по умолчанию по расширению файла)')
+        parser.add_argument('--delimiter', default=',', help='Разделитель полей CSV')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Строк в одной пачке записи')
+        parser.add_argument('--author', help='Email автора новых товаров (по умолчанию первый суперпользователь)')
+        parser.add_argument('--images-dir',
+                            help='Каталог с файлами из колонки image; без него image - имя уже сохраненного файла')
+        parser.add_argument('--create-categories', action='store_true',
+                            help='Создавать отсутствующие категории вместо пропуска строки')
+        parser.add_argument('--max-errors', type=int, default=20, help='Сколько ошибок строк выводить')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.author_id = self._get_author_id(options['author'])
+        self._load_categories()
+        self.stats = {'created': 0, 'updated': 0, 'errors': 0}
+        self.touched_categories = set()
+
+        fmt = detect_format(options['path'], options['format'])
+        from_stdin = options['path'] == '-'
+        try:
+            stream = sys.stdin if from_stdin else open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть {options["path"]}: {e}')
+
+        started = time.perf_counter()
+        batch = []
+        try:
+            for line, row in read_rows(stream, fmt, options['delimiter']):
+                try:
+                    batch.append((line, self._parse(row)))
+                except (RowError, ValueError, TypeError, AttributeError) as e:
+                    self._error(line, e)
+                if len(batch) >= options['batch_size']:
+                    self._write_batch(batch)
+                    batch = []
+            if batch:
+                self._write_batch(batch)
+        finally:
+            if not from_stdin:
+                stream.close()
+
+        # Пачки пишутся мимо сигналов: счетчики категорий и кэши обновляем один раз в конце
+        Category.recount_active_products(self.touched_categories)
+        invalidate_sidebar()
+        bump_catalog_version()
+
+        elapsed = time.perf_counter() - started
+        processed = self.stats['created'] + self.stats['updated']
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: {self.stats["created"]}, обновлено: {self.stats["updated"]}, '
+            f'ошибок: {self.stats["errors"]}, время: {elapsed:.1f} с '
+            f'({processed / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
+        if options['images_dir']:
+            self.stdout.write('Уменьшенные копии новых изображений создаст команда generate_thumbnails')
+
+    def _get_author_id(self, email):
+        User = get_user_model()
+        users = User.objects.filter(email=email) if email else User.objects.filter(is_superuser=True)
+        author_id = users.order_by('pk').values_list('pk', flat=True).first()
+        if author_id is None:
+            raise CommandError('Не найден автор новых товаров, укажите --author')
+        return author_id
+
+    def _load_categories(self):
+        # Категорий немного: держим в памяти соответствие slug и названия идентификатору
+        self.categories = {}
+        for pk, slug, name in Category.objects.values_list('pk', 'slug', 'name'):
+            self.categories[slug] = pk
+            self.categories.setdefault(name.lower(), pk)
+
+    def _resolve_category(self, value):
+        value = str(value).strip()
+        category_id = self.categories.get(value) or self.categories.get(value.lower())
+        if category_id is not None:
+            return category_id
+        if not value or not self.options['create_categories']:
+            raise RowError(f'неизвестная категория {value!r}')
+        slug = make_slug(value)
+        if slug in self.categories:
+            slug = make_slug(value, get_random_string(4, SLUG_SUFFIX_CHARS))
+        category = Category.objects.create(name=value[:50], slug=slug)
+        self.categories[slug] = self.categories[value.lower()] = category.pk
+        return category.pk
+
+    def _parse(self, row):
+        """Переданные в строке поля товара с приведенными типами"""
+        data = {}
+        for column, value in row.items():
+            # Пустая ячейка CSV означает «не менять» (кроме описания)
+            if value is None or column is None or value == '' and column != 'description':
+                continue
+            if column == 'slug':
+                value = str(value).strip()
+                if len(value) > SLUG_MAX_LENGTH:
+                    raise RowError(f'slug длиннее {SLUG_MAX_LENGTH} символов')
+                if value:
+                    data['slug'] = value
+            elif column == 'product_name':
+                value = str(value).strip()
+                if not value or len(value) > 50:
+                    raise RowError('название пустое или длиннее 50 символов')
+                data['product_name'] = value
+            elif column == 'description':
+                data['description'] = str(value)
+            elif column == 'category':
+                data['category_id'] = self._resolve_category(value)
+            elif column in ('price', 'quantity', 'discount_percent'):
+                value = int(value)
+                if column == 'price' and value < 1 or value < 0 or column == 'discount_percent' and value > 99:
+                    raise RowError(f'недопустимое значение {column}: {value}')
+                data[column] = value
+            elif column == 'is_active':
+                data['is_active'] = parse_bool(value)
+            elif column == 'image':
+                data['image'] = str(value).strip()
+        return data
+
+    def _error(self, line, error):
+        self.stats['errors'] += 1
+        if self.stats['errors'] <= self.options['max_errors']:
+            self.stderr.write(f'Строка {line}: {error}')
+
+    def _write_batch(self, batch):
+        # Один запрос на пачку: какие из переданных slug уже есть в базе
+        slugs = {data['slug'] for _, data in batch if 'slug' in data}
+        existing = {product.slug: product for product in Product.objects.filter(slug__in=slugs)}
+        now = timezone.now()
+        to_create = {}
+        unnamed = []
+        to_update = {}
+        update_fields = set()
+
+        for line, data in batch:
+            product = existing.get(data.get('slug')) or to_create.get(data.get('slug'))
+            if product is not None and product.pk:
+                # Счетчики пересчитываются и для прежней категории товара
+                self.touched_categories.add(product.category_id)
+                update_fields.update(field for field in data if field not in ('slug', 'image'))
+                to_update[product.pk] = product
+            elif product is None:
+                missing = [field for field in REQUIRED_FOR_CREATE if field not in data]
+                if missing:
+                    self._error(line, RowError(f'для нового товара не хватает полей: {", ".join(missing)}'))
+                    continue
+                product = Product(author_id=self.author_id, description='')
+                if 'slug' in data:
+                    to_create[data['slug']] = product
+                else:
+                    unnamed.append(product)
+
+            for field, value in data.items():
+                if field != 'image':
+                    setattr(product, field, value)
+            if 'image' in data and self._attach_image(line, product, data['image']) and product.pk:
+                update_fields.add('image')
+            self.touched_categories.add(product.category_id)
+
+        created = list(to_create.values()) + unnamed
+        self._assign_slugs(unnamed, reserved=slugs)
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(created)
+                if to_update and update_fields:
+                    for product in to_update.values():
+                        product.time_update = now
+                    Product.objects.bulk_update(to_update.values(), [*update_fields, 'time_update'])
+        except IntegrityError as e:
+            raise CommandError(f'Ошибка записи пачки строк {batch[0][0]}-{batch[-1][0]}: {e}')
+
+        search.index_products([product.pk for product in created] + list(to_update))
+        self.stats['created'] += len(created)
+        self.stats['updated'] += len(to_update)
+
+    def _assign_slugs(self, products, reserved):
+        """
+        Уникальные slug для товаров без него: кандидаты всей пачки проверяются одним
+        запросом, занятым добавляется случайный суффикс и проверка повторяется.
+        """
+        used = set(reserved)
+        pending = {i: make_slug(product.product_name) for i, product in enumerate(products)}
+        while pending:
+            taken = used | set(
+                Product.objects.filter(slug__in=set(pending.values())).values_list('slug', flat=True)
+            )
+            retry = {}
+            for i, slug in pending.items():
+                if slug in taken:
+                    retry[i] = make_slug(products[i].product_name, get_random_string(6, SLUG_SUFFIX_CHARS))
+                else:
+                    products[i].slug = slug
+                    used.add(slug)
+                    taken.add(slug)
+            pending = retry
+
+    def _attach_image(self, line, product, name):
+        """Сохраняет файл изображения в хранилище; возвращает True, если изображение задано"""
+        if not self.options['images_dir']:
+            product.image = name
+            return True
+        path = os.path.join(self.options['images_dir'], name)
+        if not os.path.isfile(path):
+            self.stderr.write(f'Строка {line}: нет файла изображения {path}, оставлено прежнее')
+            return False
+        with open(path, 'rb') as source:
+            product.image.save(os.path.basename(name), File(source), save=False)
+        return True
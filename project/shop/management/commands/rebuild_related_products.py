@@ -0,0 +1,162 @@
+from collections import Counter, defaultdict
+from itertools import groupby, permutations
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from accounts.models import Order, OrderItem
+from shop.cache import bump_catalog_version
+from shop.models import JobCheckpoint, Product, RelatedProduct, SimilarProduct
+
+CHECKPOINT_NAME = 'related_products'
+FALLBACK_CHUNK_SIZE = 2000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает связанные товары по совместным покупкам. Обрабатываются только '
+        'заказы, появившиеся после прошлого запуска; товарам без истории покупок '
+        'подбираются похожие по описанию и популярные товары из той же категории'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать по всем заказам с нуля')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Заказов в одной транзакции')
+        parser.add_argument('--no-fallback', action='store_true',
+                            help='Не подбирать похожие товары и товары из категории')
+
+    def handle(self, *args, **options):
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+        if options['full']:
+            RelatedProduct.objects.all().delete()
+            checkpoint.last_id = 0
+
+        # Заказы, созданные во время работы команды, достанутся следующему запуску
+        max_id = Order.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+        orders = 0
+        pairs = 0
+        while checkpoint.last_id < max_id:
+            batch_orders, batch_pairs = self._process_batch(checkpoint, max_id, options['batch_size'])
+            orders += batch_orders
+            pairs += batch_pairs
+
+        fallback = 0
+        if not options['no_fallback']:
+            fallback = self._rebuild_fallback(getattr(settings, 'RELATED_PRODUCTS_LIMIT', 4))
+
+        checkpoint.last_run = timezone.now()
+        checkpoint.save(update_fields=['last_id', 'last_run'])
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обработано заказов: {orders}, обновлено пар: {pairs}, '
+            f'подобрано похожих и из категорий: {fallback}, последний заказ: {checkpoint.last_id}'
+        ))
+
+    def _process_batch(self, checkpoint, max_id, batch_size):
+        order_ids = list(
+            Order.objects.filter(pk__gt=checkpoint.last_id, pk__lte=max_id)
+            .order_by('pk').values_list('pk', flat=True)[:batch_size]
+        )
+        items = (
+            OrderItem.objects.filter(order_id__in=order_ids)
+            .exclude(order__status='cancelled')
+            .order_by('order_id')
+            .values_list('order_id', 'product_id')
+        )
+
+        pairs = Counter()
+        for _, rows in groupby(items, key=lambda row: row[0]):
+            products = {product_id for _, product_id in rows}
+            pairs.update(permutations(products, 2))
+
+        with transaction.atomic():
+            self._apply_pairs(pairs)
+            checkpoint.last_id = order_ids[-1]
+            checkpoint.save(update_fields=['last_id'])
+        return len(order_ids), len(pairs)
+
+    def _apply_pairs(self, pairs):
+        """Прибавляет счетчики совместных покупок к уже накопленным одной пакетной вставкой"""
+        if not pairs:
+            return
+        by_product = defaultdict(list)
+        for product_id, related_id in pairs:
+            by_product[product_id].append(related_id)
+
+        existing = {
+            (product_id, related_id): score
+            for product_id, related_id, score in RelatedProduct.objects.filter(
+                product_id__in=by_product, source='orders'
+            ).values_list('product_id', 'related_id', 'score')
+        }
+        RelatedProduct.objects.bulk_create(
+            [
+                RelatedProduct(
+                    product_id=product_id, related_id=related_id, source='orders',
+                    score=existing.get((product_id, related_id), 0) + count,
+                )
+                for (product_id, related_id), count in pairs.items()
+            ],
+            update_conflicts=True,
+            unique_fields=['product', 'related'],
+            update_fields=['score', 'source'],
+            batch_size=1000,
+        )
+
+    def _rebuild_fallback(self, limit):
+        """
+        Товарам, у которых меньше limit совместных покупок, добавляет похожие
+        по описанию (SimilarProduct), а затем популярные товары из категории
+        """
+        RelatedProduct.objects.filter(source__in=['similar', 'category']).delete()
+
+        order_counts = dict(
+            RelatedProduct.objects.filter(source='orders').values('product_id')
+            .annotate(total=Count('pk')).values_list('product_id', 'total')
+        )
+        products = Product.objects.filter(is_active=True)
+        top_by_category = {
+            category_id: list(
+                products.filter(category_id=category_id)
+                .order_by('-views', '-id').values_list('pk', flat=True)[:limit + 1]
+            )
+            for category_id in products.order_by().values_list('category_id', flat=True).distinct()
+        }
+        needing = [
+            (product_id, category_id)
+            for product_id, category_id in products.values_list('pk', 'category_id')
+            if order_counts.get(product_id, 0) < limit
+        ]
+
+        created = 0
+        for start in range(0, len(needing), FALLBACK_CHUNK_SIZE):
+            chunk = needing[start:start + FALLBACK_CHUNK_SIZE]
+            similar = defaultdict(list)
+            for product_id, similar_id in SimilarProduct.objects.filter(
+                product_id__in=[product_id for product_id, _ in chunk], similar__is_active=True
+            ).order_by('product_id', '-score').values_list('product_id', 'similar_id'):
+                similar[product_id].append(similar_id)
+
+            links = []
+            for product_id, category_id in chunk:
+                missing = limit - order_counts.get(product_id, 0)
+                candidates = [(pk, 'similar') for pk in similar[product_id]]
+                candidates += [(pk, 'category') for pk in top_by_category[category_id]]
+                seen = {product_id}
+                for related_id, source in candidates:
+                    if missing <= 0:
+                        break
+                    if related_id in seen:
+                        continue
+                    seen.add(related_id)
+                    links.append(RelatedProduct(product_id=product_id, related_id=related_id,
+                                                source=source, score=0))
+                    missing -= 1
+
+            # Пары, уже связанные покупками, остаются с источником orders
+            RelatedProduct.objects.bulk_create(links, ignore_conflicts=True, batch_size=1000)
+            created += len(links)
+        return created
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from shop.search import is_supported, rebuild_search_index
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает полнотекстовый индекс товаров (SQLite FTS5)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Размер пачки при индексации')
+        parser.add_argument('--database', default='default', help='Алиас базы данных')
+
+    def handle(self, *args, **options):
+        if not is_supported(options['database']):
+            self.stdout.write(self.style.WARNING('Полнотекстовый индекс поддерживается только для SQLite'))
+            return
+        total = rebuild_search_index(batch_size=options['batch_size'], using=options['database'])
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано товаров: {total}'))
@@ -0,0 +1,160 @@
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from shop.cache import bump_catalog_version
+from shop.models import JobCheckpoint, Product, SimilarProduct
+from shop.similarity import TfidfIndex, is_available
+
+CHECKPOINT_NAME = 'similar_products'
+WRITE_BATCH_SIZE = 5000
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие товары по TF-IDF названия, описания и категории. '
+        'По умолчанию обновляет только списки товаров, измененных после прошлого запуска, '
+        'и списки, в которые эти товары теперь попадают'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Пересчитать списки всех товаров')
+        parser.add_argument('--top-k', type=int, default=getattr(settings, 'SIMILAR_PRODUCTS_LIMIT', 10),
+                            help='Сколько похожих товаров хранить для каждого')
+        parser.add_argument('--block-size', type=int, default=500,
+                            help='Строк матрицы в одном произведении (ограничивает память)')
+        parser.add_argument('--min-score', type=float, default=0.05, help='Минимальная косинусная близость')
+        parser.add_argument('--min-df', type=int, default=2, help='Минимальное число товаров со словом')
+        parser.add_argument('--max-df', type=float, default=0.5, help='Максимальная доля товаров со словом')
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('Для расчета похожих товаров установите numpy и scipy')
+
+        self.options = options
+        started_at = timezone.now()
+        started = time.perf_counter()
+        checkpoint, _ = JobCheckpoint.objects.get_or_create(name=CHECKPOINT_NAME)
+
+        rows = Product.objects.filter(is_active=True).order_by('pk').values(
+            'pk', 'product_name', 'description', 'category__name'
+        ).iterator(chunk_size=2000)
+        index = TfidfIndex.build(rows, min_df=options['min_df'], max_df=options['max_df'])
+        self.stdout.write(
+            f'Матрица: {index.matrix.shape[0]} товаров x {index.matrix.shape[1]} слов, '
+            f'{index.matrix.nnz} ненулевых, {time.perf_counter() - started:.1f} с'
+        )
+
+        if options['full'] or checkpoint.last_run is None:
+            SimilarProduct.objects.all().delete()
+            updated = self._write_lists(index.neighbours(
+                range(len(index)), options['top_k'], options['min_score'], options['block_size']
+            ))
+        else:
+            updated = self._refresh_changed(index, checkpoint.last_run)
+
+        # Изменения во время расчета попадут в следующий запуск
+        checkpoint.last_run = started_at
+        checkpoint.save(update_fields=['last_run'])
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено списков: {updated}, время: {time.perf_counter() - started:.1f} с'
+        ))
+
+    def _write_lists(self, lists):
+        """Заменяет списки похожих товаров пачками, возвращает число обработанных товаров"""
+        count = 0
+        batch = {}
+        for product_id, neighbours in lists:
+            batch[product_id] = neighbours
+            count += 1
+            if len(batch) * self.options['top_k'] >= WRITE_BATCH_SIZE:
+                self._replace(batch)
+                batch = {}
+        if batch:
+            self._replace(batch)
+        return count
+
+    def _replace(self, lists):
+        with transaction.atomic():
+            SimilarProduct.objects.filter(product_id__in=lists).delete()
+            SimilarProduct.objects.bulk_create([
+                SimilarProduct(product_id=product_id, similar_id=similar_id, score=score)
+                for product_id, neighbours in lists.items()
+                for similar_id, score in neighbours
+            ], batch_size=1000)
+
+    def _refresh_changed(self, index, since):
+        changed = set(Product.objects.filter(time_update__gt=since).values_list('pk', flat=True))
+        if not changed:
+            return 0
+
+        # Снятые с продажи товары не участвуют в списках
+        inactive = [pk for pk in changed if pk not in index.row_by_id]
+        SimilarProduct.objects.filter(product_id__in=inactive).delete()
+        SimilarProduct.objects.filter(similar_id__in=inactive).delete()
+
+        rows = sorted(index.row_by_id[pk] for pk in changed if pk in index.row_by_id)
+        updated = self._write_lists(index.neighbours(
+            rows, self.options['top_k'], self.options['min_score'], self.options['block_size']
+        ))
+
+        block_size = self.options['block_size']
+        for start in range(0, len(rows), block_size):
+            updated += self._update_other_lists(index, rows[start:start + block_size], changed)
+        return updated
+
+    def _update_other_lists(self, index, rows, changed):
+        """
+        Встраивает измененные товары в списки остальных товаров. Списки, из которых
+        товар блока выпал, пересчитываются целиком, чтобы в них снова было top-k соседей.
+        """
+        top_k, min_score = self.options['top_k'], self.options['min_score']
+        candidates = defaultdict(dict)
+        block_ids = set()
+        for product_id, scores in index.similarity_to(rows, self.options['block_size']):
+            block_ids.add(product_id)
+            for other_id, score in scores.items():
+                if other_id in changed or score <= min_score:
+                    continue
+                other = candidates[other_id]
+                other[product_id] = score
+                if len(other) > top_k * 2:
+                    candidates[other_id] = dict(sorted(other.items(), key=lambda item: -item[1])[:top_k])
+
+        affected = set(candidates)
+        affected.update(SimilarProduct.objects.filter(similar_id__in=block_ids).values_list('product_id', flat=True))
+        affected -= changed
+
+        current = defaultdict(dict)
+        for product_id, similar_id, score in SimilarProduct.objects.filter(
+            product_id__in=affected
+        ).values_list('product_id', 'similar_id', 'score'):
+            current[product_id][similar_id] = score
+
+        new_lists = {}
+        recompute = []
+        for product_id in affected:
+            if product_id not in index.row_by_id:
+                continue
+            new_scores = candidates.get(product_id, {})
+            previous = current[product_id]
+            if any(similar_id in block_ids and similar_id not in new_scores for similar_id in previous):
+                # Товар блока выпал из списка - на его место может встать кто угодно
+                recompute.append(index.row_by_id[product_id])
+                continue
+            merged = {similar_id: score for similar_id, score in previous.items() if similar_id not in block_ids}
+            merged.update(new_scores)
+            top = sorted(merged.items(), key=lambda item: -item[1])[:top_k]
+            if dict(top) != previous:
+                new_lists[product_id] = top
+
+        updated = self._write_lists(new_lists.items())
+        updated += self._write_lists(index.neighbours(
+            sorted(recompute), top_k, min_score, self.options['block_size']
+        ))
+        return updated
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from shop.cache import bump_catalog_version, invalidate_sidebar
+from shop.models import Category
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает число активных товаров всех категорий (active_products_count)'
+
+    def handle(self, *args, **options):
+        updated = Category.recount_active_products()
+        invalidate_sidebar()
+        bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано категорий: {updated}'))
@@ -0,0 +1,406 @@
+import json
+import platform
+import random
+import re
+import statistics
+import subprocess
+import time
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from shop.models import Cart, Category, Product
+from shop.view_counter import view_counter
+
+XHR = {'HTTP_X_REQUESTED_WITH': 'XMLHttpRequest'}
+
+# Сценарий: (имя, нужен ли вход, метод подготовки запроса)
+SCENARIOS = [
+    ('home', False, 'request_home'),
+    ('home_sorted', False, 'request_home_sorted'),
+    ('category', False, 'request_category'),
+    ('category_filtered', False, 'request_category_filtered'),
+    ('search', False, 'request_search'),
+    ('search_in_category', False, 'request_search_in_category'),
+    ('product_detail', False, 'request_product_detail'),
+    ('cart_view', True, 'request_cart_view'),
+    ('cart_add', True, 'request_cart_add'),
+    ('cart_update', True, 'request_cart_update'),
+    ('cart_batch', True, 'request_cart_batch'),
+    ('cart_remove', True, 'request_cart_remove'),
+]
+SCENARIO_NAMES = [name for name, _, _ in SCENARIOS]
+
+# Метрики, рост которых считается регрессией при сравнении
+COMPARED_METRICS = ['p95_ms', 'queries', 'rows_scanned']
+
+
+def percentile(values, percent):
+    """Перцентиль с линейной интерполяцией между соседними значениями"""
+    values = sorted(values)
+    if not values:
+        return None
+    position = (len(values) - 1) * percent / 100
+    low = int(position)
+    high = min(low + 1, len(values) - 1)
+    return values[low] + (values[high] - values[low]) * (position - low)
+
+
+class QueryPlanInspector:
+    """
+    Оценка объема прочитанных строк по планам запросов.
+
+    PostgreSQL: EXPLAIN ANALYZE, фактические строки всех узлов-сканов (с учетом
+    отброшенных фильтром). SQLite: EXPLAIN QUERY PLAN, число полных проходов по
+    таблицам и сумма их размеров - верхняя оценка, LIMIT может остановить проход раньше.
+    """
+    ALIAS_RE = re.compile(r'"(\w+)" (?:AS )?"?([A-Z]\d+)"?')
+    SCAN_RE = re.compile(r'^SCAN (\w+)')
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.vendor = connection.vendor
+        self._plans = {}
+        self._table_rows = {}
+
+    @property
+    def supported(self):
+        return self.vendor in ('sqlite', 'postgresql')
+
+    def inspect(self, sql):
+        """Возвращает {'rows_scanned', 'full_scans', 'temp_sorts'} или None, если план недоступен"""
+        if not sql.lstrip().upper().startswith('SELECT'):
+            return None
+        if sql not in self._plans:
+            try:
+                if self.vendor == 'sqlite':
+                    self._plans[sql] = self._inspect_sqlite(sql)
+                else:
+                    self._plans[sql] = self._inspect_postgresql(sql)
+            except DatabaseError:
+                self._plans[sql] = None
+        return self._plans[sql]
+
+    def _inspect_sqlite(self, sql):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            steps = [row[-1] for row in cursor.fetchall()]
+        tables = self._tables()
+        aliases = {alias: table for table, alias in self.ALIAS_RE.findall(sql)}
+        result = {'rows_scanned': 0, 'full_scans': 0, 'temp_sorts': 0}
+        for step in steps:
+            if step.startswith('USE TEMP B-TREE'):
+                result['temp_sorts'] += 1
+            match = self.SCAN_RE.match(step)
+            if not match:
+                continue
+            table = aliases.get(match.group(1), match.group(1))
+            if table in tables:
+                result['full_scans'] += 1
+                result['rows_scanned'] += self._table_size(table)
+        return result
+
+    def _inspect_postgresql(self, sql):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (ANALYZE, FORMAT JSON) {sql}')
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        result = {'rows_scanned': 0, 'full_scans': 0, 'temp_sorts': 0}
+        nodes = [plan[0]['Plan']]
+        while nodes:
+            node = nodes.pop()
+            nodes.extend(node.get('Plans', []))
+            node_type = node['Node Type']
+            if node_type == 'Sort' and node.get('Sort Space Type') == 'Disk':
+                result['temp_sorts'] += 1
+            if 'Scan' not in node_type:
+                continue
+            if node_type == 'Seq Scan':
+                result['full_scans'] += 1
+            rows = node.get('Actual Rows', 0) + node.get('Rows Removed by Filter', 0)
+            result['rows_scanned'] += int(rows * node.get('Actual Loops', 1))
+        return result
+
+    def _tables(self):
+        if not hasattr(self, '_table_names'):
+            self._table_names = set(self.connection.introspection.table_names())
+        return self._table_names
+
+    def _table_size(self, table):
+        if table not in self._table_rows:
+            with self.connection.cursor() as cursor:
+                cursor.execute(f'SELECT COUNT(*) FROM "{table}"')
+                self._table_rows[table] = cursor.fetchone()[0]
+        return self._table_rows[table]
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный прогон страниц каталога, поиска, карточки товара и корзины через тестовый клиент: '
+        'p50/p95/p99, запросы к базе и прочитанные строки на запрос. Результаты пишутся в JSON '
+        'и сравниваются с предыдущим прогоном (--compare). Данные можно создать командой seed_catalog'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Измеряемых запросов на сценарий')
+        parser.add_argument('--warmup', type=int, default=5, help='Прогревочных запросов на сценарий')
+        parser.add_argument('--scenario', action='append', choices=SCENARIO_NAMES,
+                            help='Запустить только указанные сценарии (можно несколько раз)')
+        parser.add_argument('--authenticated', action='store_true',
+                            help='Страницы каталога запрашивать от имени пользователя (мимо кэша страниц)')
+        parser.add_argument('--cold-cache', action='store_true', help='Очищать кэш перед каждым запросом')
+        parser.add_argument('--user', help='Email пользователя для корзины (по умолчанию первый из seed_catalog)')
+        parser.add_argument('--explain-samples', type=int, default=5,
+                            help='Сколько последних запросов сценария разбирать по планам (0 - не разбирать)')
+        parser.add_argument('--seed', type=int, default=1, help='Зерно выбора товаров и категорий')
+        parser.add_argument('--output', help='Файл для результатов в JSON')
+        parser.add_argument('--compare', help='JSON предыдущего прогона для сравнения')
+        parser.add_argument('--threshold', type=float, default=10.0,
+                            help='Рост метрики в процентах, после которого она считается регрессией')
+        parser.add_argument('--fail-on-regression', action='store_true',
+                            help='Завершиться с ошибкой, если найдены регрессии')
+
+    def handle(self, *args, **options):
+        if options['requests'] < 1:
+            raise CommandError('Нужен хотя бы один измеряемый запрос на сценарий')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self._load_fixtures()
+        self.inspector = QueryPlanInspector(connection)
+
+        anonymous = Client(HTTP_HOST=self._host())
+        authenticated = Client(HTTP_HOST=self._host())
+        authenticated.force_login(self.user)
+
+        results = {}
+        for name, needs_login, method in SCENARIOS:
+            if options['scenario'] and name not in options['scenario']:
+                continue
+            client = authenticated if needs_login or options['authenticated'] else anonymous
+            results[name] = self._run_scenario(client, getattr(self, method))
+            self._print_row(name, results[name])
+
+        Cart.objects.filter(author=self.user, product__in=self.cart_products).delete()
+        view_counter.flush()
+
+        report = {'meta': self._meta(), 'scenarios': results}
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+        if options['compare']:
+            regressions = self._compare(options['compare'], results)
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Найдено регрессий: {regressions}')
+
+    # --- Подготовка ---
+
+    def _host(self):
+        hosts = [host for host in settings.ALLOWED_HOSTS if host not in ('*', '') and not host.startswith('.')]
+        return hosts[0] if hosts else 'localhost'
+
+    def _load_fixtures(self):
+        products = Product.objects.filter(is_active=True)
+        self.categories = list(Category.objects.filter(active_products_count__gt=0).values_list('slug', flat=True))
+        self.product_slugs = list(products.order_by('pk').values_list('slug', flat=True)[:5000])
+        self.cart_products = list(products.filter(quantity__gt=0).order_by('pk').values_list('pk', flat=True)[:500])
+        if not self.categories or not self.product_slugs or not self.cart_products:
+            raise CommandError('Каталог пуст: заполните его командой seed_catalog')
+
+        names = products.order_by('?').values_list('product_name', flat=True)[:200]
+        self.search_words = sorted({word for name in names for word in name.lower().split() if not word.isdigit()})
+
+        User = get_user_model()
+        if self.options['user']:
+            self.user = User.objects.filter(email=self.options['user']).first()
+        else:
+            self.user = User.objects.filter(email__startswith='seed-').order_by('pk').first() \
+                or User.objects.order_by('pk').first()
+        if self.user is None:
+            raise CommandError('Не найден пользователь для сценариев корзины')
+        # Корзину пользователя меняют только сценарии, убираем прежние позиции тестовых товаров
+        Cart.objects.filter(author=self.user, product__in=self.cart_products).delete()
+
+    def _cart_line(self):
+        """Позиция корзины пользователя для сценариев изменения и удаления"""
+        product_id = self.rng.choice(self.cart_products)
+        line, _ = Cart.objects.get_or_create(author=self.user, product_id=product_id)
+        return line
+
+    # --- Сценарии: возвращают (метод, путь, данные, заголовки) ---
+
+    def request_home(self):
+        return 'get', reverse('shop:home'), {}, {}
+
+    def request_home_sorted(self):
+        return 'get', reverse('shop:home'), {'sort_by': self.rng.choice(['price', '-price', '-views', '-trending'])}, {}
+
+    def request_category(self):
+        return 'get', reverse('shop:category_products', args=[self.rng.choice(self.categories)]), {}, {}
+
+    def request_category_filtered(self):
+        low = self.rng.choice([0, 1000, 5000])
+        return 'get', reverse('shop:category_products', args=[self.rng.choice(self.categories)]), {
+            'min_price': low, 'max_price': low + 20000, 'sort_by': '-price',
+        }, {}
+
+    def request_search(self):
+        return 'get', reverse('shop:search'), {'q': self.rng.choice(self.search_words)}, {}
+
+    def request_search_in_category(self):
+        return 'get', reverse('shop:search'), {
+            'q': self.rng.choice(self.search_words), 'category': self.rng.choice(self.categories),
+        }, {}
+
+    def request_product_detail(self):
+        return 'get', reverse('shop:product_detail', args=[self.rng.choice(self.product_slugs)]), {}, {}
+
+    def request_cart_view(self):
+        return 'get', reverse('shop:cart'), {}, {}
+
+    def request_cart_add(self):
+        return 'post', reverse('shop:add_to_cart', args=[self.rng.choice(self.cart_products)]), {'quantity': 1}, XHR
+
+    def request_cart_update(self):
+        line = self._cart_line()
+        return 'post', reverse('shop:update_cart_quantity', args=[line.pk]), {
+            'quantity': self.rng.randint(1, 3),
+        }, XHR
+
+    def request_cart_batch(self):
+        items = [
+            {'product_id': product_id, 'quantity': self.rng.randint(0, 3)}
+            for product_id in self.rng.sample(self.cart_products, min(5, len(self.cart_products)))
+        ]
+        return 'post', reverse('shop:update_cart_batch'), json.dumps({'items': items}), {
+            'content_type': 'application/json', **XHR,
+        }
+
+    def request_cart_remove(self):
+        line = self._cart_line()
+        return 'post', reverse('shop:remove_from_cart', args=[line.pk]), {}, XHR
+
+    # --- Измерения ---
+
+    def _run_scenario(self, client, prepare):
+        options = self.options
+        timings = []
+        queries = []
+        plans = []
+        errors = 0
+        total = options['warmup'] + options['requests']
+        for i in range(total):
+            method, path, data, extra = prepare()
+            if options['cold_cache']:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                started = time.perf_counter()
+                response = getattr(client, method)(path, data, **extra)
+                elapsed = time.perf_counter() - started
+            if i < options['warmup']:
+                continue
+            if response.status_code >= 400:
+                errors += 1
+            timings.append(elapsed * 1000)
+            queries.append(len(context.captured_queries))
+            if i >= total - options['explain_samples'] and self.inspector.supported:
+                plans.append(self._inspect(context.captured_queries))
+
+        result = {
+            'requests': len(timings),
+            'errors': errors,
+            'mean_ms': round(statistics.fmean(timings), 3) if timings else None,
+            'p50_ms': self._round(percentile(timings, 50)),
+            'p95_ms': self._round(percentile(timings, 95)),
+            'p99_ms': self._round(percentile(timings, 99)),
+            'queries': round(statistics.fmean(queries), 2) if queries else None,
+            'max_queries': max(queries, default=None),
+        }
+        for key in ('rows_scanned', 'full_scans', 'temp_sorts'):
+            result[key] = round(statistics.fmean(plan[key] for plan in plans), 1) if plans else None
+        return result
+
+    def _inspect(self, captured_queries):
+        totals = {'rows_scanned': 0, 'full_scans': 0, 'temp_sorts': 0}
+        for query in captured_queries:
+            plan = self.inspector.inspect(query['sql'])
+            if plan:
+                for key in totals:
+                    totals[key] += plan[key]
+        return totals
+
+    @staticmethod
+    def _round(value):
+        return None if value is None else round(value, 3)
+
+    def _meta(self):
+        try:
+            commit = subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, timeout=5,
+            ).stdout.strip() or None
+        except (OSError, subprocess.SubprocessError):
+            commit = None
+        return {
+            'commit': commit,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'debug': settings.DEBUG,
+            'products': Product.objects.count(),
+            'options': {
+                key: self.options[key]
+                for key in ('requests', 'warmup', 'authenticated', 'cold_cache', 'seed')
+            },
+        }
+
+    # --- Вывод ---
+
+    def _print_row(self, name, result):
+        rows = '-' if result['rows_scanned'] is None else f'{result["rows_scanned"]:.0f}'
+        self.stdout.write(
+            f'{name:<20} p50 {result["p50_ms"]:8.2f} мс  p95 {result["p95_ms"]:8.2f} мс  '
+            f'p99 {result["p99_ms"]:8.2f} мс  запросов {result["queries"]:6.1f}  строк {rows:>8}'
+            + (self.style.ERROR(f'  ошибок {result["errors"]}') if result['errors'] else '')
+        )
+
+    def _compare(self, path, results):
+        """Печатает изменения относительно прошлого прогона, возвращает число регрессий"""
+        try:
+            with open(path, encoding='utf-8') as source:
+                baseline = json.load(source)
+        except (OSError, ValueError) as error:
+            raise CommandError(f'Не удалось прочитать {path}: {error}')
+
+        self.stdout.write(f'Сравнение с {path} (коммит {baseline.get("meta", {}).get("commit") or "?"}):')
+        threshold = self.options['threshold']
+        regressions = 0
+        for name, result in results.items():
+            previous = baseline.get('scenarios', {}).get(name)
+            if not previous:
+                continue
+            changes = []
+            for metric in COMPARED_METRICS:
+                old, new = previous.get(metric), result.get(metric)
+                if old is None or new is None:
+                    continue
+                delta = (new - old) / old * 100 if old else (100.0 if new else 0.0)
+                text = f'{metric} {old} -> {new} ({delta:+.0f}%)'
+                if delta > threshold:
+                    regressions += 1
+                    text = self.style.ERROR(text)
+                elif delta < -threshold:
+                    text = self.style.SUCCESS(text)
+                changes.append(text)
+            self.stdout.write(f'  {name:<20} ' + ', '.join(changes))
+        return regressions
@@ -0,0 +1,196 @@
+import random
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from accounts.models import Order, OrderItem, UserProfile
+from shop.cache import bump_catalog_version, invalidate_sidebar
+from shop.models import Cart, Category, Product
+from shop.search import is_supported, rebuild_search_index
+
+SEED_PREFIX = 'seed'
+
+# Словарь для названий и описаний: поиск и похожие товары получают осмысленный текст
+ADJECTIVES = [
+    'красный', 'синий', 'черный', 'белый', 'легкий', 'прочный', 'компактный', 'беспроводной',
+    'складной', 'детский', 'кожаный', 'деревянный', 'стальной', 'мягкий', 'теплый', 'влагостойкий',
+]
+NOUNS = [
+    'рюкзак', 'чайник', 'фонарь', 'стул', 'зонт', 'плед', 'термос', 'светильник', 'наушники',
+    'кресло', 'чемодан', 'коврик', 'самокат', 'блендер', 'пылесос', 'утюг', 'кошелек', 'ремень',
+]
+DESCRIPTION_WORDS = [
+    'подходит', 'для', 'дома', 'дачи', 'путешествий', 'работы', 'гарантия', 'год', 'удобный',
+    'надежный', 'современный', 'дизайн', 'материал', 'качество', 'доставка', 'подарок', 'набор',
+    'размер', 'цвет', 'модель', 'новинка', 'хит', 'продаж', 'экологичный', 'ручная', 'сборка',
+]
+CATEGORY_NAMES = [
+    'Дом', 'Сад', 'Туризм', 'Электроника', 'Одежда', 'Обувь', 'Аксессуары', 'Детям',
+    'Кухня', 'Спорт', 'Авто', 'Красота', 'Здоровье', 'Офис', 'Хобби', 'Зоотовары',
+]
+ORDER_STATUSES = [status for status, _ in Order.ORDER_STATUS]
+
+
+class Command(BaseCommand):
+    help = (
+        'Заполняет базу синтетическими категориями, товарами, пользователями, корзинами '
+        'и заказами пакетными вставками (для нагрузочных тестов и run_benchmarks)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--categories', type=int, default=20, help='Число категорий')
+        parser.add_argument('--products', type=int, default=10000, help='Число товаров')
+        parser.add_argument('--users', type=int, default=200, help='Число пользователей')
+        parser.add_argument('--carts', type=int, default=100, help='Сколько пользователей получат корзину')
+        parser.add_argument('--orders', type=int, default=2000, help='Число заказов')
+        parser.add_argument('--max-items', type=int, default=4, help='Максимум позиций в заказе и корзине')
+        parser.add_argument('--inactive', type=float, default=0.05, help='Доля снятых с продажи товаров')
+        parser.add_argument('--password', default='benchmark', help='Пароль созданных пользователей')
+        parser.add_argument('--seed', type=int, default=42, help='Зерно генератора (данные воспроизводимы)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк в одной пакетной вставке')
+        parser.add_argument('--clear', action='store_true', help='Удалить ранее созданные синтетические данные')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        if options['clear']:
+            self._clear()
+        elif Category.objects.filter(slug__startswith=f'{SEED_PREFIX}-').exists():
+            raise CommandError('Синтетические данные уже есть, запустите с --clear, чтобы пересоздать их')
+
+        if options['products'] and not (options['categories'] and options['users']):
+            raise CommandError('Для товаров нужны хотя бы одна категория и один пользователь')
+
+        with transaction.atomic():
+            users = self._create_users(options['users'], options['password'])
+            categories = self._create_categories(options['categories'])
+            products = self._create_products(options['products'], categories, users, options['inactive'])
+            active = [product for product in products if product.is_active]
+            carts = self._create_carts(users[:options['carts']], active, options['max_items'])
+            orders, items = self._create_orders(options['orders'], users, active, options['max_items'])
+
+        # bulk_create не вызывает сигналы: счетчики, поисковый индекс и кэши обновляем сами
+        Category.recount_active_products([category.pk for category in categories])
+        UserProfile.recount_order_stats([user.pk for user in users])
+        indexed = rebuild_search_index() if is_supported() else 0
+        invalidate_sidebar()
+        bump_catalog_version()
+
+        self.stdout.write(
+            f'Категорий: {len(categories)}, товаров: {len(products)}, пользователей: {len(users)}, '
+            f'позиций в корзинах: {carts}, заказов: {orders} ({items} позиций), '
+            f'проиндексировано: {indexed}'
+        )
+        if users:
+            self.stdout.write(f'Вход: {users[0].email} / {options["password"]}')
+        self.stdout.write(self.style.SUCCESS(f'Готово за {time.perf_counter() - started:.1f} с'))
+
+    def _clear(self):
+        User = get_user_model()
+        # Товары, корзины и заказы удаляются каскадом вместе с авторами и категориями
+        Category.objects.filter(slug__startswith=f'{SEED_PREFIX}-').delete()
+        User.objects.filter(email__startswith=f'{SEED_PREFIX}-').delete()
+        if is_supported():
+            rebuild_search_index()
+        invalidate_sidebar()
+        bump_catalog_version()
+        self.stdout.write('Прежние синтетические данные удалены')
+
+    def _create_users(self, count, password):
+        User = get_user_model()
+        # Хэш пароля считается один раз: он медленный намеренно
+        password = make_password(password)
+        emails = [f'{SEED_PREFIX}-user-{i}@example.com' for i in range(count)]
+        User.objects.bulk_create(
+            [User(email=email, username=email, password=password) for email in emails],
+            batch_size=self.batch_size,
+        )
+        users = list(User.objects.filter(email__in=emails).order_by('pk'))
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, address=f'Город, улица {i}') for i, user in enumerate(users)],
+            batch_size=self.batch_size,
+        )
+        return users
+
+    def _create_categories(self, count):
+        categories = [
+            Category(
+                name=f'{CATEGORY_NAMES[i % len(CATEGORY_NAMES)]} {i // len(CATEGORY_NAMES) + 1}',
+                slug=f'{SEED_PREFIX}-category-{i}',
+            )
+            for i in range(count)
+        ]
+        Category.objects.bulk_create(categories, batch_size=self.batch_size)
+        return list(Category.objects.filter(slug__startswith=f'{SEED_PREFIX}-category-').order_by('pk'))
+
+    def _create_products(self, count, categories, users, inactive_share):
+        rng = self.rng
+        # Популярность распределена неравномерно, как в настоящем каталоге
+        products = []
+        for i in range(count):
+            name = f'{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {i}'.capitalize()
+            description = ' '.join(rng.choices(DESCRIPTION_WORDS, k=rng.randint(10, 40)))
+            products.append(Product(
+                product_name=name,
+                slug=f'{SEED_PREFIX}-product-{i}',
+                description=description,
+                price=rng.randint(100, 100000),
+                quantity=rng.randint(0, 50),
+                category=rng.choice(categories),
+                author=rng.choice(users),
+                discount_percent=rng.choice([0, 0, 0, 5, 10, 20, 50]),
+                views=int(rng.paretovariate(1.2) * 10),
+                is_active=rng.random() >= inactive_share,
+            ))
+        Product.objects.bulk_create(products, batch_size=self.batch_size)
+        return list(
+            Product.objects.filter(slug__startswith=f'{SEED_PREFIX}-product-')
+            .only('pk', 'price', 'quantity', 'is_active').order_by('pk')
+        )
+
+    def _sample_products(self, products, max_items):
+        return self.rng.sample(products, min(len(products), self.rng.randint(1, max_items)))
+
+    def _create_carts(self, users, products, max_items):
+        if not products:
+            return 0
+        lines = [
+            Cart(author=user, product=product, quantity=self.rng.randint(1, 3))
+            for user in users
+            for product in self._sample_products(products, max_items)
+        ]
+        Cart.objects.bulk_create(lines, batch_size=self.batch_size)
+        return len(lines)
+
+    def _create_orders(self, count, users, products, max_items):
+        if not products or not users:
+            return 0, 0
+        orders = []
+        lines = []
+        for _ in range(count):
+            order_lines = [
+                (product, self.rng.randint(1, 3)) for product in self._sample_products(products, max_items)
+            ]
+            orders.append(Order(
+                user=self.rng.choice(users),
+                status=self.rng.choice(ORDER_STATUSES),
+                shipping_address='Город, улица',
+                total_amount=Decimal(sum(product.price * quantity for product, quantity in order_lines)),
+            ))
+            lines.append(order_lines)
+
+        # На SQLite и PostgreSQL bulk_create возвращает первичные ключи
+        Order.objects.bulk_create(orders, batch_size=self.batch_size)
+        items = [
+            OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+            for order, order_lines in zip(orders, lines)
+            for product, quantity in order_lines
+        ]
+        OrderItem.objects.bulk_create(items, batch_size=self.batch_size)
+        return len(orders), len(items)
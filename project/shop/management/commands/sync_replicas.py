@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.db_router import get_replicas, sync_sqlite_replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Копирует основную базу SQLite в файлы реплик из DATABASE_REPLICAS '
+        '(вместо репликации при локальной разработке и нагрузочных тестах)'
+    )
+
+    def handle(self, *args, **options):
+        if not get_replicas():
+            raise CommandError('Реплики не настроены: задайте DATABASE_REPLICAS')
+        try:
+            copied = sync_sqlite_replicas()
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Скопировано реплик: {len(copied)} ({", ".join(copied) or "-"})'))
@@ -0,0 +1,55 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.catalog_io import FORMATS, detect_format, read_rows
+from shop.stock_sync import StockRowError, StockSync, parse_stock_row
+
+
+class Command(BaseCommand):
+    help = (
+        'Обновляет цены и остатки из фида поставщика (CSV или JSONL с колонками slug, price, quantity). '
+        'Записываются только товары, у которых значения действительно изменились'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл фида, "-" - стандартный ввод')
+        parser.add_argument('--format', choices=FORMATS, help='Формат (по умолчанию по расширению файла)')
+        parser.add_argument('--delimiter', default=',', help='Разделитель полей CSV')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Строк фида в одной пачке сравнения')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать изменения, не записывая')
+        parser.add_argument('--max-errors', type=int, default=20, help='Сколько ошибок строк выводить')
+
+    def handle(self, *args, **options):
+        fmt = detect_format(options['path'], options['format'])
+        from_stdin = options['path'] == '-'
+        try:
+            stream = sys.stdin if from_stdin else open(options['path'], encoding='utf-8-sig', newline='')
+        except OSError as e:
+            raise CommandError(f'Не удалось открыть {options["path"]}: {e}')
+
+        sync = StockSync(batch_size=options['batch_size'], dry_run=options['dry_run'])
+        started = time.perf_counter()
+        rows = errors = 0
+        try:
+            for line, row in read_rows(stream, fmt, options['delimiter']):
+                rows += 1
+                try:
+                    sync.add(*parse_stock_row(row))
+                except StockRowError as e:
+                    errors += 1
+                    if errors <= options['max_errors']:
+                        self.stderr.write(f'Строка {line}: {e}')
+            stats = sync.finish()
+        finally:
+            if not from_stdin:
+                stream.close()
+
+        elapsed = time.perf_counter() - started
+        prefix = 'Проверка без записи. ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(
+            f'{prefix}Изменено: {stats["changed"]}, без изменений: {stats["unchanged"]}, '
+            f'нет в каталоге: {stats["missing"]}, ошибок: {errors}, '
+            f'время: {elapsed:.1f} с ({rows / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
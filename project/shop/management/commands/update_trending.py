@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from shop.cache import bump_catalog_version
+from shop.trending import update_trending
+from shop.view_counter import view_counter
+
+
+class Command(BaseCommand):
+    help = 'Обновляет популярность товаров (trending) по новым просмотрам и заказам; запускать периодически'
+
+    def handle(self, *args, **options):
+        # Просмотры этого процесса, еще не записанные в базу, учитываем сразу
+        view_counter.flush()
+        stats = update_trending()
+        if any(stats.values()):
+            bump_catalog_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Затухание: {stats["decayed"]}, новые просмотры: {stats["viewed"]}, '
+            f'новые заказы: {stats["ordered"]} товаров'
+        ))
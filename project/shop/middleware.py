@@ -0,0 +1,166 @@
+# shop/middleware.py
+"""
+Профилирование SQL по запросам.
+
+SQLProfilingMiddleware включается настройкой SQL_PROFILING_SAMPLE_RATE (доля
+профилируемых запросов, 0 - выключено). Для выбранного запроса через
+execute_wrapper всех подключений считаются число SQL-запросов, время в базе
+и повторы одинаковых запросов: SQL нормализуется (литералы и списки IN
+схлопываются), и если один отпечаток встречается больше
+SQL_PROFILING_DUPLICATE_THRESHOLD раз, пишется предупреждение о вероятном N+1.
+Итог отдается в заголовке Server-Timing (виден во вкладке Network браузера).
+
+ReplicaPinningMiddleware задает для каждого запроса правила чтения с реплик
+(shop.db_router) и помнит в сессии, когда она последний раз писала в базу.
+"""
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .db_router import get_replicas, replica_routing
+
+logger = logging.getLogger(__name__)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST_RE = re.compile(r'\bIN \((?:\s*(?:%s|\?|\$\d+)\s*,?)+\)', re.IGNORECASE)
+_SPACE_RE = re.compile(r'\s+')
+
+
+def fingerprint(sql):
+    """SQL без конкретных значений: запросы, отличающиеся только параметрами, совпадают"""
+    sql = _STRING_RE.sub('?', sql)
+    sql = _NUMBER_RE.sub('?', sql)
+    sql = _IN_LIST_RE.sub('IN (...)', sql)
+    return _SPACE_RE.sub(' ', sql).strip()
+
+
+class QueryProfile:
+    """Собирает статистику SQL одного HTTP-запроса, подключается через execute_wrapper"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.fingerprints = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.fingerprints[fingerprint(sql)] += 1
+
+    def duplicates(self, threshold):
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count > threshold]
+
+
+def _sampled():
+    sample_rate = getattr(settings, 'SQL_PROFILING_SAMPLE_RATE', 0)
+    return sample_rate > 0 and random.random() < sample_rate
+
+
+def _append_server_timing(response, timing):
+    if response.has_header('Server-Timing'):
+        timing = f'{response["Server-Timing"]}, {timing}'
+    response['Server-Timing'] = timing
+
+
+class SQLProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not _sampled():
+            return self.get_response(request)
+
+        profile = QueryProfile()
+        started = time.perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(profile))
+            response = self.get_response(request)
+        total = time.perf_counter() - started
+
+        threshold = getattr(settings, 'SQL_PROFILING_DUPLICATE_THRESHOLD', 5)
+        for sql, count in profile.duplicates(threshold):
+            logger.warning('Повторяющийся запрос (%d раз) в %s %s: %s', count, request.method, request.path, sql)
+
+        _append_server_timing(response, (
+            f'db;dur={profile.duration * 1000:.1f};desc="{profile.count} queries", '
+            f'app;dur={total * 1000:.1f}'
+        ))
+        return response
+
+    async def __acall__(self, request):
+        # Под ASGI запросы к базе выполняются в потоках sync_to_async со своими подключениями,
+        # execute_wrapper их не видит - отдаем только общее время обработки
+        if not _sampled():
+            return await self.get_response(request)
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        _append_server_timing(response, f'app;dur={(time.perf_counter() - started) * 1000:.1f}')
+        return response
+
+
+class ReplicaPinningMiddleware:
+    """
+    Чтения каталога в запросе идут на реплики, кроме небезопасных запросов
+    и сессий, писавших в базу меньше REPLICA_STICKY_SECONDS назад.
+    Ставится после SessionMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+    session_key = '_db_primary_until'
+    safe_methods = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def _pinned(self, request):
+        if request.method not in self.safe_methods:
+            return True
+        return request.session.get(self.session_key, 0) > time.time()
+
+    def _remember_write(self, request):
+        sticky = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+        request.session[self.session_key] = time.time() + sticky
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not get_replicas():
+            return self.get_response(request)
+        with replica_routing(pinned=self._pinned(request)) as state:
+            response = self.get_response(request)
+        if state.wrote and request.method not in self.safe_methods:
+            self._remember_write(request)
+        return response
+
+    async def __acall__(self, request):
+        if not get_replicas():
+            return await self.get_response(request)
+        # Сессия загружается из базы синхронно
+        pinned = await sync_to_async(self._pinned)(request)
+        with replica_routing(pinned=pinned) as state:
+            response = await self.get_response(request)
+        if state.wrote and request.method not in self.safe_methods:
+            await sync_to_async(self._remember_write)(request)
+        return response
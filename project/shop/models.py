@@ -3,7 +3,9 @@ from django.db import models
 from django.conf import settings  # используем settings.AUTH_USER_MODEL
 from django.urls import reverse
 from django.template.defaultfilters import slugify
-from django.core.validators import MinValueValidator
+from django.core.validators import MinValueValidator, MaxValueValidator
+from django.db.models import Count, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 
 
 class Category(models.Model):
@@ -11,6 +13,8 @@ class Category(models.Model):
     slug = models.SlugField(max_length=50, unique=True, verbose_name='URL')
     description = models.TextField(blank=True, verbose_name='Описание категории')
     image = models.ImageField(upload_to='category_images/', blank=True, null=True, verbose_name='Изображение категории')
+    active_products_count = models.PositiveIntegerField(default=0, editable=False,
+                                                        verbose_name='Активных товаров')
 
     class Meta:
         verbose_name = 'Категория'
@@ -24,7 +28,21 @@ class Category(models.Model):
         return reverse('shop:category_products', kwargs={'category_slug': self.slug})
 
     def get_product_count(self):
-        return self.products.count()
+        return self.active_products_count
+
+    @classmethod
+    def recount_active_products(cls, category_ids=None, using='default'):
+        """Пересчитывает денормализованное число активных товаров одним UPDATE (None - все категории)"""
+        active_count = Product.objects.using(using).filter(
+            category=OuterRef('pk'),
+            is_active=True
+        ).order_by().values('category').annotate(total=Count('pk')).values('total')
+        categories = cls.objects.using(using)
+        if category_ids is not None:
+            categories = categories.filter(pk__in=category_ids)
+        return categories.update(
+            active_products_count=Coalesce(Subquery(active_count), Value(0))
+        )
 
 
 def get_product_image_filename(instance, filename):
@@ -51,7 +69,15 @@ class Product(models.Model):
     quantity = models.PositiveIntegerField(default=1, verbose_name='Количество', validators=[MinValueValidator(0)])
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products', verbose_name='Категория')
     author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name='Автор')
+    discount_percent = models.PositiveSmallIntegerField(default=0, verbose_name='Скидка, %',
+                                                        validators=[MaxValueValidator(99)])
     views = models.PositiveIntegerField(default=0, verbose_name='Просмотры')
+    # Популярность с экспоненциальным затуханием (см. shop/trending.py)
+    trending = models.FloatField(default=0, editable=False, verbose_name='Популярность сейчас')
+    # Сколько просмотров уже учтено в trending
+    trending_views = models.PositiveIntegerField(default=0, editable=False)
+    # Сумма резервов StockHold, поддерживается приращениями (см. shop/reservations.py)
+    reserved_quantity = models.PositiveIntegerField(default=0, editable=False, verbose_name='В резерве')
     is_active = models.BooleanField(default=True, verbose_name='Активный')
 
     class Meta:
@@ -62,17 +88,84 @@ class Product(models.Model):
             models.Index(fields=['-time_create']),
             models.Index(fields=['category']),
             models.Index(fields=['price']),
+            # Обратный проход по индексу дает порядок (-trending, -id) без сортировки
+            models.Index(fields=['is_active', 'trending']),
         ]
 
     def __str__(self):
         return f'{self.product_name}'
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем загруженные значения, чтобы пересчитывать счетчики категорий только при изменениях
+        instance._loaded_state = {
+            name: value for name, value in zip(field_names, values)
+            if name in ('category_id', 'is_active')
+        }
+        return instance
+
     def get_absolute_url(self):
         return reverse('shop:product_detail', kwargs={'product_slug': self.slug})
 
+    @property
+    def available(self):
+        """Сколько можно положить в корзину: остаток за вычетом резервов"""
+        return max(self.quantity - self.reserved_quantity, 0)
+
+    @classmethod
+    def recount_reserved(cls, product_ids=None):
+        """Пересчитывает reserved_quantity по таблице резервов (исправляет расхождения)"""
+        reserved = StockHold.objects.filter(
+            product=OuterRef('pk')
+        ).order_by().values('product').annotate(total=Sum('quantity')).values('total')
+        products = cls.objects.all() if product_ids is None else cls.objects.filter(pk__in=product_ids)
+        updated = products.update(reserved_quantity=Coalesce(Subquery(reserved), Value(0)))
+        # Свободный остаток мог измениться: кэши остатков сбрасываются после фиксации
+        transaction.on_commit(bump_stock_version)
+        return updated
+
+    @property
+    def has_discount(self):
+        return self.discount_percent > 0
+
+    @property
+    def old_price(self):
+        # Цена до скидки, от которой price составляет (100 - discount_percent)%
+        return round(self.price * 100 / (100 - self.discount_percent))
+
+    @property
+    def discount_amount(self):
+        return self.old_price - self.price
+
+    def get_related_products(self, limit=4):
+        """
+        Связанные товары одним запросом по индексу (product, -score) таблицы RelatedProduct.
+        Если предрассчитанных мало (новый товар), добираем похожими по описанию,
+        а затем популярными из категории.
+        """
+        related = list(
+            Product.objects.filter(related_to__product=self, is_active=True)
+            .select_related('category')
+            .order_by('-related_to__score', 'related_to__pk')[:limit]
+        )
+        fallbacks = (
+            lambda: Product.objects.filter(similar_to__product=self).order_by('-similar_to__score'),
+            lambda: Product.objects.filter(category_id=self.category_id).order_by('-views', '-id'),
+        )
+        for fallback in fallbacks:
+            if len(related) >= limit:
+                break
+            related += fallback().filter(is_active=True).exclude(
+                pk__in=[self.pk, *(product.pk for product in related)]
+            ).select_related('category')[:limit - len(related)]
+        return related
+
     def increment_views(self):
+        # Просмотр попадает в буфер и записывается в базу пачкой (см. view_counter)
+        from .view_counter import view_counter
+        view_counter.record(self.pk)
         self.views += 1
-        self.save(update_fields=['views'])
 
 
 class ProductImages(models.Model):
@@ -102,4 +195,176 @@ class Cart(models.Model):
         return f'{self.author.email} - {self.product.product_name}'
 
     def get_total_price(self):
-        return self.product.price * self.quantity
\ No newline at end of file
+        return self.product.price * self.quantity
+
+
+class StockHold(models.Model):
+    """Резерв остатка под позицию корзины пользователя до expires_at (см. shop/reservations.py)"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='stock_holds')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='holds')
+    quantity = models.PositiveIntegerField(verbose_name='Количество')
+    expires_at = models.DateTimeField(verbose_name='Действует до')
+
+    class Meta:
+        verbose_name = 'Резерв товара'
+        verbose_name_plural = 'Резервы товаров'
+        unique_together = ['user', 'product']
+        indexes = [
+            # Очистка просроченных идет диапазоном по этому индексу
+            models.Index(fields=['expires_at']),
+        ]
+
+    def __str__(self):
+        return f'{self.user_id}: {self.product_id} x {self.quantity} до {self.expires_at:%H:%M}'
+
+
+class RelatedProduct(models.Model):
+    """Предрассчитанные связанные товары (см. команду rebuild_related_products)"""
+    SOURCE_CHOICES = [
+        ('orders', 'Покупают вместе'),
+        ('similar', 'Похожие по описанию'),
+        ('category', 'Из той же категории'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_links')
+    related = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='related_to')
+    score = models.PositiveIntegerField(default=0, verbose_name='Совместных покупок')
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, default='orders', verbose_name='Источник')
+
+    class Meta:
+        verbose_name = 'Связанный товар'
+        verbose_name_plural = 'Связанные товары'
+        unique_together = ['product', 'related']
+        indexes = [
+            models.Index(fields=['product', '-score']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} -> {self.related_id} ({self.score})'
+
+
+class SimilarProduct(models.Model):
+    """Top-k похожих по тексту товаров (см. команду rebuild_similar_products)"""
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_links')
+    similar = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='similar_to')
+    score = models.FloatField(verbose_name='Близость')
+
+    class Meta:
+        verbose_name = 'Похожий товар'
+        verbose_name_plural = 'Похожие товары'
+        unique_together = ['product', 'similar']
+        indexes = [
+            models.Index(fields=['product', '-score']),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id} ~ {self.similar_id} ({self.score:.3f})'
+
+class JobCheckpoint(models.Model):
+    """Позиция, до которой фоновая задача уже обработала данные"""
+    name = models.CharField(max_length=50, unique=True)
+    last_id = models.PositiveBigIntegerField(default=0)
+    last_run = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'Контрольная точка задачи'
+        verbose_name_plural = 'Контрольные точки задач'
+
+    def __str__(self):
+        return f'{self.name}: {self.last_id}'
+
+# Сигналы для поддержания счетчиков категорий, кэшей каталога и поискового индекса
+from django.contrib.auth.signals import user_logged_in
+from django.db.models.signals import post_save, post_delete, post_migrate
+from django.dispatch import receiver
+from .cache import invalidate_sidebar, bump_catalog_version, bump_stock_version
+from .cart import invalidate_cart_summary, merge_session_cart
+from django.db import router, transaction
+from . import reservations, search, thumbnails
+
+
+@receiver(post_save, sender=Product)
+def update_category_counters_on_save(sender, instance, created, **kwargs):
+    loaded = getattr(instance, '_loaded_state', {})
+    previous_category_id = loaded.get('category_id', instance.category_id)
+    if not created and loaded \
+            and previous_category_id == instance.category_id \
+            and loaded.get('is_active') == instance.is_active:
+        return
+    Category.recount_active_products({instance.category_id, previous_category_id})
+    instance._loaded_state = {'category_id': instance.category_id, 'is_active': instance.is_active}
+    invalidate_sidebar()
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counters_on_delete(sender, instance, **kwargs):
+    Category.recount_active_products([instance.category_id])
+    invalidate_sidebar()
+
+
+@receiver([post_save, post_delete], sender=Category)
+def invalidate_sidebar_on_category_change(sender, **kwargs):
+    invalidate_sidebar()
+
+
+@receiver([post_save, post_delete], sender=Cart)
+def invalidate_cart_summary_on_change(sender, instance, **kwargs):
+    invalidate_cart_summary(instance.author_id)
+
+
+@receiver(post_delete, sender=Cart)
+def release_stock_hold_on_cart_delete(sender, instance, **kwargs):
+    # Любое удаление позиции (из корзины, админки, при оформлении) снимает ее резерв
+    reservations.release_holds(instance.author_id, [instance.product_id])
+
+
+@receiver(user_logged_in)
+def merge_session_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, 'session'):
+        merge_session_cart(request, user)
+
+
+@receiver([post_save, post_delete], sender=Product)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=ProductImages)
+def invalidate_catalog_caches(sender, **kwargs):
+    bump_catalog_version()
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_save, sender=ProductImages)
+def generate_image_thumbnails(sender, instance, **kwargs):
+    # Копии создаются в фоновом пуле после фиксации транзакции, когда файл уже сохранен
+    image_name = instance.image.name
+    if image_name:
+        transaction.on_commit(lambda: thumbnails.schedule_thumbnails(image_name))
+
+
+@receiver(post_save, sender=Product)
+def update_search_index_on_save(sender, instance, using, **kwargs):
+    search.index_products([instance.pk], using=using)
+
+
+@receiver(post_delete, sender=Product)
+def update_search_index_on_delete(sender, instance, using, **kwargs):
+    search.remove_products([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Category)
+def update_search_index_on_category_change(sender, instance, created, using, **kwargs):
+    if not created:
+        search.index_products(instance.products.values_list('pk', flat=True), using=using)
+
+
+@receiver(post_migrate)
+def create_search_index(sender, app_config, using, **kwargs):
+    if app_config.label == 'shop':
+        search.ensure_search_index(using)
+
+
+@receiver(post_migrate)
+def backfill_category_counters(sender, app_config, using, **kwargs):
+    # Поле добавляется со значением 0: счетчики существующих категорий заполняются после миграций
+    if app_config.label == 'shop' and router.allow_migrate_model(using, Category):
+        Category.recount_active_products(using=using)
+        invalidate_sidebar()
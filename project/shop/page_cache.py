@@ -0,0 +1,124 @@
+# shop/page_cache.py
+"""
+Кэш целых страниц каталога для анонимных посетителей.
+
+Ключ строится из пути, нормализованной строки запроса (та же сортировка
+параметров, что у url_replace), поколения каталога и поколения остатков,
+поэтому любое изменение товаров, категорий, фото или резервов делает старые
+страницы недоступными.
+
+Защита от «лавины» пересчетов: запись хранит мягкий срок годности. После
+него страницу пересчитывает только один запрос, получивший блокировку
+(cache.add), остальные продолжают отдавать устаревшую копию. Если копии нет
+совсем, остальные запросы недолго ждут, пока ее положит первый.
+"""
+import hashlib
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.middleware.csrf import get_token
+
+from .cache import get_catalog_version, get_stock_version
+
+# Сколько секунд держится блокировка пересчета и сколько ждут ее снятия
+PAGE_CACHE_LOCK_TIMEOUT = 10
+PAGE_CACHE_WAIT_TIMEOUT = 2
+PAGE_CACHE_POLL_INTERVAL = 0.05
+
+
+def normalize_query_string(params):
+    """Строка запроса с отсортированными параметрами и без пустых значений"""
+    items = sorted((key, value) for key, values in params.lists() for value in values if value != '')
+    return urlencode(items)
+
+
+def page_cache_key(request):
+    source = f'{request.path}?{normalize_query_string(request.GET)}'
+    return 'shop:page:{}:{}:{}'.format(
+        get_catalog_version(), get_stock_version(), hashlib.md5(source.encode()).hexdigest()
+    )
+
+
+def is_page_cacheable(request):
+    """Кэшируются только GET-запросы гостей без сообщений и с пустой корзиной"""
+    if request.method != 'GET' or request.user.is_authenticated:
+        return False
+    if len(messages.get_messages(request)):
+        return False
+    return not request.session.get(settings.CART_SESSION_ID)
+
+
+def get_or_render_page(key, render, timeout, stale_timeout):
+    """
+    Возвращает (entry, hit). render() строит запись или возвращает None, если
+    ответ кэшировать нельзя. (None, False) без вызова render() означает, что
+    дождаться чужого пересчета не удалось.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry['expires'] > time.time():
+        return entry, True
+
+    lock_key = f'{key}:lock'
+    if cache.add(lock_key, 1, PAGE_CACHE_LOCK_TIMEOUT):
+        try:
+            entry = render()
+            if entry is not None:
+                entry['expires'] = time.time() + timeout
+                cache.set(key, entry, timeout + stale_timeout)
+        finally:
+            cache.delete(lock_key)
+        return entry, False
+
+    # Страницу уже пересчитывает другой запрос
+    if entry is not None:
+        return entry, True
+    deadline = time.time() + PAGE_CACHE_WAIT_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(PAGE_CACHE_POLL_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry, True
+    return None, False
+
+
+class AnonymousPageCacheMixin:
+    """Отдает гостям готовый HTML страницы из кэша"""
+    page_cache_timeout = None
+
+    def dispatch(self, request, *args, **kwargs):
+        if not is_page_cacheable(request):
+            return super().dispatch(request, *args, **kwargs)
+
+        rendered = []
+
+        def render():
+            response = super(AnonymousPageCacheMixin, self).dispatch(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render):
+                response.render()
+            rendered.append(response)
+            if response.status_code != 200 or response.streaming:
+                return None
+            return self.get_page_cache_entry(response)
+
+        timeout = self.page_cache_timeout or getattr(settings, 'PAGE_CACHE_TIMEOUT', 60)
+        stale_timeout = getattr(settings, 'PAGE_CACHE_STALE_TIMEOUT', 60 * 5)
+        entry, hit = get_or_render_page(page_cache_key(request), render, timeout, stale_timeout)
+
+        if hit:
+            self.page_cache_hit(request, entry)
+            # Скрипты страниц берут CSRF-токен из cookie, она должна быть выставлена и при попадании
+            get_token(request)
+            return HttpResponse(entry['content'], content_type=entry['content_type'])
+        if rendered:
+            return rendered[0]
+        return super().dispatch(request, *args, **kwargs)
+
+    def get_page_cache_entry(self, response):
+        return {'content': response.content, 'content_type': response['Content-Type']}
+
+    def page_cache_hit(self, request, entry):
+        """Вызывается, когда страница отдана из кэша без выполнения представления"""
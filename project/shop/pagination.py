@@ -0,0 +1,216 @@
+# shop/pagination.py
+"""
+Пагинация каталога.
+
+Мелкие страницы по-прежнему доступны по номеру (?page=N), но COUNT(*)
+кэшируется. Дальше порога KEYSET_PAGINATION_THRESHOLD навигация переходит
+на курсоры (?cursor=...): страница выбирается условием по ключу сортировки
+и id вместо OFFSET, поэтому ее стоимость не растет с глубиной.
+"""
+import base64
+import binascii
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import EmptyResultSet, ValidationError
+from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Сортировки каталога с id в качестве уточняющего ключа
+KEYSET_ORDERINGS = {
+    '-time_create': ('-time_create', '-id'),
+    'price': ('price', 'id'),
+    '-price': ('-price', '-id'),
+    '-views': ('-views', '-id'),
+    '-trending': ('-trending', '-id'),
+    '-discount_percent': ('-discount_percent', '-id'),
+}
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def get_ordering(sort_by):
+    return KEYSET_ORDERINGS.get(sort_by, KEYSET_ORDERINGS['-time_create'])
+
+
+def encode_cursor(obj, ordering, direction='next'):
+    """obj - объект модели или строка из values()"""
+    values = []
+    for field_name in ordering:
+        name = field_name.lstrip('-')
+        value = obj[name] if isinstance(obj, dict) else getattr(obj, name)
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    payload = json.dumps({'v': values, 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, ordering):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        values, direction = payload['v'], payload['d']
+        if len(values) != len(ordering) or direction not in ('next', 'previous'):
+            raise ValueError
+        values = [
+            model._meta.get_field(field_name.lstrip('-')).to_python(value)
+            for field_name, value in zip(ordering, values)
+        ]
+    except (ValueError, TypeError, KeyError, binascii.Error, ValidationError) as exc:
+        raise InvalidCursor(cursor) from exc
+    return values, direction
+
+
+def _after(ordering, values):
+    """Условие «строго после позиции values» для заданной сортировки"""
+    condition = Q()
+    for i, field_name in enumerate(ordering):
+        name = field_name.lstrip('-')
+        lookup = 'lt' if field_name.startswith('-') else 'gt'
+        step = Q(**{f'{name}__{lookup}': values[i]})
+        for previous_name, previous_value in zip(ordering[:i], values[:i]):
+            step &= Q(**{previous_name.lstrip('-'): previous_value})
+        condition |= step
+    return condition
+
+
+def _reverse(ordering):
+    return tuple(name[1:] if name.startswith('-') else f'-{name}' for name in ordering)
+
+
+class CachedCountPaginator(Paginator):
+    """Paginator, который кэширует COUNT(*) по тексту запроса"""
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is None:
+            return super().count
+        try:
+            sql = str(query)
+        except EmptyResultSet:
+            # queryset.none() (например, поиск из одних знаков препинания): SQL нет, строк тоже
+            return 0
+        key = 'shop:count:' + hashlib.md5(sql.encode()).hexdigest()
+        count = cache.get(key)
+        if count is None:
+            count = super().count
+            cache.set(key, count, getattr(settings, 'PAGINATION_COUNT_CACHE_TIMEOUT', 60))
+        return count
+
+
+class KeysetPage:
+    is_cursor = True
+
+    def __init__(self, object_list, paginator, ordering, has_next, has_previous):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.ordering = ordering
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next and self.object_list:
+            return encode_cursor(self.object_list[-1], self.ordering, 'next')
+        return None
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous and self.object_list:
+            return encode_cursor(self.object_list[0], self.ordering, 'previous')
+        return None
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, ordering):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = ordering
+
+    @cached_property
+    def count(self):
+        # Приблизительное (кэшированное) число объектов, только для отображения
+        return CachedCountPaginator(self.queryset, self.per_page).count
+
+    def first_page(self):
+        rows = list(self.queryset.order_by(*self.ordering)[:self.per_page + 1])
+        return KeysetPage(rows[:self.per_page], self, self.ordering,
+                          has_next=len(rows) > self.per_page, has_previous=False)
+
+    def page(self, cursor):
+        values, direction = decode_cursor(cursor, self.queryset.model, self.ordering)
+        if direction == 'next':
+            rows = list(self.queryset.filter(_after(self.ordering, values))
+                        .order_by(*self.ordering)[:self.per_page + 1])
+            has_more = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            return KeysetPage(rows, self, self.ordering, has_next=has_more, has_previous=True)
+
+        reverse_ordering = _reverse(self.ordering)
+        rows = list(self.queryset.filter(_after(reverse_ordering, values))
+                    .order_by(*reverse_ordering)[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return KeysetPage(rows, self, self.ordering, has_next=True, has_previous=has_more)
+
+
+def paginate_products(request, queryset, per_page, sort_by):
+    """
+    Возвращает (paginator, page). Курсор из ?cursor имеет приоритет над ?page;
+    для сортировок без ключа (например, по релевантности) используются только номера страниц.
+    """
+    ordering = KEYSET_ORDERINGS.get(sort_by)
+    cursor = request.GET.get('cursor')
+
+    if ordering and cursor:
+        paginator = KeysetPaginator(queryset, per_page, ordering)
+        try:
+            page = paginator.page(cursor)
+        except InvalidCursor:
+            pass
+        else:
+            return paginator, page
+
+    paginator = CachedCountPaginator(queryset, per_page)
+    try:
+        page = paginator.page(request.GET.get('page'))
+    except PageNotAnInteger:
+        page = paginator.page(1)
+    except EmptyPage:
+        page = paginator.page(paginator.num_pages)
+
+    # С порога дальше идем курсорами, чтобы не сканировать OFFSET
+    threshold = getattr(settings, 'KEYSET_PAGINATION_THRESHOLD', 5)
+    page.object_list = list(page.object_list)
+    if ordering and page.number >= threshold and page.has_next() and page.object_list:
+        page.next_cursor = encode_cursor(page.object_list[-1], ordering, 'next')
+    return paginator, page
+
+
+class KeysetPaginationMixin:
+    """Подключает paginate_products к ListView; sort_by задает get_queryset"""
+    sort_by = '-time_create'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator, page = paginate_products(self.request, queryset, page_size, self.sort_by)
+        return paginator, page, page.object_list, page.has_other_pages()
@@ -0,0 +1,160 @@
+# shop/reservations.py
+"""
+Резервы остатка под корзины пользователей (StockHold) со сроком жизни.
+
+Позиция корзины пользователя держит резерв на свое количество в течение
+STOCK_HOLD_TTL секунд с последнего изменения. Сумма резервов хранится в
+Product.reserved_quantity и меняется приращениями в условных UPDATE
+(reserved_quantity + n <= quantity) без SELECT FOR UPDATE по товару, поэтому
+доступное количество (Product.available) читается с самим товаром, без
+агрегации резервов на каждый запрос.
+
+После фиксации каждого изменения резервов сменяется поколение остатков
+(bump_stock_version): страницы гостей из кэша и ETag списков показывают
+новое свободное количество, остальные кэши каталога не сбрасываются.
+
+Просроченные резервы снимает команда expire_stock_holds пачками по индексу
+expires_at. Позиция корзины с истекшим резервом остается, но при оформлении
+заказа ей достается только то, что не держат другие. Корзина гостя резервов
+не держит: они создаются при входе, когда корзина переносится в Cart.
+"""
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import bump_stock_version
+
+
+def hold_ttl():
+    return timedelta(seconds=getattr(settings, 'STOCK_HOLD_TTL', 15 * 60))
+
+
+def reserve(product_id, quantity):
+    """
+    Резервирует до quantity единиц товара условным UPDATE.
+    Если свободного остатка меньше, резервирует сколько есть. Возвращает зарезервированное количество.
+    """
+    from .models import Product
+
+    products = Product.objects.filter(pk=product_id, is_active=True)
+    # Свободный остаток может меняться параллельно: несколько попыток с уточнением
+    for _ in range(3):
+        if quantity <= 0:
+            return 0
+        if products.filter(quantity__gte=F('reserved_quantity') + quantity).update(
+            reserved_quantity=F('reserved_quantity') + quantity
+        ):
+            transaction.on_commit(bump_stock_version)
+            return quantity
+        stock = products.values_list('quantity', 'reserved_quantity').first()
+        if stock is None:
+            return 0
+        quantity = min(quantity, stock[0] - stock[1])
+    return 0
+
+
+def _drop_holds(holds):
+    """Удаляет резервы [(pk, id товара, количество)] и уменьшает reserved_quantity одним UPDATE"""
+    from .models import Product, StockHold
+
+    if not holds:
+        return
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).delete()
+    amounts = Counter()
+    for _, product_id, quantity in holds:
+        amounts[product_id] += quantity
+    released = Case(
+        *[When(pk=product_id, then=Value(quantity)) for product_id, quantity in amounts.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    Product.objects.filter(pk__in=amounts).update(
+        reserved_quantity=Greatest(F('reserved_quantity') - released, Value(0))
+    )
+    transaction.on_commit(bump_stock_version)
+
+
+def _user_holds(user_id, product_ids=None):
+    from .models import StockHold
+
+    holds = StockHold.objects.select_for_update().filter(user_id=user_id)
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    return list(holds.values_list('pk', 'product_id', 'quantity'))
+
+
+def release_holds(user_id, product_ids=None):
+    """Снимает резервы пользователя (по всем товарам, если product_ids не задан)"""
+    with transaction.atomic():
+        _drop_holds(_user_holds(user_id, product_ids))
+
+
+def take_holds(user_id):
+    """
+    Удаляет резервы пользователя, не возвращая их в свободный остаток, и отдает
+    {id товара: количество}. Для оформления заказа: списание остатка уменьшает
+    reserved_quantity тем же UPDATE (см. checkout).
+    """
+    from .models import StockHold
+
+    holds = _user_holds(user_id)
+    StockHold.objects.filter(pk__in=[pk for pk, _, _ in holds]).delete()
+    return {product_id: quantity for _, product_id, quantity in holds}
+
+
+def sync_cart_holds(user, product_ids):
+    """
+    Приводит резервы к количествам в корзине для указанных товаров и продлевает их срок.
+    Позиции, на которые не хватило свободного остатка, урезаются до зарезервированного
+    (или удаляются). Возвращает {id товара: зарезервированное количество}.
+    """
+    from .models import Cart, StockHold
+
+    expires_at = timezone.now() + hold_ttl()
+    granted = {}
+    with transaction.atomic():
+        _drop_holds(_user_holds(user.pk, product_ids))
+        lines = Cart.objects.filter(author=user, product_id__in=product_ids)
+        holds = []
+        for line_id, product_id, quantity in lines.values_list('pk', 'product_id', 'quantity'):
+            granted[product_id] = reserve(product_id, quantity)
+            if granted[product_id]:
+                holds.append(StockHold(
+                    user=user, product_id=product_id, quantity=granted[product_id], expires_at=expires_at
+                ))
+            if granted[product_id] < quantity:
+                if granted[product_id]:
+                    Cart.objects.filter(pk=line_id).update(quantity=granted[product_id])
+                else:
+                    Cart.objects.filter(pk=line_id).delete()
+        StockHold.objects.bulk_create(holds)
+    return granted
+
+
+def expire_holds(batch_size=1000, now=None):
+    """
+    Снимает резервы с истекшим сроком пачками по индексу expires_at: на пачку
+    один SELECT, один DELETE и один UPDATE товаров. Строки, которые держит другая
+    транзакция, пропускаются (SKIP LOCKED там, где он поддерживается). Возвращает число снятых резервов.
+    """
+    from .models import StockHold
+
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            holds = list(
+                StockHold.objects.select_for_update(skip_locked=True)
+                .filter(expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('pk', 'product_id', 'quantity')[:batch_size]
+            )
+            _drop_holds(holds)
+        expired += len(holds)
+        if len(holds) < batch_size:
+            return expired
@@ -0,0 +1,297 @@
+# shop/search.py
+"""
+Полнотекстовый поиск по товарам на SQLite FTS5.
+
+Индекс хранит не исходный текст, а основы слов (стеммер Snowball для
+русского языка), поэтому «смартфоны» находит «смартфон», а каждое слово
+запроса ищется как префикс. На других СУБД поиск откатывается к icontains.
+"""
+import re
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+SEARCH_TABLE = 'shop_product_search'
+
+# Веса колонок для bm25: название, описание, категория
+RANK_WEIGHTS = (10.0, 1.0, 3.0)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+CYRILLIC_RE = re.compile(r'[а-я]')
+
+_ready_aliases = set()
+
+
+# --- Стеммер Snowball для русского языка ---
+
+VOWELS = 'аеиоуыэюя'
+
+PERFECTIVE_GERUND_1 = ('вшись', 'вши', 'в')
+PERFECTIVE_GERUND_2 = ('ившись', 'ывшись', 'ивши', 'ывши', 'ив', 'ыв')
+ADJECTIVE = ('ими', 'ыми', 'его', 'ого', 'ему', 'ому', 'ее', 'ие', 'ые', 'ое', 'ей', 'ий', 'ый', 'ой',
+             'ем', 'им', 'ым', 'ом', 'их', 'ых', 'ую', 'юю', 'ая', 'яя', 'ою', 'ею')
+PARTICIPLE_1 = ('ем', 'нн', 'вш', 'ющ', 'щ')
+PARTICIPLE_2 = ('ивш', 'ывш', 'ующ')
+REFLEXIVE = ('ся', 'сь')
+VERB_1 = ('ете', 'йте', 'ешь', 'нно', 'ла', 'на', 'ли', 'ем', 'ло', 'но', 'ет', 'ют', 'ны', 'ть', 'й', 'л', 'н')
+VERB_2 = ('ейте', 'уйте', 'ила', 'ыла', 'ена', 'ите', 'или', 'ыли', 'ило', 'ыло', 'ено', 'ует', 'уют', 'ены',
+          'ить', 'ыть', 'ишь', 'ей', 'уй', 'ил', 'ыл', 'им', 'ым', 'ен', 'ят', 'ит', 'ыт', 'ую', 'ю')
+NOUN = ('иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ев', 'ов', 'ие', 'ье', 'еи', 'ии', 'ей', 'ой',
+        'ий', 'ям', 'ем', 'ам', 'ом', 'ах', 'ях', 'ию', 'ью', 'ия', 'ья', 'а', 'е', 'и', 'й', 'о', 'у',
+        'ы', 'ь', 'ю', 'я')
+SUPERLATIVE = ('ейше', 'ейш')
+DERIVATIONAL = ('ость', 'ост')
+
+
+def _regions(word):
+    """Возвращает начала областей RV и R2"""
+    rv = r1 = r2 = len(word)
+    for i, char in enumerate(word):
+        if char in VOWELS:
+            rv = i + 1
+            break
+    for i in range(1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r1 = i + 1
+            break
+    for i in range(r1 + 1, len(word)):
+        if word[i - 1] in VOWELS and word[i] not in VOWELS:
+            r2 = i + 1
+            break
+    return rv, r2
+
+
+def _strip(word, start, endings, preceded_by=None):
+    """Отрезает самое длинное окончание из endings, лежащее целиком в области [start:]"""
+    for ending in sorted(endings, key=len, reverse=True):
+        if word.endswith(ending) and len(word) - len(ending) >= start:
+            if preceded_by:
+                position = len(word) - len(ending) - 1
+                if position < start or word[position] not in preceded_by:
+                    continue
+            return word[:-len(ending)], True
+    return word, False
+
+
+def _strip_any(word, start, *groups):
+    for endings, preceded_by in groups:
+        stripped, found = _strip(word, start, endings, preceded_by)
+        if found:
+            return stripped, True
+    return word, False
+
+
+def stem(word):
+    """Основа русского слова по алгоритму Snowball"""
+    word = word.lower().replace('ё', 'е')
+    rv, r2 = _regions(word)
+    if rv >= len(word):
+        return word
+
+    # Шаг 1
+    word, found = _strip_any(word, rv, (PERFECTIVE_GERUND_1, 'ая'), (PERFECTIVE_GERUND_2, None))
+    if not found:
+        word, _ = _strip(word, rv, REFLEXIVE)
+        word, found = _strip(word, rv, ADJECTIVE)
+        if found:
+            word, _ = _strip_any(word, rv, (PARTICIPLE_1, 'ая'), (PARTICIPLE_2, None))
+        else:
+            word, found = _strip_any(word, rv, (VERB_1, 'ая'), (VERB_2, None))
+            if not found:
+                word, _ = _strip(word, rv, NOUN)
+
+    # Шаг 2
+    word, _ = _strip(word, rv, ('и',))
+
+    # Шаг 3
+    word, _ = _strip(word, r2, DERIVATIONAL)
+
+    # Шаг 4
+    if word.endswith('нн') and len(word) - 1 >= rv:
+        return word[:-1]
+    word, found = _strip(word, rv, SUPERLATIVE)
+    if found:
+        if word.endswith('нн'):
+            word = word[:-1]
+        return word
+    word, _ = _strip(word, rv, ('ь',))
+    return word
+
+
+def analyze(text):
+    """Разбивает текст на слова и приводит русские слова к основе"""
+    terms = []
+    for word in WORD_RE.findall((text or '').lower()):
+        terms.append(stem(word) if CYRILLIC_RE.search(word) else word)
+    return terms
+
+
+# --- Индекс ---
+
+def _connection(using):
+    return connections[using]
+
+
+def is_supported(using='default'):
+    return _connection(using).vendor == 'sqlite'
+
+
+def ensure_search_index(using='default'):
+    """Создает таблицу FTS5 при первом обращении и заполняет ее"""
+    if using in _ready_aliases or not is_supported(using):
+        return
+    connection = _connection(using)
+    with connection.cursor() as cursor:
+        exists = SEARCH_TABLE in connection.introspection.table_names(cursor)
+        if not exists:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE "{SEARCH_TABLE}" USING fts5('
+                f'product_name, description, category_name, '
+                f"tokenize = 'unicode61 remove_diacritics 2')"
+            )
+    _ready_aliases.add(using)
+    if not exists:
+        rebuild_search_index(using=using)
+
+
+def _document(product_name, description, category_name):
+    return (
+        ' '.join(analyze(product_name)),
+        ' '.join(analyze(description)),
+        ' '.join(analyze(category_name)),
+    )
+
+
+def _write_rows(cursor, rows):
+    cursor.executemany(
+        f'INSERT INTO "{SEARCH_TABLE}" (rowid, product_name, description, category_name) VALUES (%s, %s, %s, %s)',
+        [(pk, *_document(name, description, category)) for pk, name, description, category in rows]
+    )
+
+
+def index_products(product_ids, using='default'):
+    """Переиндексирует товары по их id"""
+    if not is_supported(using):
+        return
+    ensure_search_index(using)
+    from .models import Product
+
+    product_ids = list(product_ids)
+    rows = Product.objects.using(using).filter(pk__in=product_ids).values_list(
+        'pk', 'product_name', 'description', 'category__name'
+    )
+    remove_products(product_ids, using=using)
+    with _connection(using).cursor() as cursor:
+        _write_rows(cursor, rows)
+
+
+def remove_products(product_ids, using='default'):
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported(using):
+        return
+    ensure_search_index(using)
+    placeholders = ', '.join(['%s'] * len(product_ids))
+    with _connection(using).cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN ({placeholders})', product_ids)
+
+
+def rebuild_search_index(batch_size=1000, using='default'):
+    """Полностью перестраивает индекс, возвращает число проиндексированных товаров"""
+    if not is_supported(using):
+        return 0
+    ensure_search_index(using)
+    from .models import Product
+
+    rows = Product.objects.using(using).order_by().values_list(
+        'pk', 'product_name', 'description', 'category__name'
+    ).iterator(chunk_size=batch_size)
+
+    total = 0
+    batch = []
+    with _connection(using).cursor() as cursor:
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}"')
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                _write_rows(cursor, batch)
+                total += len(batch)
+                batch = []
+        if batch:
+            _write_rows(cursor, batch)
+            total += len(batch)
+        cursor.execute(f'INSERT INTO "{SEARCH_TABLE}" ("{SEARCH_TABLE}") VALUES (\'optimize\')')
+    return total
+
+
+# --- Запросы ---
+
+def build_match_query(query):
+    """Запрос FTS5: все слова обязательны, каждое ищется как префикс"""
+    terms = analyze(query)
+    if not terms:
+        return None
+    return ' '.join(f'"{term}"*' for term in terms)
+
+
+def search_queryset(queryset, query):
+    """
+    Сужает queryset товаров до найденных по запросу и добавляет поле search_rank
+    (чем меньше, тем релевантнее). Остальные фильтры queryset сохраняются.
+    """
+    using = queryset.db
+    if not is_supported(using):
+        return queryset.filter(
+            Q(product_name__icontains=query) |
+            Q(description__icontains=query) |
+            Q(category__name__icontains=query)
+        )
+
+    match = build_match_query(query)
+    if match is None:
+        return queryset.none()
+
+    ensure_search_index(using)
+    table = queryset.model._meta.db_table
+    weights = ', '.join(str(weight) for weight in RANK_WEIGHTS)
+    return queryset.extra(
+        select={'search_rank': f'bm25("{SEARCH_TABLE}", {weights})'},
+        tables=[SEARCH_TABLE],
+        where=[f'"{SEARCH_TABLE}".rowid = "{table}"."id"', f'"{SEARCH_TABLE}" MATCH %s'],
+        params=[match],
+    )
+
+
+def highlight_snippet(text, query, words=25):
+    """Фрагмент текста вокруг первого совпадения с подсветкой найденных слов"""
+    terms = analyze(query)
+    tokens = list(WORD_RE.finditer(text or ''))
+    if not tokens:
+        return ''
+
+    def matches(token):
+        word = token.group().lower()
+        word = stem(word) if CYRILLIC_RE.search(word) else word
+        return any(word.startswith(term) for term in terms)
+
+    first = next((i for i, token in enumerate(tokens) if matches(token)), 0)
+    start = max(first - words // 3, 0)
+    end = min(start + words, len(tokens))
+
+    parts = []
+    position = tokens[start].start()
+    for token in tokens[start:end]:
+        parts.append(escape(text[position:token.start()]))
+        if matches(token):
+            parts.append(f'<mark>{escape(token.group())}</mark>')
+        else:
+            parts.append(escape(token.group()))
+        position = token.end()
+
+    snippet = ''.join(parts)
+    if start > 0:
+        snippet = '… ' + snippet
+    if end < len(tokens):
+        snippet += ' …'
+    return mark_safe(snippet)
@@ -0,0 +1,142 @@
+# shop/similarity.py
+"""
+Похожие товары по тексту: TF-IDF по названию, описанию и категории
+и косинусная близость, посчитанная блоками разреженных матричных произведений.
+
+Текст разбирается тем же анализатором, что и поисковый индекс (search.analyze).
+Матрица признаков хранится в CSR (float32), близости считаются для блока
+строк за раз: X[блок] @ X.T, так что память ограничена размером блока,
+а не квадратом числа товаров. Для каждого товара сохраняются top-k соседей.
+
+Нужны numpy и scipy; без них модуль импортируется, но расчет недоступен.
+"""
+from array import array
+from collections import Counter
+
+from .search import analyze
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # pragma: no cover - зависит от окружения
+    np = sparse = None
+
+# Вес слов из разных полей товара
+FIELD_WEIGHTS = {'product_name': 3, 'category__name': 2, 'description': 1}
+
+
+class SimilarityUnavailable(Exception):
+    pass
+
+
+def is_available():
+    return np is not None
+
+
+def _require_numpy():
+    if not is_available():
+        raise SimilarityUnavailable('Для расчета похожих товаров нужны пакеты numpy и scipy')
+
+
+def _terms(row):
+    counts = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        for term in analyze(row[field]):
+            counts[term] += weight
+    return counts
+
+
+class TfidfIndex:
+    """Нормированные TF-IDF векторы товаров и поиск ближайших соседей"""
+
+    def __init__(self, product_ids, matrix):
+        self.product_ids = np.asarray(product_ids, dtype=np.int64)
+        self.matrix = matrix
+        self.row_by_id = {int(pk): row for row, pk in enumerate(self.product_ids)}
+        # Транспонированная матрица для произведений блоков, строится один раз
+        self._transposed = matrix.T.tocsr()
+
+    @classmethod
+    def build(cls, rows, min_df=2, max_df=0.5):
+        """
+        rows - итератор словарей с pk и полями из FIELD_WEIGHTS.
+        Слова, встречающиеся реже min_df раз или в доле документов больше max_df, отбрасываются.
+        """
+        _require_numpy()
+        vocabulary = {}
+        product_ids = array('q')
+        indptr = array('q', [0])
+        indices = array('i')
+        data = array('f')
+
+        for row in rows:
+            for term, count in _terms(row).items():
+                indices.append(vocabulary.setdefault(term, len(vocabulary)))
+                data.append(count)
+            product_ids.append(row['pk'])
+            indptr.append(len(indices))
+
+        n_docs = len(product_ids)
+        matrix = sparse.csr_matrix(
+            (np.frombuffer(data, dtype=np.float32), np.frombuffer(indices, dtype=np.int32),
+             np.frombuffer(indptr, dtype=np.int64)),
+            shape=(n_docs, len(vocabulary)),
+        )
+        if n_docs == 0:
+            return cls(product_ids, matrix)
+
+        document_frequency = np.bincount(matrix.indices, minlength=matrix.shape[1])
+        keep = (document_frequency >= min_df) & (document_frequency <= max(max_df * n_docs, min_df))
+        matrix = matrix[:, np.flatnonzero(keep)].tocsr()
+        document_frequency = document_frequency[keep]
+
+        # Сублинейный tf и сглаженный idf, затем нормировка строк по L2
+        matrix.data = 1 + np.log(matrix.data)
+        idf = (np.log((1 + n_docs) / (1 + document_frequency)) + 1).astype(np.float32)
+        matrix = (matrix @ sparse.diags(idf)).tocsr()
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        norms[norms == 0] = 1
+        matrix = (sparse.diags((1 / norms).astype(np.float32)) @ matrix).tocsr()
+        matrix.data = matrix.data.astype(np.float32)
+        return cls(product_ids, matrix)
+
+    def __len__(self):
+        return len(self.product_ids)
+
+    def neighbours(self, rows, k, min_score=0.0, block_size=500):
+        """
+        Для строк rows матрицы (позиции, не id) выдает (id товара, [(id соседа, близость), ...])
+        с top-k соседями по убыванию близости. Считает блоками по block_size строк.
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            scores = (self.matrix[block] @ self._transposed).tocsr()
+            for i, row in enumerate(block):
+                low, high = scores.indptr[i], scores.indptr[i + 1]
+                columns = scores.indices[low:high]
+                values = scores.data[low:high]
+                mask = (columns != row) & (values > min_score)
+                columns, values = columns[mask], values[mask]
+                if len(values) > k:
+                    top = np.argpartition(-values, k)[:k]
+                    columns, values = columns[top], values[top]
+                order = np.argsort(-values, kind='stable')
+                yield int(self.product_ids[row]), [
+                    (int(self.product_ids[column]), float(value))
+                    for column, value in zip(columns[order], values[order])
+                ]
+
+    def similarity_to(self, rows, block_size=500):
+        """Для строк rows выдает (id товара, {id другого товара: близость}) - для обновления чужих списков"""
+        rows = np.asarray(rows, dtype=np.int64)
+        for start in range(0, len(rows), block_size):
+            block = rows[start:start + block_size]
+            scores = (self.matrix[block] @ self._transposed).tocsr()
+            for i, row in enumerate(block):
+                low, high = scores.indptr[i], scores.indptr[i + 1]
+                yield int(self.product_ids[row]), dict(zip(
+                    self.product_ids[scores.indices[low:high]].tolist(),
+                    scores.data[low:high].tolist(),
+                ))
+
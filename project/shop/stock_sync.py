@@ -0,0 +1,74 @@
+# shop/stock_sync.py
+"""
+Синхронизация цен и остатков с фидом поставщика.
+
+Фид присылает текущие price и quantity по каждому товару (slug), но
+меняется обычно малая часть строк. Поэтому пачка строк фида сравнивается
+с сохраненными значениями (один SELECT по slug на пачку), и в базу
+уходят только действительно изменившиеся товары - через
+bulk_update(['price', 'quantity']), без save(), сигналов и сдвига time_update.
+"""
+from django.db import transaction
+
+from .cache import bump_catalog_version
+
+SYNC_FIELDS = ['price', 'quantity']
+
+
+class StockRowError(ValueError):
+    pass
+
+
+def parse_stock_row(row):
+    """(slug, price, quantity) из строки фида"""
+    try:
+        slug = str(row['slug']).strip()
+        price, quantity = int(row['price']), int(row['quantity'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise StockRowError(f'нужны slug, price и quantity: {e}')
+    if not slug or price < 1 or quantity < 0:
+        raise StockRowError(f'недопустимые значения: slug={slug!r}, price={price}, quantity={quantity}')
+    return slug, price, quantity
+
+
+class StockSync:
+    """Накапливает строки фида и применяет изменения пачками"""
+
+    def __init__(self, batch_size=2000, dry_run=False):
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.stats = {'changed': 0, 'unchanged': 0, 'missing': 0}
+        self._batch = {}
+
+    def add(self, slug, price, quantity):
+        # Если товар встретился в фиде дважды, действует последняя строка
+        self._batch[slug] = (price, quantity)
+        if len(self._batch) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        from .models import Product
+
+        batch, self._batch = self._batch, {}
+        if not batch:
+            return
+        changed = []
+        for product in Product.objects.filter(slug__in=batch).only('pk', 'slug', *SYNC_FIELDS):
+            state = batch.pop(product.slug)
+            if (product.price, product.quantity) == state:
+                self.stats['unchanged'] += 1
+                continue
+            product.price, product.quantity = state
+            changed.append(product)
+        self.stats['missing'] += len(batch)
+        self.stats['changed'] += len(changed)
+        if changed and not self.dry_run:
+            with transaction.atomic():
+                type(changed[0]).objects.bulk_update(changed, SYNC_FIELDS)
+
+    def finish(self):
+        """Применяет остаток и сбрасывает кэши каталога, если что-то изменилось"""
+        self.flush()
+        if self.stats['changed'] and not self.dry_run:
+            bump_catalog_version()
+        return self.stats
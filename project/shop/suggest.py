@@ -0,0 +1,184 @@
+# shop/suggest.py
+"""
+Подсказки поиска (автодополнение) из индекса в памяти процесса.
+
+Для каждого названия активного товара и категории в отсортированный массив
+кладутся его «хвосты» с начала каждого слова: «красный чайник 5» дает ключи
+«красный чайник 5», «чайник 5» и «5». Запрос ищется двоичным поиском (bisect)
+как префикс ключей, поэтому подходят и первые буквы любого слова, и начало
+фразы из нескольких слов. Для префиксов, под которые попадает больше
+MAX_SCAN ключей, лучшие по весу варианты посчитаны заранее, поэтому запрос
+никогда не просматривает большой диапазон. Вес
+товара - число просмотров, категории - число активных товаров.
+
+Индекс строится при старте воркера (wsgi.py/asgi.py) и перестраивается в
+фоновом потоке, когда меняется поколение каталога, но не чаще
+SUGGEST_REFRESH_INTERVAL секунд; до конца перестройки отдается прежний.
+"""
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from heapq import nlargest
+
+from django.conf import settings
+from django.db import DatabaseError, connection
+
+from .cache import get_catalog_version
+
+logger = logging.getLogger(__name__)
+
+# Для префиксов, под которые попадает больше ключей, лучшие варианты хранятся готовыми
+MAX_SCAN = 256
+MAX_SUGGESTIONS = 10
+
+_SPACE_RE = re.compile(r'\s+')
+_WORD_START_RE = re.compile(r'(?:^|(?<=\s))\S')
+
+
+def normalize(text):
+    return _SPACE_RE.sub(' ', text.lower().replace('ё', 'е')).strip()
+
+
+class PrefixIndex:
+    """Неизменяемый индекс: items - список (вес, данные для ответа, текст)"""
+
+    def __init__(self, items):
+        self.payloads = [payload for _, payload, _ in items]
+        self.weights = [weight for weight, _, _ in items]
+        pairs = []
+        for position, (_, _, text) in enumerate(items):
+            text = normalize(text)
+            pairs.extend((text[match.start():], position) for match in _WORD_START_RE.finditer(text))
+        pairs.sort()
+        self.keys = [key for key, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+        self.top = {}
+        self._precompute(0, len(self.keys), 0)
+
+    def __len__(self):
+        return len(self.payloads)
+
+    def _best(self, positions, limit):
+        return nlargest(limit, positions, key=lambda position: (self.weights[position], -position))
+
+    def _precompute(self, start, end, depth):
+        """
+        keys[start:end] - ключи с общим префиксом длины depth. Если их больше
+        MAX_SCAN, лучшие варианты для префикса сохраняются, а диапазон делится
+        по следующему символу. Так любой запрос просматривает не больше MAX_SCAN ключей.
+        """
+        if end - start <= MAX_SCAN:
+            return
+        if depth:
+            self.top[self.keys[start][:depth]] = self._best(set(self.positions[start:end]), MAX_SUGGESTIONS)
+        i = start
+        while i < end:
+            if len(self.keys[i]) <= depth:
+                # Ключ, равный самому префиксу, стоит первым
+                i += 1
+                continue
+            child = self.keys[i][:depth + 1]
+            j = bisect_left(self.keys, child + '\uffff', i, end)
+            self._precompute(i, j, depth + 1)
+            i = j
+
+    def search(self, prefix, limit=MAX_SUGGESTIONS):
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if prefix in self.top:
+            positions = self.top[prefix][:limit]
+        else:
+            start = bisect_left(self.keys, prefix)
+            end = bisect_left(self.keys, prefix + '\uffff', start)
+            positions = self._best(set(self.positions[start:end]), limit)
+        return [self.payloads[position] for position in positions]
+
+
+def build_indexes():
+    """Индексы товаров и категорий одним проходом по каждой таблице"""
+    from .api import slug_url
+    from .models import Category, Product
+
+    products = PrefixIndex([
+        (views, {
+            'name': name,
+            'url': slug_url('shop:product_detail', 'product_slug', slug),
+            'price': price,
+        }, name)
+        for name, slug, price, views in Product.objects.filter(is_active=True).order_by()
+        .values_list('product_name', 'slug', 'price', 'views').iterator(chunk_size=5000)
+    ])
+    categories = PrefixIndex([
+        (count, {
+            'name': name,
+            'url': slug_url('shop:category_products', 'category_slug', slug),
+            'products_count': count,
+        }, name)
+        for name, slug, count in Category.objects.filter(active_products_count__gt=0)
+        .values_list('name', 'slug', 'active_products_count')
+    ])
+    return products, categories
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._indexes = None
+        self._version = None
+        self._built_at = 0
+        self._refreshing = False
+
+    def refresh(self):
+        """Строит индексы заново (синхронно)"""
+        version = get_catalog_version()
+        started = time.perf_counter()
+        indexes = build_indexes()
+        with self._lock:
+            self._indexes, self._version, self._built_at = indexes, version, time.monotonic()
+        logger.info('Индекс подсказок построен за %.2f с: товаров %d, категорий %d',
+                    time.perf_counter() - started, len(indexes[0]), len(indexes[1]))
+
+    def warm_up(self):
+        """Загрузка при старте воркера; база может быть еще не готова (миграции)"""
+        try:
+            self.refresh()
+        except DatabaseError:
+            logger.warning('Индекс подсказок не построен при старте, будет построен по первому запросу')
+
+    def _refresh_in_background(self):
+        try:
+            self.refresh()
+        except Exception:
+            logger.exception('Не удалось перестроить индекс подсказок')
+        finally:
+            with self._lock:
+                self._refreshing = False
+            connection.close()
+
+    def get_indexes(self):
+        if self._indexes is None:
+            self.refresh()
+            return self._indexes
+
+        interval = getattr(settings, 'SUGGEST_REFRESH_INTERVAL', 30)
+        if self._version != get_catalog_version() and time.monotonic() - self._built_at >= interval:
+            with self._lock:
+                start = not self._refreshing
+                self._refreshing = True
+            if start:
+                threading.Thread(target=self._refresh_in_background, daemon=True).start()
+        return self._indexes
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        products, categories = self.get_indexes()
+        return {
+            'products': products.search(query, limit),
+            'categories': categories.search(query, min(limit, 3)),
+        }
+
+
+suggest_index = SuggestIndex()
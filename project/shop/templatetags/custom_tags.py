@@ -1,5 +1,8 @@
 from django import template
 
+from shop.page_cache import normalize_query_string
+from shop.thumbnails import get_thumbnail_urls, srcset
+
 register = template.Library()
 
 
@@ -7,5 +10,40 @@ register = template.Library()
 def url_replace(context, **kwargs):
    d = context['request'].GET.copy()
    for k, v in kwargs.items():
-       d[k] = v
-   return d.urlencode()
\ No newline at end of file
+       # Пустое значение убирает параметр из строки запроса
+       if v is None or v == '':
+           d.pop(k, None)
+       else:
+           d[k] = v
+   # Та же нормализация, что и у ключей кэша страниц: ссылки ведут на уже закэшированные варианты
+   return normalize_query_string(d)
+
+
+@register.simple_tag
+def thumbnail_url(image, size, fmt='jpeg'):
+    """URL уменьшенной копии изображения; пока копии нет - URL исходника"""
+    urls = get_thumbnail_urls(image, size)
+    return urls[fmt][1] if urls else image.url
+
+
+@register.simple_tag
+def thumbnail_srcset(image, size, fmt='webp'):
+    """srcset с плотностями 1x/2x; пустая строка, пока копий нет"""
+    urls = get_thumbnail_urls(image, size)
+    return srcset(urls[fmt]) if urls else ''
+
+
+@register.inclusion_tag('shop/includes/responsive_image.html')
+def responsive_image(image, size, alt='', css_class='', style='', fallback='', lazy=True):
+    """<picture> с WebP и JPEG нужного размера; до готовности копий - исходное изображение"""
+    urls = get_thumbnail_urls(image, size)
+    return {
+        'src': urls['jpeg'][1] if urls else image.url,
+        'webp_srcset': srcset(urls['webp']) if urls else '',
+        'jpeg_srcset': srcset(urls['jpeg']) if urls else '',
+        'alt': alt,
+        'css_class': css_class,
+        'style': style,
+        'fallback': fallback,
+        'lazy': lazy,
+    }
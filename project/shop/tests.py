@@ -1,3 +1,32 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
 
-# Create your tests here.
+from .models import Category, Product
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class SearchPunctuationTests(TestCase):
+    """Запрос без слов (одни знаки) дает queryset.none(): страница должна быть пустой, а не 500"""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = get_user_model().objects.create_user(email='search@example.com', password='password-12345')
+        category = Category.objects.create(name='Телефоны', slug='phones')
+        Product.objects.create(
+            product_name='Телефон', slug='phone', description='Смартфон', price=100, quantity=1,
+            category=category, author=author,
+        )
+
+    def test_punctuation_only_queries(self):
+        for query in ['!!!', '-', '*', '"*"']:
+            with self.subTest(query=query):
+                response = self.client.get(reverse('shop:search'), {'q': query})
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.context['products']), 0)
+                self.assertEqual(response.context['facets']['total'], 0)
+
+    def test_word_query_still_matches(self):
+        response = self.client.get(reverse('shop:search'), {'q': 'телефон'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['products']), 1)
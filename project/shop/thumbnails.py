@@ -0,0 +1,171 @@
+# shop/thumbnails.py
+"""
+Уменьшенные копии изображений товаров (Pillow).
+
+Для каждого исходника и каждого размера из PRODUCT_THUMBNAIL_SIZES создаются
+WebP и JPEG в плотностях 1x и 2x. Имена детерминированы и выводятся из пути
+исходника (см. get_product_image_filename):
+
+    product_images/iphone-15.webp -> thumbnails/product_images/iphone-15-card@2x.webp
+
+Копии строятся в фоновом пуле потоков после сохранения товара или лениво при
+первом обращении из шаблона; пока их нет, шаблоны отдают исходное изображение.
+"""
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_DIR = 'thumbnails'
+
+# Имя размера: (ширина, высота, обрезать до точного размера)
+DEFAULT_THUMBNAIL_SIZES = {
+    'gallery': (160, 160, True),
+    'card': (400, 300, True),
+    'detail': (800, 800, False),
+}
+FORMATS = {'webp': 'WEBP', 'jpeg': 'JPEG'}
+DENSITIES = (1, 2)
+
+_lock = threading.Lock()
+_executor = None
+_in_progress = set()
+_ready = set()
+_failed = set()
+
+
+def get_sizes():
+    return getattr(settings, 'PRODUCT_THUMBNAIL_SIZES', DEFAULT_THUMBNAIL_SIZES)
+
+
+def thumbnail_name(image_name, size, fmt, density=1):
+    base, _ = os.path.splitext(image_name)
+    suffix = '' if density == 1 else f'@{density}x'
+    return f'{THUMBNAIL_DIR}/{base}-{size}{suffix}.{fmt}'
+
+
+def _variants(image_name):
+    for size in get_sizes():
+        for fmt in FORMATS:
+            for density in DENSITIES:
+                yield size, fmt, density, thumbnail_name(image_name, size, fmt, density)
+
+
+def _marker(image_name):
+    # Копии пишутся по порядку, поэтому наличие последней означает, что готовы все
+    *_, last = _variants(image_name)
+    return last[-1]
+
+
+def _render(image, width, height, crop, fmt):
+    if crop:
+        image = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        image = image.copy()
+        image.thumbnail((width, height), Image.LANCZOS)
+    buffer = BytesIO()
+    options = {'quality': getattr(settings, 'THUMBNAIL_QUALITY', 80)}
+    if fmt == 'jpeg':
+        options.update(optimize=True, progressive=True)
+    else:
+        options['method'] = 4
+    image.save(buffer, FORMATS[fmt], **options)
+    return ContentFile(buffer.getvalue())
+
+
+def generate_thumbnails(image_name, storage=None, force=False):
+    """Создает все копии исходника синхронно, возвращает число записанных файлов"""
+    storage = storage or default_storage
+    if not force and storage.exists(_marker(image_name)):
+        _ready.add(image_name)
+        return 0
+
+    sizes = get_sizes()
+    written = 0
+    with storage.open(image_name, 'rb') as source:
+        original = ImageOps.exif_transpose(Image.open(source))
+        original = original.convert('RGB')
+        for size, fmt, density, name in _variants(image_name):
+            if not force and storage.exists(name):
+                continue
+            width, height, crop = sizes[size]
+            if storage.exists(name):
+                storage.delete(name)
+            storage.save(name, _render(original, width * density, height * density, crop, fmt))
+            written += 1
+    _ready.add(image_name)
+    return written
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, 'THUMBNAIL_WORKERS', 2),
+                thread_name_prefix='thumbnails',
+            )
+        return _executor
+
+
+def _generate_in_background(image_name):
+    try:
+        generate_thumbnails(image_name)
+    except Exception as e:
+        # Битый или отсутствующий исходник: не пытаемся снова до перезапуска процесса
+        _failed.add(image_name)
+        logger.warning('Не удалось создать копии изображения %s: %s', image_name, e)
+    finally:
+        with _lock:
+            _in_progress.discard(image_name)
+
+
+def schedule_thumbnails(image_name):
+    """Ставит создание копий в фоновый пул; повторные вызовы для того же файла игнорируются"""
+    if not image_name or image_name in _ready or image_name in _failed:
+        return
+    with _lock:
+        if image_name in _in_progress:
+            return
+        _in_progress.add(image_name)
+    _get_executor().submit(_generate_in_background, image_name)
+
+
+def thumbnails_ready(image_name):
+    if image_name in _ready:
+        return True
+    if image_name in _failed or image_name in _in_progress:
+        return False
+    if default_storage.exists(_marker(image_name)):
+        _ready.add(image_name)
+        return True
+    return False
+
+
+def get_thumbnail_urls(image, size):
+    """
+    {'webp': {1: url, 2: url}, 'jpeg': {...}} для размера size или None,
+    если копий еще нет (тогда их создание ставится в очередь).
+    """
+    image_name = getattr(image, 'name', image)
+    if not image_name or size not in get_sizes():
+        return None
+    if not thumbnails_ready(image_name):
+        schedule_thumbnails(image_name)
+        return None
+    return {
+        fmt: {density: default_storage.url(thumbnail_name(image_name, size, fmt, density)) for density in DENSITIES}
+        for fmt in FORMATS
+    }
+
+
+def srcset(urls):
+    return ', '.join(f'{url} {density}x' for density, url in sorted(urls.items()))
@@ -0,0 +1,99 @@
+# shop/trending.py
+"""
+Популярность товара с экспоненциальным затуханием.
+
+Product.trending = сумма весов просмотров и покупок, где вклад события
+уменьшается вдвое каждые TRENDING_HALF_LIFE_HOURS часов. Значение хранится
+в колонке с индексом (is_active, trending) и обновляется периодической
+задачей update_trending, а не считается при чтении:
+
+1. накопленные значения умножаются на коэффициент затухания за прошедшее время;
+2. новые просмотры берутся как разница views - trending_views (одним UPDATE);
+3. новые заказы после контрольной точки добавляются с весом по времени заказа.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Max, Value, When
+from django.utils import timezone
+
+CHECKPOINT_NAME = 'trending'
+
+# Меньшие значения обнуляются, чтобы затухание не трогало давно забытые товары
+TRENDING_EPSILON = 0.01
+UPDATE_BATCH_SIZE = 500
+
+
+def get_half_life():
+    return getattr(settings, 'TRENDING_HALF_LIFE_HOURS', 72) * 3600
+
+
+def decay_factor(seconds):
+    return 0.5 ** (max(seconds, 0) / get_half_life())
+
+
+def update_trending(now=None):
+    """Обновляет trending по событиям после прошлого запуска, возвращает статистику"""
+    from accounts.models import Order, OrderItem
+    from .models import JobCheckpoint, Product
+
+    now = now or timezone.now()
+    view_weight = getattr(settings, 'TRENDING_VIEW_WEIGHT', 1.0)
+    order_weight = getattr(settings, 'TRENDING_ORDER_WEIGHT', 20.0)
+
+    with transaction.atomic():
+        checkpoint, created = JobCheckpoint.objects.select_for_update().get_or_create(name=CHECKPOINT_NAME)
+        stats = {'decayed': 0, 'viewed': 0, 'ordered': 0}
+        # Заказы, созданные во время обновления, достанутся следующему запуску
+        max_order_id = Order.objects.aggregate(max_id=Max('pk'))['max_id'] or 0
+
+        if created or checkpoint.last_run is None:
+            # Первый запуск: накопленные за все время просмотры не считаем «свежими»,
+            # а заказы учитываем за последние несколько периодов полураспада
+            Product.objects.filter(trending_views__lt=F('views')).update(trending_views=F('views'))
+            orders = Order.objects.filter(created_at__gte=now - timedelta(seconds=get_half_life() * 5))
+        else:
+            factor = decay_factor((now - checkpoint.last_run).total_seconds())
+            stats['decayed'] = Product.objects.filter(trending__gt=0).update(
+                trending=Case(
+                    When(trending__lt=TRENDING_EPSILON / factor, then=Value(0.0)),
+                    default=F('trending') * factor,
+                    output_field=FloatField(),
+                )
+            )
+            # Просмотры пришли между запусками: считаем их текущими
+            stats['viewed'] = Product.objects.filter(views__gt=F('trending_views')).update(
+                trending=F('trending') + (F('views') - F('trending_views')) * view_weight,
+                trending_views=F('views'),
+            )
+            orders = Order.objects.filter(pk__gt=checkpoint.last_id)
+
+        orders = orders.filter(pk__lte=max_order_id).exclude(status='cancelled')
+        increments = defaultdict(float)
+        items = OrderItem.objects.filter(order__in=orders).values_list(
+            'order__created_at', 'product_id', 'quantity'
+        )
+        for created_at, product_id, quantity in items:
+            age = (now - created_at).total_seconds()
+            increments[product_id] += quantity * order_weight * decay_factor(age)
+        stats['ordered'] = _add_increments(Product, increments)
+
+        checkpoint.last_id = max(checkpoint.last_id, max_order_id)
+        checkpoint.last_run = now
+        checkpoint.save(update_fields=['last_id', 'last_run'])
+    return stats
+
+
+def _add_increments(model, increments):
+    """Прибавляет к trending разные значения для разных товаров пачками UPDATE ... CASE"""
+    product_ids = list(increments)
+    for start in range(0, len(product_ids), UPDATE_BATCH_SIZE):
+        batch = product_ids[start:start + UPDATE_BATCH_SIZE]
+        model.objects.filter(pk__in=batch).update(trending=F('trending') + Case(
+            *[When(pk=pk, then=Value(increments[pk])) for pk in batch],
+            default=Value(0.0),
+            output_field=FloatField(),
+        ))
+    return len(product_ids)
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, async_views, views
 
 app_name = 'shop'
 
@@ -9,8 +9,24 @@ urlpatterns = [
     path('product/<slug:product_slug>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('category/<slug:category_slug>/', views.CategoryProductsView.as_view(), name='category_products'),
     path('search/', views.search_products, name='search'),
+    path('search/suggest/', views.search_suggest, name='search_suggest'),
     path('cart/add/<int:product_id>/', views.add_to_cart, name='add_to_cart'),
     path('cart/remove/<int:cart_item_id>/', views.remove_from_cart, name='remove_from_cart'),
     path('cart/update/<int:cart_item_id>/', views.update_cart_quantity, name='update_cart_quantity'),
+    path('cart/batch/', views.update_cart_batch, name='update_cart_batch'),
     path('cart/', views.cart_view, name='cart'),
+    path('checkout/', views.checkout_view, name='checkout'),
+    # Асинхронные JSON-версии (выигрыш дают под ASGI, см. project/asgi.py)
+    path('async/products/', async_views.home_products, name='async_home'),
+    path('async/category/<slug:category_slug>/', async_views.category_products, name='async_category_products'),
+    path('async/search/', async_views.search_products, name='async_search'),
+    path('async/product/<slug:product_slug>/', async_views.product_detail, name='async_product_detail'),
+    path('async/cart/add/<int:product_id>/', async_views.add_to_cart, name='async_add_to_cart'),
+    path('async/cart/update/<int:cart_item_id>/', async_views.update_cart_quantity,
+         name='async_update_cart_quantity'),
+    path('async/cart/remove/<int:cart_item_id>/', async_views.remove_from_cart, name='async_remove_from_cart'),
+    # JSON API каталога только для чтения
+    path('api/v1/products/', api.product_list, name='api_products'),
+    path('api/v1/products/<slug:product_slug>/', api.product_detail, name='api_product_detail'),
+    path('api/v1/categories/', api.category_list, name='api_categories'),
 ]
\ No newline at end of file
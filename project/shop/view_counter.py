@@ -0,0 +1,110 @@
+# shop/view_counter.py
+"""
+Отложенная запись просмотров товаров (write-behind).
+
+Вместо UPDATE на каждый просмотр страницы товара приращения копятся
+в памяти процесса и периодически сбрасываются в базу пачкой запросов
+вида ``UPDATE ... SET views = views + n``.
+
+Счетчик views согласован в конечном счете: буфер сбрасывает фоновый поток
+процесса каждые PRODUCT_VIEWS_FLUSH_INTERVAL секунд (даже если просмотров
+больше нет) и atexit при штатном завершении. Если процесс убит (SIGKILL,
+OOM), теряются просмотры не более чем за один интервал.
+"""
+import atexit
+import logging
+import os
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+
+class ViewCounterBuffer:
+    def __init__(self, flush_interval=None):
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+        self._flusher_pid = None
+
+    @property
+    def flush_interval(self):
+        if self._flush_interval is not None:
+            return self._flush_interval
+        return getattr(settings, 'PRODUCT_VIEWS_FLUSH_INTERVAL', 60)
+
+    def record(self, product_id, count=1):
+        """Учитывает просмотр и сбрасывает буфер, если интервал истек"""
+        with self._lock:
+            self._pending[product_id] += count
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+            # Поток запускается в каждом процессе (воркеры создаются через fork)
+            start_flusher = self._flusher_pid != os.getpid()
+            if start_flusher:
+                self._flusher_pid = os.getpid()
+        if start_flusher:
+            threading.Thread(target=self._flush_periodically, name='view-counter-flush', daemon=True).start()
+        if due:
+            self.flush()
+
+    def _flush_periodically(self):
+        """Сбрасывает буфер раз в интервал, пока жив процесс"""
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Не удалось записать просмотры товаров')
+            finally:
+                # Поток долгоживущий: не держим подключение между сбросами
+                connection.close()
+
+    def pending(self, product_id):
+        with self._lock:
+            return self._pending.get(product_id, 0)
+
+    def flush(self):
+        """Записывает накопленные просмотры в базу, возвращает число товаров"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+
+        if not pending:
+            return 0
+
+        # Группируем товары по величине приращения: один UPDATE на каждое n
+        by_increment = defaultdict(list)
+        for product_id, count in pending.items():
+            by_increment[count].append(product_id)
+
+        from .models import Product
+
+        try:
+            with transaction.atomic():
+                for count, product_ids in by_increment.items():
+                    Product.objects.filter(pk__in=product_ids).update(views=F('views') + count)
+        except Exception:
+            # Возвращаем приращения в буфер, чтобы не потерять их
+            with self._lock:
+                self._pending.update(pending)
+            logger.exception('Не удалось записать просмотры товаров')
+            return 0
+
+        return len(pending)
+
+
+view_counter = ViewCounterBuffer()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        logger.exception('Не удалось записать просмотры при завершении процесса')
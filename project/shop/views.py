@@ -1,32 +1,47 @@
+import json
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Count, Q
-from django.views.decorators.http import require_POST
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from django.views.decorators.http import require_GET, require_POST
 from django.views.generic import ListView, DetailView
 from django.views.generic.base import ContextMixin
 from .models import Product, Category, Cart
-from .forms import ProductFilterForm
+from .filters import ProductFilterSet
+from .cache import get_catalog_modified, get_catalog_version, get_sidebar_categories
+from .conditional import ConditionalGetMixin, conditional_listing, make_etag
+from . import cart
+from .cart import SessionCart, get_cart_summary
+from .checkout import checkout, CheckoutError, EmptyCartError, OutOfStockError
+from .search import search_queryset, highlight_snippet
+from .pagination import KeysetPaginationMixin, paginate_products
+from .page_cache import AnonymousPageCacheMixin
+from .view_counter import view_counter
+from .db_retry import LockRetriesExceeded, retry_on_lock
+from .suggest import MAX_SUGGESTIONS, suggest_index
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+# Запрос длиннее самого длинного названия ничего не найдет: обрезаем до нормализации и ответа
+SUGGEST_QUERY_MAX_LENGTH = max(
+    Product._meta.get_field('product_name').max_length, Category._meta.get_field('name').max_length
+)
+
 
 class CategoryContextMixin(ContextMixin):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['all_categories'] = Category.objects.annotate(
-            product_count=Count('products')
-        ).filter(products__is_active=True)
-        context['top_categories'] = Category.objects.annotate(
-            product_count=Count('products')
-        ).filter(products__is_active=True).order_by('-product_count')[:5]
+        # Категории берутся из кэша, счетчики товаров денормализованы в Category
+        context.update(get_sidebar_categories())
         return context
 
 
-class HomeView(CategoryContextMixin, ListView):
+class HomeView(ConditionalGetMixin, AnonymousPageCacheMixin, CategoryContextMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'shop/home.html'
     context_object_name = 'products'
@@ -34,60 +49,64 @@ class HomeView(CategoryContextMixin, ListView):
 
     def get_queryset(self):
         queryset = Product.objects.filter(is_active=True).select_related('category', 'author')
-
-        # Фильтрация по наличию
-        in_stock = self.request.GET.get('in_stock')
-        if in_stock:
-            queryset = queryset.filter(quantity__gt=0)
-
-        # Фильтрация по скидкам
-        with_discount = self.request.GET.get('with_discount')
-        if with_discount:
-            queryset = queryset.filter(discount_percent__gt=0)
-
-        # Фильтрация по цене
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-
-        # Сортировка
-        sort_by = self.request.GET.get('sort_by', '-time_create')
-        if sort_by in ['price', '-price', '-time_create', '-views']:
-            queryset = queryset.order_by(sort_by)
-
-        return queryset
+        self.filterset = ProductFilterSet(self.request.GET, queryset=queryset)
+        self.sort_by = self.filterset.sort_by
+        return self.filterset.qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['filter_form'] = ProductFilterForm(self.request.GET or None)
+        context['filter_form'] = self.filterset.form
+        context['facets'] = self.filterset.get_facets()
         return context
 
 
-class ProductDetailView(CategoryContextMixin, DetailView):
+class ProductDetailView(ConditionalGetMixin, AnonymousPageCacheMixin, CategoryContextMixin, DetailView):
     model = Product
     template_name = 'shop/product_detail.html'
     context_object_name = 'product'
     slug_field = 'slug'
     slug_url_kwarg = 'product_slug'
 
+    def get_validators(self):
+        product = Product.objects.filter(slug=self.kwargs[self.slug_url_kwarg]).values_list(
+            'pk', 'time_update', 'quantity', 'reserved_quantity'
+        ).first()
+        if product is None:
+            return None
+        self.product_id, time_update, quantity, reserved = product
+        # Поколение каталога учитывает связанные товары, меню и цены из sync_stock (time_update не меняют);
+        # остаток и резервы меняются через update() без сигналов, поэтому входят в ETag сами
+        etag = make_etag(self.request, 'product', self.product_id, time_update, quantity, reserved,
+                         get_catalog_version())
+        return etag, max(int(time_update.timestamp()), get_catalog_modified())
+
+    def not_modified(self, request):
+        # Ответ 304 тоже считается просмотром
+        view_counter.record(self.product_id)
+
     def get_object(self, queryset=None):
         obj = super().get_object(queryset)
         obj.increment_views()
         return obj
 
+    def get_page_cache_entry(self, response):
+        entry = super().get_page_cache_entry(response)
+        entry['product_id'] = self.object.pk
+        return entry
+
+    def page_cache_hit(self, request, entry):
+        # Страница из кэша тоже считается просмотром
+        view_counter.record(entry['product_id'])
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['related_products'] = Product.objects.filter(
-            category=self.object.category,
-            is_active=True
-        ).exclude(id=self.object.id)[:4]
+        context['related_products'] = self.object.get_related_products(
+            getattr(settings, 'RELATED_PRODUCTS_LIMIT', 4)
+        )
         return context
 
 
-class CategoryProductsView(CategoryContextMixin, ListView):
+class CategoryProductsView(ConditionalGetMixin, AnonymousPageCacheMixin, CategoryContextMixin, KeysetPaginationMixin, ListView):
     model = Product
     template_name = 'shop/category_products.html'
     context_object_name = 'products'
@@ -99,32 +118,19 @@ class CategoryProductsView(CategoryContextMixin, ListView):
             category=self.category,
             is_active=True
         ).select_related('category', 'author')
-
-        # Добавляем фильтрацию как в HomeView
-        in_stock = self.request.GET.get('in_stock')
-        if in_stock:
-            queryset = queryset.filter(quantity__gt=0)
-
-        min_price = self.request.GET.get('min_price')
-        max_price = self.request.GET.get('max_price')
-        if min_price:
-            queryset = queryset.filter(price__gte=min_price)
-        if max_price:
-            queryset = queryset.filter(price__lte=max_price)
-
-        sort_by = self.request.GET.get('sort_by', '-time_create')
-        if sort_by in ['price', '-price', '-time_create', '-views']:
-            queryset = queryset.order_by(sort_by)
-
-        return queryset
+        self.filterset = ProductFilterSet(self.request.GET, queryset=queryset)
+        self.sort_by = self.filterset.sort_by
+        return self.filterset.qs
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['category'] = self.category
-        context['filter_form'] = ProductFilterForm(self.request.GET or None)
+        context['filter_form'] = self.filterset.form
+        context['facets'] = self.filterset.get_facets()
         return context
 
 
+@conditional_listing
 def search_products(request):
     query = request.GET.get('q', '')
     category_slug = request.GET.get('category')
@@ -138,55 +144,51 @@ def search_products(request):
         current_category = get_object_or_404(Category, slug=category_slug)
         products = products.filter(category=current_category)
 
-    # Поисковый запрос
+    # Поисковый запрос (полнотекстовый индекс, см. shop.search)
     if query:
-        products = products.filter(
-            Q(product_name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        products = search_queryset(products, query)
 
-    # Дополнительная фильтрация
-    in_stock = request.GET.get('in_stock')
-    if in_stock:
-        products = products.filter(quantity__gt=0)
+    # Фильтры, сортировка (по умолчанию по релевантности) и фасеты
+    default_sort = 'search_rank' if query and 'search_rank' in products.query.extra_select else '-time_create'
+    filterset = ProductFilterSet(request.GET, queryset=products, default_sort=default_sort)
 
-    min_price = request.GET.get('min_price')
-    max_price = request.GET.get('max_price')
-    if min_price:
-        products = products.filter(price__gte=min_price)
-    if max_price:
-        products = products.filter(price__lte=max_price)
+    paginator, products = paginate_products(request, filterset.qs, 12, filterset.sort_by)
 
-    sort_by = request.GET.get('sort_by', '-time_create')
-    if sort_by in ['price', '-price', '-time_create', '-views']:
-        products = products.order_by(sort_by)
-
-    paginator = Paginator(products, 12)
-    page = request.GET.get('page')
-
-    try:
-        products = paginator.page(page)
-    except PageNotAnInteger:
-        products = paginator.page(1)
-    except EmptyPage:
-        products = paginator.page(paginator.num_pages)
+    if query:
+        for product in products:
+            product.search_snippet = highlight_snippet(product.description, query)
 
     context = {
         'products': products,
         'query': query,
         'current_category': current_category,  # Передаем объект категории вместо slug
         'current_category_slug': category_slug,
-        'filter_form': ProductFilterForm(request.GET or None),
+        'filter_form': filterset.form,
+        'facets': filterset.get_facets(),
     }
+    context.update(get_sidebar_categories())
 
     return render(request, 'shop/search_results.html', context)
 
 
+@require_GET
+def search_suggest(request):
+    """Подсказки для строки поиска: ?q=начало запроса, ?limit=число товаров"""
+    query = request.GET.get('q', '')[:SUGGEST_QUERY_MAX_LENGTH]
+    try:
+        limit = min(max(int(request.GET.get('limit', 8)), 1), MAX_SUGGESTIONS)
+    except ValueError:
+        limit = 8
+    response = JsonResponse({'query': query, **suggest_index.suggest(query, limit)},
+                            json_dumps_params={'ensure_ascii': False})
+    # Подсказки одинаковы для всех: браузер может переиспользовать их при наборе и стирании
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'SUGGEST_CACHE_MAX_AGE', 60))
+    return response
+
+
 @require_POST
-@login_required
 def add_to_cart(request, product_id):
-    """Универсальное добавление товара в корзину"""
+    """Универсальное добавление товара в корзину (гостям - в корзину в сессии)"""
     product = get_object_or_404(Product, id=product_id)
 
     # Получаем количество из POST запроса
@@ -196,96 +198,162 @@ def add_to_cart(request, product_id):
         quantity = 1
 
     # Проверяем доступное количество
-    if quantity > product.quantity:
-        quantity = product.quantity
-        message = f'Добавлено максимальное доступное количество: {product.quantity}'
+    if quantity > product.available:
+        quantity = product.available
+        message = f'Добавлено максимальное доступное количество: {product.available}'
     else:
         message = f'Товар добавлен в корзину'
 
-    # Ищем товар в корзине пользователя
-    cart_item, created = Cart.objects.get_or_create(
-        author=request.user,
-        product=product,
-        defaults={'quantity': quantity}
-    )
-
-    if not created:
-        # Если товар уже есть в корзине, увеличиваем количество
-        new_quantity = cart_item.quantity + quantity
-        if new_quantity > product.quantity:
-            new_quantity = product.quantity
-            message = f'Установлено максимальное доступное количество: {product.quantity}'
-
-        cart_item.quantity = new_quantity
-        cart_item.save()
-
-    # Получаем актуальное количество товаров в корзине
-    cart_count = Cart.objects.filter(author=request.user).count()
+    if request.user.is_authenticated:
+        # Атомарное добавление: количество ограничивается остатком прямо в UPDATE, затем резервом
+        item_quantity = cart.add_to_cart(request.user, product, quantity)
+        if item_quantity < quantity or quantity < product.available <= item_quantity:
+            message = f'Установлено максимальное доступное количество: {item_quantity}'
+        # Резерв изменил свободный остаток: в ответ идет значение после него
+        product.refresh_from_db(fields=['quantity', 'reserved_quantity'])
+        # Получаем актуальное количество товаров в корзине
+        cart_count = get_cart_summary(request.user)['count']
+    else:
+        session_cart = SessionCart(request)
+        if session_cart.get_quantity(product.pk) + quantity > product.available:
+            message = f'Установлено максимальное доступное количество: {product.available}'
+        item_quantity = session_cart.add(product, quantity)
+        cart_count = len(session_cart)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
             'message': message,
             'cart_count': cart_count,
-            'item_quantity': cart_item.quantity,
-            'product_quantity': product.quantity
+            'item_quantity': item_quantity,
+            'product_quantity': product.available
         })
     else:
         messages.success(request, message)
         return redirect('shop:home')
 
 
-@login_required
 def remove_from_cart(request, cart_item_id):
-    """Удаление товара из корзины"""
-    cart_item = get_object_or_404(Cart, id=cart_item_id, author=request.user)
-    product_name = cart_item.product.product_name
-    cart_item.delete()
+    """Удаление товара из корзины (для гостя cart_item_id - это id товара)"""
+    if request.user.is_authenticated:
+        cart_item = get_object_or_404(Cart.objects.select_related('product'), id=cart_item_id, author=request.user)
+        product_name = cart_item.product.product_name
+        cart_item.delete()
+        cart_count = get_cart_summary(request.user)['count']
+        redirect_url = reverse('accounts:profile') + '?tab=cart'
+    else:
+        session_cart = SessionCart(request)
+        if cart_item_id not in session_cart:
+            raise Http404
+        product_name = get_object_or_404(Product, id=cart_item_id).product_name
+        session_cart.remove(cart_item_id)
+        cart_count = len(session_cart)
+        redirect_url = reverse('shop:cart')
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({
             'success': True,
             'message': 'Товар удален из корзины',
-            'cart_count': Cart.objects.filter(author=request.user).count()
+            'cart_count': cart_count
         })
     else:
         messages.success(request, f'Товар "{product_name}" удален из корзины')
-        return redirect('accounts:profile') + '?tab=cart'
+        return redirect(redirect_url)
 
 
-@login_required
 def update_cart_quantity(request, cart_item_id):
-    """Обновление количества товара в корзине"""
+    """Обновление количества товара в корзине (для гостя cart_item_id - это id товара)"""
     if request.method == 'POST':
-        cart_item = get_object_or_404(Cart, id=cart_item_id, author=request.user)
         quantity = int(request.POST.get('quantity', 1))
 
-        if quantity > 0:
-            cart_item.quantity = quantity
-            cart_item.save()
+        if not request.user.is_authenticated:
+            session_cart = SessionCart(request)
+            if cart_item_id not in session_cart:
+                raise Http404
+            product = get_object_or_404(Product, id=cart_item_id)
+            new_quantity = session_cart.set(product, quantity)
+            summary = session_cart.summary()
+            if new_quantity > 0:
+                return JsonResponse({
+                    'success': True,
+                    'new_quantity': new_quantity,
+                    'item_total': product.price * new_quantity,
+                    'cart_total': summary['total']
+                })
+            return JsonResponse({
+                'success': True,
+                'removed': True,
+                'cart_count': summary['count'],
+                'cart_total': summary['total']
+            })
 
+        # Количество ограничивается остатком в том же UPDATE; 0 - удаление позиции
+        new_quantity = cart.set_cart_line_quantity(request.user, cart_item_id, quantity)
+        if new_quantity is None:
+            raise Http404
+
+        if new_quantity > 0:
+            price = Cart.objects.filter(pk=cart_item_id).values_list('product__price', flat=True).first()
             return JsonResponse({
                 'success': True,
-                'new_quantity': cart_item.quantity,
-                'item_total': cart_item.get_total_price(),
+                'new_quantity': new_quantity,
+                'item_total': price * new_quantity,
                 'cart_total': get_cart_total(request.user)
             })
         else:
-            # Если количество 0 - удаляем товар
-            cart_item.delete()
             return JsonResponse({
                 'success': True,
                 'removed': True,
-                'cart_count': Cart.objects.filter(author=request.user).count(),
+                'cart_count': get_cart_summary(request.user)['count'],
                 'cart_total': get_cart_total(request.user)
             })
 
 
-@login_required
+@require_POST
+def update_cart_batch(request):
+    """
+    Пакетное изменение корзины одним запросом и одной транзакцией.
+    Тело: {"items": [{"product_id": 1, "quantity": 3}, ...]}, quantity - итоговое количество (0 - удалить).
+    """
+    try:
+        payload = json.loads(request.body)
+        changes = {int(item['product_id']): int(item['quantity']) for item in payload['items']}
+    except (ValueError, TypeError, KeyError):
+        return JsonResponse({'success': False, 'message': 'Некорректный формат запроса'}, status=400)
+
+    if request.user.is_authenticated:
+        try:
+            # Транзакция пачки повторяется целиком, если запись держит другой запрос
+            quantities = retry_on_lock(cart.apply_cart_batch, request.user, changes)
+        except LockRetriesExceeded:
+            response = JsonResponse({
+                'success': False,
+                'message': 'Корзина сейчас изменяется другим запросом, повторите попытку',
+            }, status=503)
+            response['Retry-After'] = '1'
+            return response
+        summary = get_cart_summary(request.user)
+    else:
+        session_cart = SessionCart(request)
+        quantities = session_cart.apply_batch(changes)
+        summary = session_cart.summary()
+
+    return JsonResponse({
+        'success': True,
+        'items': [{'product_id': product_id, 'quantity': quantity} for product_id, quantity in quantities.items()],
+        'cart_count': summary['count'],
+        'cart_total': summary['total']
+    })
+
+
 def cart_view(request):
     """Страница корзины"""
-    cart_items = Cart.objects.filter(author=request.user).select_related('product')
-    total = sum(item.get_total_price() for item in cart_items)
+    if request.user.is_authenticated:
+        cart_items = Cart.objects.filter(author=request.user).select_related('product__category')
+        total = get_cart_summary(request.user)['total']
+    else:
+        cart_items = SessionCart(request).items()
+        total = sum(item.get_total_price() for item in cart_items)
 
     return render(request, 'shop/cart.html', {
         'cart_items': cart_items,
@@ -293,8 +361,38 @@ def cart_view(request):
     })
 
 
+@login_required
+@require_POST
+def checkout_view(request):
+    """Оформление заказа из корзины"""
+    shipping_address = request.POST.get('shipping_address', '').strip()
+    if not shipping_address:
+        profile = getattr(request.user, 'profile', None)
+        shipping_address = profile.address if profile else ''
+    if not shipping_address:
+        messages.error(request, 'Укажите адрес доставки в профиле')
+        return redirect(reverse('accounts:profile') + '?tab=shipping')
+
+    try:
+        order = retry_on_lock(checkout, request.user, shipping_address)
+    except LockRetriesExceeded:
+        messages.error(request, 'Не удалось оформить заказ из-за высокой нагрузки, повторите попытку')
+        return redirect('shop:cart')
+    except EmptyCartError:
+        messages.error(request, 'Ваша корзина пуста')
+        return redirect('shop:cart')
+    except OutOfStockError as e:
+        messages.error(request, f'Недостаточно товара "{e.product_name}" на складе')
+        return redirect('shop:cart')
+    except CheckoutError:
+        messages.error(request, 'Не удалось оформить заказ')
+        return redirect('shop:cart')
+
+    messages.success(request, f'Заказ #{order.pk} оформлен')
+    return redirect(reverse('accounts:profile') + '?tab=orders')
+
+
 # Вспомогательная функция
 def get_cart_total(user):
     """Получение общей суммы корзины"""
-    cart_items = Cart.objects.filter(author=user)
-    return sum(item.get_total_price() for item in cart_items)
\ No newline at end of file
+    return get_cart_summary(user)['total']
\ No newline at end of file